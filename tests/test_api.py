@@ -78,6 +78,20 @@ def test_posts():
         assert len(data) == 3
         data = get_json(c, '/posts?start=1&count=1')
         assert len(data) == 1
+        resp = c.get('/api/posts?start=1&count=1')
+        assert resp.headers['X-Total-Count'] == '3'
+        assert c.get('/api/posts/2017/?count=1').headers['X-Total-Count'] == '3'
+
+        resp = c.get('/api/posts?count=2')
+        assert len(json.loads(resp.data.decode('utf-8'))) == 2
+        resp = c.get('/api/posts?count=2&cursor=' + resp.headers['X-Next-Cursor'])
+        data = json.loads(resp.data.decode('utf-8'))
+        assert len(data) == 1 and data[0]['title'] == get_json(c, '/posts')[2]['title']
+        assert 'X-Next-Cursor' not in resp.headers
+        assert 'X-Next-Cursor' not in c.get('/api/posts?count=3').headers
+        for cursor in ('abc', 'WyJhIiwgImIiXQ', 'WzEsIDJd'):  # not base64, ["a", "b"], [1, 2]
+            data = get_json(c, '/posts?cursor=' + cursor)
+            assert data['code'] == Error.INVALID_ARGUMENTS.code
         data = get_json(c, '/posts?created=2016-03-02,2016-03-03&updated=')
         assert data['code'] == Error.INVALID_ARGUMENTS.code
         data = get_json(c,
@@ -149,3 +163,17 @@ def test_search():
         assert len(data) == 5
         data = get_json(c, '/search/?q=Lorem ipsum&start=1&count=2')
         assert len(data) == 2
+
+        # page through the result with cursors
+        all_keys = [item['unique_key'] for item in get_json(c, '/search/?q=Lorem ipsum')]
+        keys = []
+        resp = c.get('/api/search/?q=Lorem ipsum&count=2')
+        while True:
+            assert resp.headers['X-Total-Count'] == '5'
+            keys.extend(item['unique_key'] for item in json.loads(resp.data.decode('utf-8')))
+            if 'X-Next-Cursor' not in resp.headers:
+                break
+            resp = c.get('/api/search/?q=Lorem ipsum&count=2&cursor=' + resp.headers['X-Next-Cursor'])
+        assert keys == all_keys
+        data = get_json(c, '/search/?q=Lorem ipsum&cursor=abc')
+        assert data['code'] == Error.INVALID_ARGUMENTS.code
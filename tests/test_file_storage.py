@@ -2,12 +2,12 @@ import os
 from datetime import datetime, date
 from collections import Iterable
 
-from flask import current_app
+from flask import current_app, g
 
 from veripress import app
 from veripress.model import storage
 from veripress.model.models import Page, Post, Widget
-from veripress.model.storages import FileStorage
+from veripress.model.storages import FileStorage, get_content_generation
 from veripress.helpers import Pair
 
 
@@ -189,3 +189,56 @@ def test_get_tags_categories():
         category_items = storage.get_categories()
         assert len(category_items) == 1
         assert ('Default', Pair(2, 1)) in category_items
+
+
+def test_get_generation():
+    with app.app_context():
+        generation = storage.get_generation()
+        assert generation and generation == storage.get_generation()
+        assert get_content_generation() == generation
+        assert g._content_generation == generation
+
+        file_path = os.path.join(current_app.instance_path, 'widgets', 'new-widget.md')
+        with open(file_path, 'w') as f:
+            f.write('---\nposition: footer\n---\n\nNew widget.')
+        try:
+            assert storage.get_generation() != generation
+        finally:
+            os.remove(file_path)
+        assert storage.get_generation() == generation
+
+    with app.test_request_context('/'):
+        get_content_generation()
+    with app.app_context():
+        assert not hasattr(g, '_content_generation')
+
+
+def test_cache_identity(monkeypatch):
+    from flask_caching.backends import SimpleCache
+    from veripress import cache
+
+    with app.app_context():
+        s1 = storage._get_current_object()
+    with app.app_context():
+        s2 = storage._get_current_object()
+    assert s1 is not s2
+    assert repr(s1) == repr(s2) == '<FileStorage {!r}>'.format(app.instance_path)
+
+    with app.app_context():
+        posts_index = FileStorage.get_file_index('posts')
+    calls = []
+    origin_get = posts_index.get
+    monkeypatch.setattr(posts_index, 'get', lambda *args: calls.append(args) or origin_get(*args))
+    monkeypatch.setitem(app.extensions['cache'], cache, SimpleCache())
+
+    for _ in range(2):
+        with app.app_context():
+            post = storage.get_post('2017/03/09/my-post/')
+            assert post.title == 'My Post'
+    assert len(calls) == 1  # the second call hits the cache
+
+    with app.test_client() as c:
+        for _ in range(2):
+            resp = c.get('/api/posts/2017/03/09/my-post/')
+            assert resp.status_code == 200
+    assert len(calls) == 1
@@ -91,3 +91,16 @@ def test_traverse_dir():
 
     paths = list(traverse_directory('/non-exists'))
     assert len(paths) == 0
+
+
+def test_scandir():
+    from veripress.helpers import _DirEntry
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    entries = {e.name: e for e in scandir(tests_dir)}
+    assert 'test_helpers.py' in entries
+    assert not entries['test_helpers.py'].is_dir()
+    assert entries['test_helpers.py'].stat().st_size > 0
+
+    entry = _DirEntry(*os.path.split(tests_dir))
+    assert entry.path == tests_dir and entry.is_dir()
+    assert entry.stat().st_mtime == os.stat(tests_dir).st_mtime
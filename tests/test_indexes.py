@@ -0,0 +1,333 @@
+import os
+import pickle
+import tempfile
+from datetime import date
+
+import yaml
+from pytest import mark, raises
+
+from veripress.model.indexes import (
+    FileIndex, get_file_index, read_meta, read_front_matter, read_body,
+    split_front_matter, parse_front_matter, _parse_flat_yaml
+)
+
+
+def write_file(path, content):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def test_split_front_matter():
+    assert split_front_matter('no yaml') == (None, 0)
+    assert split_front_matter('---\n\nno closing dashes') == (None, 0)
+    text = '\n---\ntitle: Hi\n---\n\nBody'
+    meta_str, offset = split_front_matter(text)
+    assert meta_str == '\ntitle: Hi\n'
+    assert text[offset:].strip() == 'Body'
+
+
+def test_parse_front_matter():
+    flat = [
+        'title: Hello World\ntags: [A, B]\ncategories: Default\ncreated: 2017-03-20 12:00:00\nis_draft: yes',
+        'title: 中文标题\n\n# comment\nauthor: Richard Chien\nemail: a@b.c\nlayout: page',
+        'title: \'Quoted: "title"\'\nsubtitle: "It\'s quoted"\nempty: \'\'',
+        'created: 2017-03-20\nupdated: 2017-03-22T10:20:30Z\ntime: 12:30\nlanguage: C#',
+        'count: 10\nhex: 0x1F\nratio: .5\nexp: 1e3\ninf: .inf\nnothing: ~\nnull_value: null\nno_value:',
+        'is_draft: No\npublished: on\nflag: n\ntags: []\ncategories: [1, yes, 2017-03-20, Hello World]',
+        'url: http://example.com/a#b\nkey:with:colons: value  \nmultiple  spaces: a  b',
+        'title: A\n   \nauthor: B',
+    ]
+    for yaml_str in flat:
+        meta = _parse_flat_yaml(yaml_str)
+        assert meta is not None
+        assert repr(meta) == repr(yaml.load(yaml_str, Loader=yaml.SafeLoader))
+        assert parse_front_matter(yaml_str) == meta
+
+    not_flat = [
+        '',
+        '# comment only',
+        'tags:\n  - A\n  - B',
+        'tags:\n- A\n- B',
+        'title: Hello # comment',
+        'title: Hello: World',
+        'title: >\n  folded',
+        'title: "escaped \\" quote"',
+        "title: 'it''s'",
+        'title: &anchor Hello\nsubtitle: *anchor',
+        'title: !!str 123',
+        'meta: {a: 1}',
+        'tags: [A, [B]]',
+        'tags: [A, B,]',
+        'number: -1',
+        'yes: key is a bool',
+        '1: key is an int',
+        'created: 2017-02-30',
+        'title : spaced key',
+        'title:\tindented\tvalue',
+        '---\ntitle: A',
+        'a string',
+        'title: A\n\xa0\nauthor: B',  # NBSP
+        'title: A\n\u3000\nauthor: B',
+        'title: A\n \t\nauthor: B',
+    ]
+    for yaml_str in not_flat:
+        assert _parse_flat_yaml(yaml_str) is None, yaml_str
+
+    # the fast path falls back to the yaml loader
+    assert parse_front_matter('tags:\n  - A\n  - B') == {'tags': ['A', 'B']}
+    assert parse_front_matter('title: Hello # comment') == {'title': 'Hello'}
+    assert parse_front_matter('number: -1') == {'number': -1}
+    for yaml_str in ('title: A\n\xa0\nauthor: B', 'title: A\n\t\nauthor: B'):
+        with raises(yaml.YAMLError):
+            parse_front_matter(yaml_str)
+    assert parse_front_matter('') is None
+
+
+def test_read_meta_body():
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'a.md')
+        with open(path, 'wb') as f:
+            f.write('---\r\ntitle: 中文\r\ncreated: 2017-03-09\r\n---\r\n\r\n'
+                    '## Title\r\n\r\nLorem ipsum.\r\n'.encode('utf-8'))
+        meta, offset, raw_content = read_meta(path)
+        assert meta == {'title': '中文', 'created': date(2017, 3, 9)}
+        assert raw_content == '## Title\n\nLorem ipsum.'
+        assert read_body(path, offset) == raw_content
+
+
+def test_read_front_matter():
+    contents = [
+        '---\ntitle: 中文标题\ntags: [a, b]\n---\n\nBody ---- with dashes\n',
+        '\n\n---\ntitle: A\n------\n\nBody',
+        '---\ntitle: A\n---',
+        '---\n\nno closing dashes',
+        'No yaml --- at all\n---\n',
+        '',
+        '   \n',
+        '\u3000---\ntitle: 中文\n---\n\u3000Body\u3000\n',  # non-ASCII whitespace
+        '\ufeff---\ntitle: A\n---\nBody',
+        '\r\n---\r\ntitle: A\r\n---\r\n\r\nLine 1\rLine 2\r\n\r\n',
+        '---\ntitle: A\n---\n\x1c Body \xa0\n',
+    ]
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'a.md')
+        for content in contents:
+            with open(path, 'wb') as f:
+                f.write(content.encode('utf-8'))
+            meta, offset, raw_content = read_meta(path)
+            # the same as splitting the decoded text
+            meta_str, body_start = split_front_matter(content)
+            assert offset == len(content[:body_start].encode('utf-8'))
+            assert raw_content == content[body_start:].replace('\r\n', '\n').replace('\r', '\n').strip()
+            for chunk_size in (1, 3, 4096):
+                assert read_front_matter(path, chunk_size=chunk_size) == (meta, offset)
+            assert read_body(path, offset) == raw_content
+
+        # the body is not read at all
+        with open(path, 'wb') as f:
+            f.write(b'---\ntitle: A\n---\n' + b'B' * 40 + b'\xff' * 10000)
+        assert read_front_matter(path, chunk_size=16) == ({'title': 'A'}, 16)
+
+        # the offset is stale if the file has changed since it was read
+        write_file(path, '---\ntitle: A\n---\nBody')
+        st = os.stat(path)
+        meta, offset = read_front_matter(path)
+        assert read_body(path, offset, st.st_mtime_ns, st.st_size) == 'Body'
+        write_file(path, '---\ntitle: 中文\n---\nNew body')
+        assert read_body(path, offset, st.st_mtime_ns, st.st_size) == 'New body'
+
+
+def test_file_index():
+    with tempfile.TemporaryDirectory() as root:
+        content_dir = os.path.join(root, 'posts')
+        index_file = os.path.join(root, '_cache', 'posts.index')
+        os.mkdir(content_dir)
+        write_file(os.path.join(content_dir, '2017-03-09-a.md'),
+                   '---\ntitle: A\n---\n\nAAA')
+        write_file(os.path.join(content_dir, '2017-03-10-b.txt'), 'BBB')
+        write_file(os.path.join(content_dir, 'not-a-post.md'), 'CCC')
+        write_file(os.path.join(content_dir, '2017-03-11-c.unknown'), 'DDD')
+
+        index = FileIndex(content_dir, index_file,
+                          filename_exp=r'\d{4}-\d{2}-\d{2}-.+')
+        assert index.refresh()
+        assert os.path.isfile(index_file)
+        entries = {e.rel_path: e for e in index.entries()}
+        assert set(entries) == {'2017-03-09-a.md', '2017-03-10-b.txt'}
+        assert entries['2017-03-09-a.md'].meta == {'title': 'A'}
+        assert entries['2017-03-09-a.md'].format == 'markdown'
+        assert index.read_body(entries['2017-03-09-a.md']) == 'AAA'
+        assert index.read_body(entries['2017-03-10-b.txt']) == 'BBB'
+        assert not index.refresh()  # nothing changed
+
+        # a new index object loads entries from the index file
+        index2 = FileIndex(content_dir, index_file,
+                           filename_exp=r'\d{4}-\d{2}-\d{2}-.+')
+        index2._load()
+        assert set(index2._entries) == set(entries)
+
+        write_file(os.path.join(content_dir, '2017-03-09-a.md'),
+                   '---\ntitle: A2\n---\n\nAAAA')
+        os.remove(os.path.join(content_dir, '2017-03-10-b.txt'))
+        assert index.refresh()
+        entries = {e.rel_path: e for e in index.entries()}
+        assert set(entries) == {'2017-03-09-a.md'}
+        assert entries['2017-03-09-a.md'].meta == {'title': 'A2'}
+
+        assert index.get('2017-03-09-a.md') is entries['2017-03-09-a.md']
+        assert index.get('non-exists.md') is None
+
+
+def test_find():
+    with tempfile.TemporaryDirectory() as root:
+        os.makedirs(os.path.join(root, 'a', 'b'))
+        write_file(os.path.join(root, 'x.md'), 'X')
+        write_file(os.path.join(root, 'x.txt'), 'X2')
+        write_file(os.path.join(root, 'a', 'b', 'c.md'), 'C')
+        write_file(os.path.join(root, 'a', 'style.css'), 'body {}')
+        index = FileIndex(root, os.path.join(root, '_cache', 'pages.index'),
+                          recursive=True)
+        assert index.find('a/b/c').rel_path == 'a/b/c.md'
+        assert index.find('x').rel_path == 'x.md'  # the smallest relative path
+        assert index.find('a/style') is None  # not indexed
+        assert index.find('a/b') is None
+        assert index.find('non-exists') is None
+
+        # removed files are skipped even before refreshing
+        os.remove(os.path.join(root, 'x.md'))
+        assert index.find('x').rel_path == 'x.txt'
+        os.remove(os.path.join(root, 'x.txt'))
+        assert index.find('x') is None
+
+        write_file(os.path.join(root, 'a', 'd.txt'), 'D')
+        assert index.find('a/d') is None  # not refreshed yet
+        assert index.update('a/d.txt')
+        assert index.find('a/d').rel_path == 'a/d.txt'
+        os.remove(os.path.join(root, 'a', 'd.txt'))
+        assert index.update('a/d.txt')
+        assert index.find('a/d') is None
+        write_file(os.path.join(root, 'a', 'd.md'), 'D')
+        index.refresh()
+        assert index.find('a/d').rel_path == 'a/d.md'
+
+        # stems are restored from the index file
+        index2 = FileIndex(root, os.path.join(root, '_cache', 'pages.index'),
+                           recursive=True)
+        index2._load()
+        assert index2.find('a/b/c').rel_path == 'a/b/c.md'
+
+
+def test_read_in_threads():
+    with tempfile.TemporaryDirectory() as root:
+        content_dir = os.path.join(root, 'pages')
+        os.makedirs(os.path.join(content_dir, 'sub'))
+        for i in range(50):
+            write_file(os.path.join(content_dir, 'sub' if i % 2 else '', 'p{}.md'.format(i)),
+                       '---\ntitle: P{}\n---\n\nbody {}'.format(i, i))
+        write_file(os.path.join(content_dir, 'style.css'), 'body {}')
+
+        def load(workers):
+            index = FileIndex(content_dir, os.path.join(root, '_cache', '{}.index'.format(workers)),
+                              recursive=True, workers=workers)
+            return index, {e.rel_path: (e.meta, e.offset) for e in index.entries()}
+
+        index, serial = load(1)
+        assert len(serial) == 50 and serial['sub/p1.md'][0] == {'title': 'P1'}
+        # in the order of the scan
+        assert list(serial) == [rel_path for rel_path, _ in index._scan() if index._accepts(rel_path)]
+        assert load(4)[1] == serial
+        assert list(load(4)[1]) == list(serial)
+
+
+@mark.skipif(not os.environ.get('VERIPRESS_BENCHMARK'), reason='set VERIPRESS_BENCHMARK to run benchmarks')
+def test_cold_load_benchmark():
+    # cold load (no index file) of synthetic posts, reading files
+    # in the calling thread vs in a pool of threads,
+    # set COLD_LOAD_BENCHMARK_SIZES (e.g. '1000,10000,50000') for larger corpora
+    import time
+    sizes = [int(n) for n in os.environ.get('COLD_LOAD_BENCHMARK_SIZES', '1000').split(',')]
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as root:
+            content_dir = os.path.join(root, 'posts')
+            os.mkdir(content_dir)
+            for i in range(n):
+                write_file(os.path.join(content_dir, '2017-03-{:02d}-post-{}.md'.format(i % 28 + 1, i)),
+                           '---\ntitle: Post {}\ntags: [A, B]\ncategories: C\n'
+                           'created: 2017-03-01 12:00:00\n---\n\n'.format(i) + 'Lorem ipsum. ' * 100)
+            times = []
+            for workers in (1, 4):
+                index = FileIndex(content_dir, os.path.join(root, '_cache', '{}.index'.format(workers)),
+                                  filename_exp=r'\d{4}-\d{2}-\d{2}-.+', workers=workers)
+                start = time.perf_counter()
+                assert len(index.entries()) == n
+                times.append(time.perf_counter() - start)
+            assert times[1] < times[0] * 1.5
+
+
+def test_signature():
+    with tempfile.TemporaryDirectory() as root:
+        index = FileIndex(root, os.path.join(root, '_cache', 'pages.index'),
+                          recursive=True)
+        index.refresh()
+        sig0 = index.signature
+        index.refresh()
+        assert index.signature == sig0
+
+        os.mkdir(os.path.join(root, 'a'))
+        index.refresh()
+        sig1 = index.signature
+        assert sig1 != sig0
+
+        # files of any type count, not only the indexed ones
+        write_file(os.path.join(root, 'a', 'style.css'), 'body {}')
+        assert not index.refresh()
+        sig2 = index.signature
+        assert sig2 != sig1
+
+        write_file(os.path.join(root, 'a', 'style.css'), 'body { margin: 0; }')
+        index.refresh()
+        assert index.signature != sig2
+
+
+def test_refresh_interval():
+    with tempfile.TemporaryDirectory() as root:
+        content_dir = os.path.join(root, 'pages')
+        os.makedirs(os.path.join(content_dir, 'a'))
+        write_file(os.path.join(content_dir, 'a', 'p.md'), 'AAA')
+        index = FileIndex(content_dir, os.path.join(root, '_cache', 'pages.index'), recursive=True)
+        assert index.refresh(interval=60)
+        sig = index.signature
+
+        # files modified in place are found after the interval
+        write_file(os.path.join(content_dir, 'a', 'p.md'), 'AAAA')
+        assert not index.refresh(interval=60)
+        assert index.signature == sig
+        assert index.refresh(interval=0)
+        assert index.signature != sig
+
+        # files added or removed change the mtime of the directory
+        write_file(os.path.join(content_dir, 'a', 'q.md'), 'BBB')
+        assert index.refresh(interval=60)
+        assert index.get('a/q.md') is not None
+        os.remove(os.path.join(content_dir, 'a', 'q.md'))
+        assert index.refresh(interval=60)
+        assert index.get('a/q.md') is None
+        assert not index.refresh(interval=60)
+
+def test_get_file_index():
+    with tempfile.TemporaryDirectory() as root:
+        index_file = os.path.join(root, 'pages.index')
+        index = get_file_index(root, index_file, recursive=True)
+        assert get_file_index(root, index_file) is index
+        assert index.recursive
+        assert get_file_index(root, index_file, workers=4) is index
+        assert index.workers == 4
+        # pickled as a reference to the shared index, with its workers
+        assert pickle.loads(pickle.dumps(index)) is index
+        assert index.workers == 4
+
+        # the temporary file is removed if the index cannot be written
+        os.mkdir(os.path.join(root, 'broken.index'))
+        broken = FileIndex(root, os.path.join(root, 'broken.index'))
+        broken.refresh()
+        assert os.listdir(root) == ['broken.index']
@@ -28,6 +28,20 @@ def test_base_model():
     base.meta['is_draft'] = True
     assert base.is_draft == True  # will change dynamically when meta changes
 
+    loaded = []
+    base.defer_raw_content(lambda: loaded.append(1) or 'Lazy content')
+    assert not loaded
+    assert base.raw_content == 'Lazy content'
+    assert base.raw_content == 'Lazy content'
+    assert loaded == [1]  # loaded only once
+    base.raw_content = 'This is a test content'
+    version = base.raw_content_version()
+    assert version != Base().raw_content_version()  # digest of the content
+    base.defer_raw_content(lambda: 'Another content', version=(1, 2))
+    assert base.raw_content_version() == (1, 2)
+    base.raw_content = 'This is a test content'
+    assert base.raw_content_version() == version
+
     base1 = Base()
     base1.format = 'txt'
     base2 = Base()
@@ -151,3 +165,66 @@ def test_json_encoder():
     not_supported = NotSupportedClass()
     with raises(TypeError):
         json.dumps(not_supported, cls=CustomJSONEncoder)
+
+
+def test_derived_values_cache():
+    post = Post()
+    post.rel_url = '2017/03/10/my-post/'
+    post.meta = {'tags': 'A', 'created': datetime(2017, 1, 1)}
+    assert post.tags is post.tags  # computed only once
+    assert post.created == datetime(2017, 1, 1)
+
+    # the cache is invalidated when meta or rel_url changes
+    post.meta['tags'] = ['A', 'B']
+    assert post.tags == ['A', 'B']
+    del post.meta['created']
+    assert post.created == datetime(2017, 3, 10)
+    post.meta.update(title='Title')
+    assert post.title == 'Title'
+    post.meta.pop('title')
+    assert post.title == 'My Post'
+    post.rel_url = '2017/03/11/another-post/'
+    assert post.title == 'Another Post' and post.created == datetime(2017, 3, 11)
+    post.meta.setdefault('layout', 'custom')
+    assert post.layout == 'custom'
+    post.meta.clear()
+    assert post.tags == [] and post.layout == 'post'
+
+    meta = {'title': 'Copied'}
+    post.meta = meta
+    meta['title'] = 'Not applied'
+    assert post.title == 'Copied'  # meta is copied when assigned
+
+    import pickle
+    post.raw_content = 'content'
+    loaded = pickle.loads(pickle.dumps(post, protocol=pickle.HIGHEST_PROTOCOL))
+    assert loaded == post
+    loaded.meta['title'] = 'Changed'
+    assert loaded.title == 'Changed'
+
+    with raises(AttributeError):
+        post.undefined_attribute = 1
+
+
+def test_to_dict_fields():
+    assert Post.serializable_fields() is Post.serializable_fields()
+    assert 'raw_content' in Post.serializable_fields()
+    assert 'tags' in Post.serializable_fields() and 'tags' not in Page.serializable_fields()
+    assert 'position' in Widget.serializable_fields()
+    assert not any(k.startswith('_') for k in Post.serializable_fields())
+
+    post = Post()
+    post.rel_url = '2017/03/10/my-post/'
+    post.unique_key = '/post/2017/03/10/my-post/'
+    post.format = 'markdown'
+    loaded = []
+    post.defer_raw_content(lambda: loaded.append(1) or 'content')
+    d = post.to_dict(exclude=('raw_content',))
+    assert not loaded  # raw content is not loaded
+    assert 'raw_content' not in d
+    assert d['title'] == 'My Post' and d['unique_key'] == post.unique_key
+    assert post.to_dict(fields=['title', 'tags', 'raw_content'], exclude=['raw_content']) == \
+        {'title': 'My Post', 'tags': []}
+    assert not loaded
+    assert post.to_dict()['raw_content'] == 'content'
+    assert loaded == [1]
@@ -1,8 +1,12 @@
+import os
 import re
+import tempfile
+import threading
 
-from pytest import raises
+from pytest import raises, mark
 
-from veripress.model.parsers import get_standard_format_name, get_parser, Parser, TxtParser, MarkdownParser, parser
+from veripress.model.parsers import get_standard_format_name, get_parser, Parser, TxtParser, MarkdownParser, parser, \
+    RenderCache, render_cache
 
 
 def test_parser_decorator():
@@ -59,3 +63,105 @@ def test_md_parser():
     p = MarkdownParser()
     assert p.parse_whole('## hello\n\n[link](https://google.com)').strip() \
            == '<h2>hello</h2>\n<p><a href="https://google.com">link</a></p>'
+
+
+def test_render_cache():
+    cache = RenderCache(max_entries=2)
+    key = RenderCache.make_key('token', 'whole', 'abc')
+    assert key != RenderCache.make_key('token', 'preview', 'abc')
+    assert key != RenderCache.make_key('token2', 'whole', 'abc')
+    assert cache.get(key) is None
+    cache.set(key, 'A')
+    cache.set('b', 'B')
+    assert cache.get(key) == 'A'  # now 'b' is the least recently used
+    cache.set('c', 'C')
+    assert cache.get('b') is None
+    assert cache.get(key) == 'A' and cache.get('c') == 'C'
+
+    with tempfile.TemporaryDirectory() as folder:
+        cache = RenderCache(max_entries=1, folder=folder)
+        cache.set(key, ('<p>A</p>', True))
+        key_b = RenderCache.make_key('token', 'whole', 'b')
+        cache.set(key_b, 'B')
+        assert os.path.isfile(os.path.join(folder, key[:2], key[2:]))
+        # loaded from the on-disk tier
+        assert cache.get(key) == ('<p>A</p>', True)
+        cache.clear()
+        assert RenderCache(folder=folder).get(key_b) == 'B'
+
+    with tempfile.TemporaryDirectory() as folder:
+        # the least recently used files are removed beyond 'max_files'
+        cache = RenderCache(max_entries=0, folder=folder, max_files=4)
+        keys = [RenderCache.make_key('token', 'whole', str(i)) for i in range(5)]
+        for i, k in enumerate(keys[:4]):
+            cache.set(k, i)
+            os.utime(os.path.join(folder, k[:2], k[2:]), (1000 + i, 1000 + i))
+        assert cache.get(keys[0]) == 0  # now keys[1] is the least recently used
+        cache.set(keys[4], 4)
+        assert [cache.get(k) for k in keys] == [0, None, None, 3, 4]
+        # no temporary file is left
+        assert sum(len(files) for _, _, files in os.walk(folder)) == 3
+
+
+def test_parser_render_cache():
+    p = get_parser('markdown')
+    raw_content = '# Render cache test\n\nA paragraph.'
+    key = RenderCache.make_key(p.cache_token, 'whole', raw_content)
+    # computed once for the parser
+    assert p.cache_token is p.cache_token
+    assert 'markdown=' in p.cache_token
+    assert render_cache.get(key) is None
+    result = p.parse_whole(raw_content)
+    assert render_cache.get(key) == result
+    render_cache.set(key, 'cached')
+    assert p.parse_whole(raw_content) == 'cached'
+    render_cache.clear()
+    assert p.parse_whole(raw_content) == result
+    # parse_preview of the base class uses the cached parse_whole
+    assert p.parse_preview(raw_content) == (result, False)
+
+
+def md_corpus():
+    return ['## Post {}\n\nShort *post* with a [link](/{}/).\n\n'
+            '```python\nprint({})\n```'.format(i, i, i) for i in range(50)]
+
+
+def test_md_parser_reuse():
+    import markdown
+
+    corpus = md_corpus()
+    p = MarkdownParser()
+    # the same output as building a Markdown object per call
+    for raw_content in corpus:
+        assert p._markdown(raw_content) == markdown.markdown(raw_content, **MarkdownParser._markdown_options)
+
+    # one Markdown object per thread
+    md = p._local.markdown
+    p._markdown(corpus[0])
+    assert p._local.markdown is md
+    other = []
+
+    def convert_in_thread():
+        other.append((p._markdown(corpus[1]), p._local.markdown))
+
+    thread = threading.Thread(target=convert_in_thread)
+    thread.start()
+    thread.join()
+    assert other[0][0] == p._markdown(corpus[1])
+    assert other[0][1] is not md
+
+
+@mark.skipif(not os.environ.get('VERIPRESS_BENCHMARK'), reason='set VERIPRESS_BENCHMARK to run benchmarks')
+def test_md_parser_benchmark():
+    # per-document overhead on short posts,
+    # building a Markdown object per call (the old way) vs reusing one
+    import timeit
+    from functools import partial
+    import markdown
+
+    corpus = md_corpus()
+    p = MarkdownParser()
+    build_per_call = partial(markdown.markdown, **MarkdownParser._markdown_options)
+    before = min(timeit.repeat(lambda: [build_per_call(c) for c in corpus], number=1, repeat=3))
+    after = min(timeit.repeat(lambda: [p._markdown(c) for c in corpus], number=1, repeat=3))
+    assert after < before
@@ -0,0 +1,122 @@
+from datetime import date, datetime
+
+from veripress.helpers import Pair
+from veripress.model.models import Post
+from veripress.model.post_index import (
+    PostIndex, get_post_index, to_interval, sort_key
+)
+
+
+def make_post(rel_url, **meta):
+    post = Post()
+    post.rel_url = rel_url
+    post.unique_key = '/post/' + rel_url
+    post.meta = meta
+    return post
+
+
+def make_posts():
+    posts = [
+        make_post('2017/03/10/a/', tags=['A', 'B'], categories='X'),
+        make_post('2017/03/01/b/', tags='B', updated=datetime(2017, 5, 1)),
+        make_post('2017/02/28/c/', created=datetime(2017, 3, 2, 12)),
+        make_post('2016/12/31/d/', tags='A', author='Someone'),
+        make_post('2016/01/01/e/', tags=['A', 'A'], categories='X', is_draft=True),
+    ]
+    return sorted(posts, key=lambda p: p.created, reverse=True)
+
+
+def test_to_interval():
+    assert to_interval(None) is None
+    assert to_interval([date(2017, 1, 1)]) is None
+    assert to_interval(['2017-01-01', '2017-01-02']) is None
+    assert to_interval((date(2017, 1, 1), date(2017, 1, 2))) == \
+        (datetime(2017, 1, 1), datetime(2017, 1, 3))
+    assert to_interval([datetime(2017, 1, 1, 8), datetime(2017, 1, 2, 8)]) == \
+        (datetime(2017, 1, 1, 8), datetime(2017, 1, 2, 8))
+
+
+def test_post_index():
+    posts = make_posts()
+    index = PostIndex(posts, generation='g')
+    assert len(index) == 5 and index.generation == 'g'
+    names = lambda result: [p.rel_url.split('/')[3] for p in result]
+    assert names(index.posts) == ['a', 'c', 'b', 'd', 'e']
+
+    def query(**kwargs):
+        result = index.query(**kwargs)
+        # the same as filtering all posts
+        return names(result)
+
+    assert query() == ['a', 'c', 'b', 'd', 'e']
+    assert query(rel_url_prefix='2017/') == ['a', 'c', 'b']
+    assert query(rel_url_prefix='2017/03/') == ['a', 'b']
+    assert query(rel_url_prefix='2017/03/01/') == ['b']
+    assert query(rel_url_prefix='2017/03/01/b/') == ['b']
+    assert query(rel_url_prefix='2017/03/01/x/') == []
+    assert query(rel_url_prefix='2015/') == []
+    assert query(rel_url_prefix='201') == ['a', 'c', 'b', 'd', 'e']
+
+    assert query(created=(date(2017, 3, 1), date(2017, 3, 2))) == ['c', 'b']
+    assert query(created=(datetime(2017, 3, 1, 1), date(2017, 3, 10))) == ['a', 'c']
+    assert query(created=(date(2018, 1, 1), date(2019, 1, 1))) == []
+    assert query(updated=(date(2017, 3, 1), date(2017, 5, 1))) == ['a', 'c', 'b']
+    assert query(updated=(date(2017, 3, 5), date(2017, 4, 1))) == ['a']
+    assert query(rel_url_prefix='2017/03/', created=(date(2017, 3, 2), date(2017, 3, 10))) == ['a']
+    assert query(rel_url_prefix='2017/', tags='A') == ['a']
+    assert query(tags=['A', 'B'], created=(date(2016, 1, 1), date(2017, 3, 1))) == ['b', 'd', 'e']
+    assert query(author='Someone') == ['d']
+    assert query(tags='A') == ['a', 'd', 'e']
+    assert query(tags=['B', 'C']) == ['a', 'b']
+    assert query(tags='C') == []
+    assert query(tags=('A',), categories='X') == ['a', 'e']
+    assert query(tags='A', categories=['X', 'Y'], rel_url_prefix='2016/') == ['e']
+
+    assert index.with_attr('tags', ['A', 'B']) == [0, 2, 3, 4]
+    assert index.counts('tags') == [('A', Pair(3, 2)), ('B', Pair(2, 2))]
+    assert index.counts('categories') == [('X', Pair(2, 1))]
+
+    assert PostIndex([]).query(rel_url_prefix='2017/', created=(date(2017, 1, 1), date(2017, 2, 1))) == []
+
+    # 'updated' that is not recognized as a datetime
+    posts.append(make_post('2015/06/01/f/', updated='2018-01-02 10:00'))
+    index = PostIndex(posts)
+    assert names(index.posts) == ['a', 'c', 'b', 'd', 'e', 'f']
+    assert names(index.query(tags='A')) == ['a', 'd', 'e']
+    assert names(index.query(updated=(date(2015, 1, 1), date(2019, 1, 1)))) == ['a', 'c', 'b', 'd', 'e']
+
+
+def test_post_index_page():
+    posts = make_posts()
+    # posts created at the same time are ordered by unique keys
+    posts.append(make_post('2017/03/01/f/', tags='B'))
+    index = PostIndex(reversed(posts))
+    names = lambda result: [p.rel_url.split('/')[3] for p in result]
+    assert names(index.posts) == ['a', 'c', 'f', 'b', 'd', 'e']
+
+    page = lambda **kwargs: (names(index.page(**kwargs)[0]), index.page(**kwargs)[1])
+    assert page() == (['a', 'c', 'f', 'b', 'd', 'e'], 6)
+    assert page(limit=2) == (['a', 'c'], 6)
+    assert page(offset=2, limit=2) == (['f', 'b'], 6)
+    assert page(offset=5, limit=2) == (['e'], 6)
+    assert page(offset=7) == ([], 6)
+    assert page(limit=0) == ([], 6)
+    assert page(offset=1, limit=2, tags='B') == (['f', 'b'], 3)
+    assert page(limit=1, rel_url_prefix='2016/') == (['d'], 2)
+
+    # keyset cursors
+    assert page(after=sort_key(index.posts[1]), limit=2) == (['f', 'b'], 6)
+    assert page(after=sort_key(index.posts[2])) == (['b', 'd', 'e'], 6)
+    assert page(after=sort_key(index.posts[2]), offset=1, limit=1) == (['d'], 6)
+    assert page(after=sort_key(index.posts[0]), tags='B') == (['f', 'b'], 3)
+    assert page(after=sort_key(index.posts[-1])) == ([], 6)
+    # the post of the cursor may be removed
+    assert page(after=(datetime(2017, 3, 5), '/post/x/')) == (['c', 'f', 'b', 'd', 'e'], 6)
+    assert page(after=(datetime(2017, 3, 1), '/post/2017/03/01/e/')) == (['b', 'd', 'e'], 6)
+
+
+def test_get_post_index():
+    posts = make_posts()
+    index = get_post_index('test', 'g1', lambda: posts)
+    assert get_post_index('test', 'g1', lambda: []) is index
+    assert len(get_post_index('test', 'g2', lambda: posts[:1])) == 1
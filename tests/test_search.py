@@ -0,0 +1,197 @@
+import os
+import tempfile
+
+from veripress import app
+from veripress.model import storage
+from veripress.model.models import Page, Post
+from veripress.model.search import (
+    SearchIndex, get_search_index, tokenize, is_cjk_token
+)
+
+
+def make_post(rel_url, title, raw_content, fmt='markdown'):
+    post = Post()
+    post.rel_url = rel_url
+    post.unique_key = '/post/' + rel_url
+    post.format = fmt
+    post.meta = {'title': title}
+    post.raw_content = raw_content
+    return post
+
+
+def test_tokenize():
+    assert tokenize('Hello, World! foo_bar 2017') == ['hello', 'world', 'foo_bar', '2017']
+    assert tokenize('...') == []
+    assert tokenize('VeriPress是一个博客引擎') == ['veripress', '是一', '一个', '个博', '博客', '客引', '引擎']
+    assert tokenize('中文，日本語のテキスト') == ['中文', '日本', '本語', '語の', 'のテ', 'テキ', 'キス', 'スト']
+    assert tokenize('a中b 한국어') == ['a', '中', 'b', '한국', '국어']
+    assert tokenize('博客引擎', cjk_ngram=3) == ['博客引', '客引擎']
+    assert is_cjk_token('博客') and is_cjk_token('テキ')
+    assert not is_cjk_token('python') and not is_cjk_token('2017')
+
+
+def test_search_index():
+    index = SearchIndex()
+    p1 = make_post('2017/01/01/a/', 'Hello World', '## Lorem ipsum\n\n**dolor** sit amet.')
+    p2 = make_post('2017/01/02/b/', 'Another Post', 'Lorem, <em>consectetur</em> adipiscing.')
+    page = Page()
+    page.rel_url = 'about.html'
+    page.unique_key = '/about.html'
+    page.format = 'txt'
+    page.raw_content = 'About this site: hello!'
+    assert index.update([p1, p2, page]) == 3
+    assert len(index) == 3
+
+    assert index.search('') == {}
+    assert set(index.search('lorem')) == {p1.unique_key, p2.unique_key}
+    assert set(index.search('LOREM')) == {p1.unique_key, p2.unique_key}
+    assert set(index.search('hello')) == {p1.unique_key, page.unique_key}
+    assert set(index.search('orem ips')) == {p1.unique_key}  # begins and ends in the middle of words
+    assert set(index.search('ipsum dolor')) == {p1.unique_key}  # tags are stripped
+    assert set(index.search('ipsum sit')) == set()  # not a phrase in any document
+    assert set(index.search('world lorem')) == set()  # title and content are not joined
+    assert set(index.search('consectetur adipiscing')) == {p2.unique_key}
+    assert set(index.search('lorem,')) == {p2.unique_key}
+    assert set(index.search(': ')) == {page.unique_key}  # no token in the query
+    assert set(index.search('nonexistent')) == set()
+
+    # only changed documents are indexed again
+    assert index.update([p1, p2, page]) == 0
+    p2 = make_post('2017/01/02/b/', 'Another Post', 'Changed content.')
+    assert index.update([p1, p2, page]) == 1
+    assert set(index.search('lorem')) == {p1.unique_key}
+    assert set(index.search('changed')) == {p2.unique_key}
+    assert index.update([p1]) == 2  # removed
+    assert set(index.search('changed')) == set()
+    assert set(index.search('hello')) == {p1.unique_key}
+
+
+def test_search_ranking():
+    index = SearchIndex()
+    p1 = make_post('2017/01/01/a/', 'Python', 'Python is a programming language. ' * 3, fmt='txt')
+    p2 = make_post('2017/01/02/b/', 'Notes', 'Some notes, mentioning python once, and many other words. ' * 3,
+                   fmt='txt')
+    p3 = make_post('2017/01/03/c/', 'Other', 'Nothing to see here.', fmt='txt')
+    index.update([p1, p2, p3])
+    scores = index.search('python')
+    assert set(scores) == {p1.unique_key, p2.unique_key}
+    assert scores[p1.unique_key] > scores[p2.unique_key] > 0
+
+    # a title match outranks any number of occurrences in the content
+    p4 = make_post('2017/01/04/d/', 'Notes', 'python ' * 50, fmt='txt')
+    # a query token is scored by the best of the index tokens containing it
+    p5 = make_post('2017/01/05/e/', 'Words', 'pythonic pythonista pythons', fmt='txt')
+    index.update([p1, p2, p3, p4, p5])
+    scores = index.search('python')
+    assert scores[p1.unique_key] > scores[p4.unique_key] > scores[p2.unique_key]
+    assert scores[p5.unique_key] == max(index.search(word)[p5.unique_key]
+                                        for word in ('pythonic', 'pythonista', 'pythons'))
+    index.update([p1, p2, p3])
+
+    assert index.make_snippet(p3.unique_key, 'other') == 'Nothing to see here.'  # only title matched
+    assert index.make_snippet(p2.unique_key, 'PYTHON', width=30) == \
+        '... mentioning <mark>python</mark> once, and ...'
+    assert index.make_snippet(p1.unique_key, '<b>', width=10) == 'Python is ...'
+    assert index.make_snippet('/non-exists/', 'python') is None
+
+    index.update([make_post('2017/01/01/a/', 'Tags', 'a &lt;b&gt; c', fmt='txt')])
+    assert index.make_snippet('/post/2017/01/01/a/', '<b>') == 'a <mark>&lt;b&gt;</mark> c'
+
+
+def test_match_token():
+    index = SearchIndex()
+    p1 = make_post('2017/01/01/a/', 'Lorem', 'Lorem ipsum dolor sit amet, aaa loremipsum.', fmt='txt')
+    p2 = make_post('2017/01/02/b/', 'Dolor', 'Dolore magna aliqua, 中文 x', fmt='txt')
+    index.update([p1, p2])
+
+    def check():
+        for token in ('l', 'a', 'aa', 'aaa', 'or', 'lor', 'orem', 'loremipsum', 'ore m', 'xyz', '中', 'mag', 'x'):
+            for t in tokenize(token):
+                assert sorted(index._match_token(t)) == sorted(i for i in index._postings if t in i)
+
+    check()
+    assert sorted(index._match_token('lor')) == ['dolor', 'dolore', 'lorem', 'loremipsum']
+    index.update([make_post('2017/01/02/b/', 'Other', 'Nothing', fmt='txt'), p1])
+    check()
+    assert sorted(index._match_token('lor')) == ['dolor', 'lorem', 'loremipsum']
+    index.update([])
+    assert index._grams == {}
+
+def test_search_cjk():
+    index = SearchIndex()
+    p1 = make_post('2017/01/01/a/', '中文博客', '这是一个用 Python 编写的博客引擎，支持中文搜索。', fmt='txt')
+    p2 = make_post('2017/01/02/b/', '日本語', '日本語のテキストを検索する。', fmt='txt')
+    index.update([p1, p2])
+    assert set(index.search('博客')) == {p1.unique_key}
+    assert set(index.search('中文搜索')) == {p1.unique_key}
+    assert set(index.search('写的博')) == {p1.unique_key}  # across words
+    assert set(index.search('引')) == {p1.unique_key}  # single character
+    assert set(index.search('python 编写')) == {p1.unique_key}
+    assert set(index.search('博客 引擎')) == set()
+    assert set(index.search('テキスト')) == {p2.unique_key}
+    assert set(index.search('日本')) == {p2.unique_key}
+    assert index.make_snippet(p1.unique_key, '编写的') == '这是一个用 Python <mark>编写的</mark>博客引擎，支持中文搜索。'
+
+
+def test_search_index_file():
+    with tempfile.TemporaryDirectory() as root:
+        index_file = os.path.join(root, '_cache', 'search.index')
+        p1 = make_post('2017/01/01/a/', 'Hello World', 'Lorem ipsum dolor sit amet.')
+        p2 = make_post('2017/01/02/b/', '中文', '中文搜索', fmt='txt')
+        index = SearchIndex(index_file)
+        assert index.update([p1, p2]) == 2
+        assert os.path.isfile(index_file)
+
+        # another process loads the file, and only re-indexes changed documents
+        index2 = SearchIndex(index_file)
+        assert index2.update([p1, p2]) == 0
+        assert len(index2) == 2
+        assert index2.search('ipsum') == index.search('ipsum')
+        assert set(index2.search('搜索')) == {p2.unique_key}
+        assert index2.make_snippet(p1.unique_key, 'dolor') == 'Lorem ipsum <mark>dolor</mark> sit amet.'
+        p3 = make_post('2017/01/03/c/', 'New', 'New post.')
+        assert index2.update([p1, p2, p3]) == 1
+
+        # changes written by another process are picked up
+        assert index.update([p1, p2, p3]) == 0
+        assert set(index.search('new')) == {p3.unique_key}
+
+        # a broken index file is rebuilt
+        with open(index_file, 'wb') as f:
+            f.write(b'broken')
+        index3 = SearchIndex(index_file)
+        assert index3.update([p1]) == 1
+        assert SearchIndex(index_file).update([p1]) == 0
+
+
+def test_get_search_index():
+    assert get_search_index('a') is get_search_index('a')
+    assert get_search_index('a') is not get_search_index('b')
+    assert get_search_index('a', 'a.index') is get_search_index('a', 'a.index')
+    assert get_search_index('a', 'a.index').index_file_path == 'a.index'
+
+    with app.app_context():
+        search_index = storage.get_search_index()
+        assert search_index.generation == storage.get_generation()
+        assert search_index.index_file_path == os.path.join(
+            app.instance_path, app.config['CACHE_FOLDER'], 'search.index')
+        assert len(search_index) == len(storage.get_posts(include_draft=True)) + len(
+            storage.get_pages(include_draft=True))
+
+        result = storage.search_for('lorem ipsum')
+        scores = search_index.search('lorem ipsum')
+        assert result
+        result_scores = [scores[p.unique_key] for p in result]
+        assert result_scores == sorted(result_scores, reverse=True)
+
+
+def test_search_index_file_not_writable():
+    with tempfile.TemporaryDirectory() as root:
+        # a directory is in the way of the index file
+        index_file = os.path.join(root, 'search.index')
+        os.mkdir(index_file)
+        index = SearchIndex(index_file)
+        assert index.update([make_post('2017/01/01/a/', 'Hello', 'World')]) == 1
+        assert set(index.search('world')) == {'/post/2017/01/01/a/'}
+        # no temporary file is left behind
+        assert os.listdir(root) == ['search.index']
@@ -0,0 +1,245 @@
+import os
+import tempfile
+from datetime import date, datetime
+
+from pytest import fixture
+
+from veripress import app
+from veripress.model import get_storage
+from veripress.model.models import Page, Post, Widget
+from veripress.model.storages import Storage, FileStorage, SqliteStorage
+
+
+@fixture
+def database_path():
+    with tempfile.TemporaryDirectory() as root:
+        yield os.path.join(root, 'veripress.db')
+
+
+def keys(objs):
+    return [o.unique_key for o in objs]
+
+
+def test_get_storage(database_path):
+    with app.app_context():
+        app.config['STORAGE_TYPE'] = 'sqlite'
+        app.config['SQLITE_DATABASE'] = database_path
+        try:
+            s = get_storage()
+            assert isinstance(s, SqliteStorage)
+            assert s.database_path == database_path
+            # storages of different databases are told apart in caches and shared indexes
+            assert repr(s) == '<SqliteStorage {!r} {!r}>'.format(app.instance_path, database_path)
+            assert repr(SqliteStorage(database_path + '2')) != repr(s)
+            assert s.get_generation() == ''
+        finally:
+            app.config['STORAGE_TYPE'] = 'file'
+            app.config['SQLITE_DATABASE'] = 'veripress.db'
+    assert s.closed
+
+
+def test_sync_from_file_storage(database_path):
+    with app.app_context():
+        fs = FileStorage()
+        s = SqliteStorage(database_path)
+        count = len(fs.get_posts(include_draft=True)) + len(fs.get_pages(include_draft=True)) + len(
+            fs.get_widgets(include_draft=True))
+        assert s.sync(fs) == count
+        generation = s.get_generation()
+        assert generation
+        assert s.sync(fs) == 0
+        assert s.get_generation() == generation
+
+        for include_draft in (True, False):
+            assert s.get_posts(include_draft=include_draft) == fs.get_posts(include_draft=include_draft)
+            assert sorted(keys(s.get_pages(include_draft=include_draft))) == sorted(
+                keys(fs.get_pages(include_draft=include_draft)))
+            assert s.get_widgets(include_draft=include_draft) == fs.get_widgets(include_draft=include_draft)
+        assert s.get_widgets(position='sidebar') == fs.get_widgets(position='sidebar')
+        assert s.get_tags() == fs.get_tags()
+        assert s.get_categories() == fs.get_categories()
+        assert keys(s.get_posts(filter_functions=[lambda p: p.title == 'My Post'])) == ['/post/2017/03/09/my-post/']
+
+        for rel_url in ('2017/03/09/my-post/', '2017/03/09/my-post/index.html', '2016/03/03/hello-world/',
+                        '2017/03/09/non-exists/'):
+            assert s.get_post(rel_url) == fs.get_post(rel_url)
+            assert s.get_post(rel_url, include_draft=True) == fs.get_post(rel_url, include_draft=True)
+        for rel_url in [p.rel_url for p in fs.get_pages(include_draft=True)] + ['non-exists.html']:
+            assert s.get_page(rel_url) == fs.get_page(rel_url)
+            assert s.get_page(rel_url, include_draft=True) == fs.get_page(rel_url, include_draft=True)
+        for rel_url in ('my-page', 'my-page/', 'style.css', 'my-page/index', 'my-page/index.htm', '//'):
+            assert s.fix_page_relative_url(rel_url) == FileStorage.fix_page_relative_url(rel_url)
+
+        for query in ('lorem', 'LOREM IPSUM', 'lo', 'a', 'hello', ':', 'nonexistent'):
+            assert sorted(keys(s.search_for(query, include_draft=True))) == sorted(
+                keys(fs.search_for(query, include_draft=True)))
+        assert s.make_search_snippet('/post/2017/03/09/my-post/', 'ipsum') == \
+            fs.make_search_snippet('/post/2017/03/09/my-post/', 'ipsum')
+        assert s.make_search_snippet('/non-exists/', 'ipsum') is None
+        s.close()
+
+
+def test_get_posts_with_limits(database_path):
+    with app.app_context():
+        fs = FileStorage()
+        s = SqliteStorage(database_path)
+        s.sync(fs)
+        for limits in ({}, {'rel_url_prefix': '2017/'}, {'rel_url_prefix': '2017/03/'},
+                       {'rel_url_prefix': '2017/03/09/my-post'}, {'rel_url_prefix': '2019/'},
+                       {'tags': 'Hello World'}, {'tags': ['Hello World', 'nope']}, {'categories': 'Default'},
+                       {'title': 'My Post'}, {'layout': 'post'}, {'author': 'My Name'},
+                       {'created': (date(2017, 3, 9), date(2017, 3, 9))},
+                       {'updated': (datetime(2017, 3, 10), date(2017, 3, 11))},
+                       {'created': (date(2017, 3, 10), date(2017, 3, 9))},
+                       {'created': 'invalid'}, {'tags': 'Hello World', 'rel_url_prefix': '2016/'}):
+            for include_draft in (True, False):
+                expected = keys(fs.get_posts_with_limits(include_draft=include_draft, **limits))
+                assert keys(s.get_posts_with_limits(include_draft=include_draft, **limits)) == expected
+                assert keys(s.get_posts_page(include_draft=include_draft, offset=1, limit=2, **limits)[0]) == \
+                    expected[1:3]
+                assert s.get_posts_page(include_draft=include_draft, **limits)[1] == len(expected)
+
+        # pages start after the last post of the previous page
+        posts = s.get_posts(include_draft=True)
+        result = []
+        after = None
+        while True:
+            page, total = s.get_posts_page(include_draft=True, limit=2, after=after)
+            assert total == len(posts)
+            if not page:
+                break
+            result.extend(page)
+            after = page[-1].created, page[-1].unique_key
+        assert keys(result) == keys(posts)
+
+        # so do pages of search result
+        result = []
+        after = None
+        while True:
+            page, total = s.search_page('lorem', include_draft=True, limit=2, after=after)
+            if not page:
+                break
+            result.extend(page)
+            after = page[-1][0], page[-1][1].unique_key
+        assert result == s.search_page('lorem', include_draft=True)[0]
+        assert [score for score, _ in result] == sorted((score for score, _ in result), reverse=True)
+        assert len(result) == total
+        s.close()
+
+
+class ListStorage(Storage):
+    """Storage of given lists of posts, pages and widgets."""
+
+    def __init__(self, posts=(), pages=(), widgets=()):
+        super().__init__()
+        self.posts, self.pages, self.widgets = posts, pages, widgets
+
+    def get_posts(self, include_draft=False, filter_functions=None):
+        return self.posts
+
+    def get_pages(self, include_draft=False):
+        return self.pages
+
+    def get_widgets(self, position=None, include_draft=False):
+        return self.widgets
+
+
+def make_post(rel_url, meta, raw_content):
+    post = Post()
+    post.rel_url = rel_url
+    post.unique_key = '/post/' + rel_url
+    post.format = 'txt'
+    post.meta = meta
+    post.raw_content = raw_content
+    return post
+
+
+def make_page(rel_url, raw_content):
+    page = Page()
+    page.rel_url = rel_url
+    page.unique_key = '/' + rel_url
+    page.format = 'txt'
+    page.raw_content = raw_content
+    return page
+
+
+def make_widget(position, order, raw_content):
+    widget = Widget()
+    widget.format = 'txt'
+    widget.meta = {'position': position, 'order': order}
+    widget.raw_content = raw_content
+    return widget
+
+
+def test_sync_changes(database_path):
+    with app.app_context():
+        s = SqliteStorage(database_path)
+        p1 = make_post('2017/01/01/a/', {'tags': ['A', 'B']}, 'AAA 中文搜索')
+        p2 = make_post('2017/01/02/b/', {'tags': 'B', 'is_draft': True}, 'BBB')
+        page = make_page('x/y/', 'Page content')
+        w1, w2 = make_widget('sidebar', 1, 'W1'), make_widget('sidebar', 0, 'W2')
+        assert s.sync(ListStorage([p2, p1, p1], [page], [w1, w2])) == 5
+        generation = s.get_generation()
+        assert keys(s.get_posts(include_draft=True)) == ['/post/2017/01/02/b/', '/post/2017/01/01/a/']
+        assert keys(s.get_posts()) == ['/post/2017/01/01/a/']
+        assert s.get_posts()[0].raw_content == 'AAA 中文搜索'
+        assert [(t, tuple(c)) for t, c in s.get_tags()] == [('B', (2, 1)), ('A', (1, 1))]
+        assert [w.raw_content for w in s.get_widgets()] == ['W2', 'W1']
+        assert s.get_page('x/y/index.html').raw_content == 'Page content'
+        # the directory of the page only exists in the database
+        assert s.fix_page_relative_url('x/y') == ('x/y/', False)
+        assert s.fix_page_relative_url('x') == ('x/', False)
+        assert keys(s.search_for('中文')) == ['/post/2017/01/01/a/']
+        assert keys(s.search_for('bbb')) == []
+        assert keys(s.search_for('bbb', include_draft=True)) == ['/post/2017/01/02/b/']
+
+        # only changed ones are synced
+        p2 = make_post('2017/01/02/b/', {'tags': 'C'}, 'BBB')
+        w3 = make_widget('footer', 0, 'W3')
+        assert s.sync(ListStorage([p2, p1], [], [w3, w2])) == 4
+        assert s.get_generation() != generation
+        assert keys(s.get_posts()) == ['/post/2017/01/02/b/', '/post/2017/01/01/a/']
+        assert [t for t, _ in s.get_tags()] == ['C', 'A', 'B']
+        assert s.get_posts_with_limits(tags='B') == [p1]
+        assert s.get_pages(include_draft=True) == []
+        assert s.get_page('x/y/') is None
+        assert keys(s.search_for('page')) == []
+        assert [w.raw_content for w in s.get_widgets(include_draft=True)] == ['W3', 'W2']
+        assert s.sync(ListStorage([p2, p1], [], [w3, w2])) == 0
+        s.close()
+
+
+def test_updated_not_datetime(database_path):
+    with app.app_context():
+        # 'updated' of the first post is a string in the yaml head
+        p1 = make_post('2017/01/01/a/', {'created': datetime(2017, 1, 1), 'updated': '2018-01-02 10:00'}, 'A')
+        p2 = make_post('2017/01/02/b/', {'created': datetime(2017, 1, 2), 'updated': datetime(2017, 1, 3)}, 'B')
+        ls = ListStorage([p2, p1])
+        s = SqliteStorage(database_path)
+        s.sync(ls)
+        for storage_ in (ls, s):
+            # it's listed, but never in an updated interval
+            assert keys(storage_.get_posts_page()[0]) == [p2.unique_key, p1.unique_key]
+            assert keys(storage_.get_posts_with_limits(created=(date(2016, 1, 1), date(2019, 1, 1)))) == \
+                [p2.unique_key, p1.unique_key]
+            assert keys(storage_.get_posts_with_limits(updated=(date(2016, 1, 1), date(2019, 1, 1)))) == \
+                [p2.unique_key]
+        s.close()
+
+
+def test_load_raw_content_connection(database_path, monkeypatch):
+    import sqlite3
+    from veripress.model import storages
+
+    with app.app_context():
+        s = SqliteStorage(database_path)
+        s.sync(FileStorage())
+        posts = s.get_posts(include_draft=True)
+        connect = sqlite3.connect
+        connections = []
+        monkeypatch.setattr(storages.sqlite3, 'connect',
+                            lambda *args, **kwargs: connections.append(args) or connect(*args, **kwargs))
+        # bodies are loaded through one connection of the thread
+        assert all(p.raw_content is not None for p in posts)
+        assert len(connections) <= 1
+        s.close()
@@ -95,6 +95,21 @@ def test_get_posts_with_limits():
                                                        date(year=2014, month=2, day=2)))
         assert len(posts) == 0
 
+        all_posts = storage.get_posts(include_draft=True)
+        for prefix in ('2017/', '2017/03/', '2017/03/10/', '2017/03/10/post-no-yaml/', '2016/'):
+            posts = storage.get_posts_with_limits(include_draft=True, rel_url_prefix=prefix)
+            assert posts == [p for p in all_posts if p.rel_url.startswith(prefix)]
+        assert storage.get_post_index(include_draft=True) is storage.get_post_index(include_draft=True)
+
+        posts, total = storage.get_posts_page(include_draft=True, offset=1, limit=2)
+        assert posts == all_posts[1:3] and total == len(all_posts)
+        posts, total = storage.get_posts_page(include_draft=True, limit=1,
+                                              after=(all_posts[1].created, all_posts[1].unique_key))
+        assert posts == all_posts[2:3] and total == len(all_posts)
+        posts, total = storage.get_posts_page(include_draft=True, rel_url_prefix='2016/')
+        assert posts == [p for p in all_posts if p.rel_url.startswith('2016/')] and total == len(posts)
+        assert len(storage.get_post_index(include_draft=False)) == len(storage.get_posts())
+
 
 def test_search_for():
     with app.app_context():
@@ -103,6 +118,14 @@ def test_search_for():
         assert len(list(storage.search_for('Hello'))) == 1
         assert len(list(storage.search_for('Hello', include_draft=True))) == 2
 
+        all_result = storage.search_for('lorem', include_draft=True)
+        result, total = storage.search_page('lorem', include_draft=True, offset=1, limit=2)
+        assert [p for _, p in result] == all_result[1:3] and total == len(all_result)
+        score, p = result[0]
+        result, total = storage.search_page('lorem', include_draft=True, after=(score, p.unique_key))
+        assert [p for _, p in result] == all_result[2:] and total == len(all_result)
+        assert storage.search_page('', limit=1) == ([], 0)
+
     app.config['ALLOW_SEARCH_PAGES'] = False
     with app.app_context():
         assert len(list(storage.search_for('Hello'))) == 0
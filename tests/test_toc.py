@@ -1,6 +1,12 @@
+import os
 import re
 
-from veripress.model.toc import HtmlTocParser
+from pytest import mark
+
+from veripress import app
+from veripress.helpers import parse_whole_with_toc
+from veripress.model.parsers import get_parser, render_cache
+from veripress.model.toc import HtmlTocParser, MarkdownToc
 
 
 def html_same(html1, html2):
@@ -76,3 +82,154 @@ def test_toc_parser():
     </ul>
     """
     assert html_same(parser.toc_html(depth=2, lowest_level=5), expected_toc_html)
+
+
+def test_toc_parser_void_tags():
+    parser = HtmlTocParser()
+    parser.feed('<p>a<br />b<img src="x.png" alt="x" /></p><hr /><h2>T<br/></h2>')
+    assert parser.html == '<p>a<br />b<img src="x.png" alt="x" /></p><hr />' \
+                          '<h2><a id="T" href="#T" class="anchor"></a>T<br /></h2>'
+
+
+def test_toc_parser_html_and_toc():
+    parser = HtmlTocParser()
+    parser.feed(html_example)
+    html, toc, toc_html = parser.html_and_toc(depth=2, lowest_level=5)
+    assert html == parser.html
+    assert toc == parser.toc(depth=2, lowest_level=5)
+    assert toc_html == parser.toc_html(depth=2, lowest_level=5)
+    assert HtmlTocParser.render_toc([]) == ''
+
+
+def make_toc_doc(n):
+    return ''.join('<h{0}>Header <em>{1}</em> &amp; 中文</h{0}>\n'
+                   '<p>paragraph {1} with a <a href="#">link</a>.</p>\n'
+                   .format(i % 6 + 1, i) for i in range(n))
+
+
+def test_toc_parser_linear():
+    # the HTML is buffered in parts (as many as the tags and data in it),
+    # which are joined once, and the TOC is computed once
+    parsers = {}
+    for n in (500, 2000):
+        parser = parsers[n] = HtmlTocParser()
+        parser.feed(make_toc_doc(n))
+    assert len(parsers[2000]._html_parts) == 4 * len(parsers[500]._html_parts)
+
+    parser = parsers[500]
+    toc_calls = []
+    toc = parser.toc
+    parser.toc = lambda **kwargs: toc_calls.append(kwargs) or toc(**kwargs)
+    html, toc, toc_html = parser.html_and_toc(depth=3, lowest_level=3)
+    assert len(toc_calls) == 1
+    assert parser._html_parts == [html]
+    assert parser.html is html
+    assert html.count('class="anchor"') == 500
+    assert len(toc) == 84  # <h1> headers
+
+
+@mark.skipif(not os.environ.get('VERIPRESS_BENCHMARK'), reason='set VERIPRESS_BENCHMARK to run benchmarks')
+def test_toc_parser_benchmark():
+    # the time should grow linearly with the number of headers
+    import timeit
+
+    def parse(doc):
+        parser = HtmlTocParser()
+        parser.feed(doc)
+        return parser.html_and_toc(depth=3, lowest_level=3)
+
+    doc_500, doc_2000 = make_toc_doc(500), make_toc_doc(2000)
+    t_500 = min(timeit.repeat(lambda: parse(doc_500), number=1, repeat=3))
+    t_2000 = min(timeit.repeat(lambda: parse(doc_2000), number=1, repeat=3))
+    assert t_2000 < t_500 * 10
+
+
+md_example = """
+###### a `very` small title
+
+# Title
+
+## Title
+
+#### Another title, **yes**!
+
+### 中文，标题 Title&
+
+a random paragraph...  
+&amp; &#60;
+
+<!-- comment -->
+
+> # Another-h1-1
+>
+> ##### a [very](http://example.com/?a=1&b=2 "small") \\*small\\* title
+"""
+
+
+def test_markdown_toc():
+    md_parser = get_parser('markdown')
+    toc = md_parser.parse_whole_toc(md_example)
+    assert isinstance(toc, MarkdownToc)
+    assert '<h1><a id="Title" href="#Title" class="anchor"></a>Title</h1>' in toc.html
+    assert '<h2><a id="Title_1" href="#Title_1" class="anchor"></a>Title</h2>' in toc.html
+
+    # the same as parsing the rendered HTML again
+    html_toc_parser = HtmlTocParser()
+    html_toc_parser.feed(md_parser.parse_whole(md_example))
+    assert toc.toc() == html_toc_parser.toc()
+    assert toc.toc()[2]['children'][0]['id'] == 'a-very-small-title_1'
+    for depth, lowest_level in ((6, 6), (2, 5), (1, 1), (0, 3)):
+        assert toc.html_and_toc(depth, lowest_level)[1:] == \
+            html_toc_parser.html_and_toc(depth, lowest_level)[1:]
+
+    # headers in raw HTML are only found in the rendered HTML
+    toc = md_parser.parse_whole_toc('<h2>Raw</h2>\n\n## Markdown\n\n<!-- more -->\n\ntext\n\n<!-- more -->')
+    assert isinstance(toc, HtmlTocParser)
+    assert [item['id'] for item in toc.toc()] == ['Raw', 'Markdown']
+    assert '<!-- more -->' in toc.html
+
+    toc = get_parser('txt').parse_whole_toc('# not a header')
+    assert isinstance(toc, HtmlTocParser)
+    assert toc.toc() == []
+
+
+def test_parse_whole_with_toc():
+    md_parser = get_parser('markdown')
+    with app.test_request_context('/'):
+        html, toc, toc_html = parse_whole_with_toc(md_parser, md_example)
+        assert 'class="anchor"' in html
+        assert [item['id'] for item in toc] == ['Title', 'Another-h1-1']
+        assert toc_html
+
+        app.config['SHOW_TOC'] = False
+        try:
+            assert parse_whole_with_toc(md_parser, md_example) == \
+                (md_parser.parse_whole(md_example), None, None)
+        finally:
+            app.config['SHOW_TOC'] = True
+
+
+def test_parse_whole_with_toc_cache(monkeypatch):
+    md_parser = get_parser('markdown')
+    raw_content = md_example + '\n\n## Cache test'
+    calls = []
+    parse_whole_toc = md_parser.parse_whole_toc
+    monkeypatch.setattr(md_parser, 'parse_whole_toc',
+                        lambda raw: calls.append(raw) or parse_whole_toc(raw))
+
+    render_cache.clear()
+    with app.test_request_context('/'):
+        result = parse_whole_with_toc(md_parser, raw_content)
+        assert parse_whole_with_toc(md_parser, raw_content) is result
+        assert len(calls) == 1
+
+        # the TOC config is a part of the cache key
+        depth = app.config['TOC_DEPTH']
+        app.config['TOC_DEPTH'] = 1
+        try:
+            result2 = parse_whole_with_toc(md_parser, raw_content)
+        finally:
+            app.config['TOC_DEPTH'] = depth
+        assert len(calls) == 2
+        assert result2[0] == result[0] and result2[1] != result[1]
+        assert all(not item['children'] for item in result2[1])
@@ -0,0 +1,110 @@
+import os
+import time
+import shutil
+import tempfile
+
+from pytest import mark, skip
+
+from veripress.model.indexes import FileIndex
+from veripress.model.watcher import (
+    Watcher, PollingWatcher, InotifyWatcher, create_watcher
+)
+
+
+def write_file(path, content):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def wait_for(predicate, timeout=3.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return predicate()
+
+
+def titles(index):
+    return {e.rel_path: e.meta.get('title') for e in index.entries()}
+
+
+def test_create_watcher():
+    watcher = create_watcher([], interval=0.5)
+    assert isinstance(watcher, Watcher)
+    if not InotifyWatcher.available():
+        assert isinstance(watcher, PollingWatcher)
+        assert watcher.interval == 0.5
+
+
+@mark.parametrize('watcher_class', [PollingWatcher, InotifyWatcher])
+def test_watcher(watcher_class):
+    if watcher_class is InotifyWatcher and not InotifyWatcher.available():
+        skip('inotify is not available')
+
+    with tempfile.TemporaryDirectory() as root:
+        pages_dir = os.path.join(root, 'pages')
+        os.mkdir(pages_dir)
+        write_file(os.path.join(pages_dir, 'a.md'), '---\ntitle: A\n---\n\nAAA')
+        index = FileIndex(pages_dir, os.path.join(root, '_cache', 'pages.index'),
+                          recursive=True)
+
+        if watcher_class is PollingWatcher:
+            watcher = PollingWatcher([index], interval=0.1)
+        else:
+            watcher = InotifyWatcher([index], timeout=0.1)
+        watcher.start()
+        try:
+            assert watcher.running
+            assert index.watched
+            assert titles(index) == {'a.md': 'A'}
+            signature = index.signature
+
+            # add
+            write_file(os.path.join(pages_dir, 'b.md'), '---\ntitle: B\n---\n\nBBB')
+            assert wait_for(lambda: 'b.md' in titles(index))
+            assert index.signature != signature
+            assert index.read_body(index.get('b.md')) == 'BBB'
+
+            # modify
+            write_file(os.path.join(pages_dir, 'b.md'), '---\ntitle: B2\n---\n\nBBBB')
+            assert wait_for(lambda: titles(index).get('b.md') == 'B2')
+            assert index.read_body(index.find('b')) == 'BBBB'
+
+            # links are created without being opened for writing
+            os.symlink(os.path.join(pages_dir, 'b.md'), os.path.join(pages_dir, 'l.md'))
+            assert wait_for(lambda: titles(index).get('l.md') == 'B2')
+            os.link(os.path.join(pages_dir, 'b.md'), os.path.join(pages_dir, 'h.md'))
+            assert wait_for(lambda: titles(index).get('h.md') == 'B2')
+            os.remove(os.path.join(pages_dir, 'l.md'))
+            os.remove(os.path.join(pages_dir, 'h.md'))
+            assert wait_for(lambda: set(titles(index)) == {'a.md', 'b.md'})
+
+            # bodies of removed files are not kept
+            write_file(os.path.join(pages_dir, 'tmp.md'), 'TMP')
+            assert wait_for(lambda: 'tmp.md' in titles(index))
+            assert index.read_body(index.get('tmp.md')) == 'TMP'
+            os.remove(os.path.join(pages_dir, 'tmp.md'))
+            assert wait_for(lambda: 'tmp.md' not in titles(index))
+            index.rescan()
+            assert set(index._bodies) <= {'a.md', 'b.md'}
+
+            # add in a new subdirectory
+            os.makedirs(os.path.join(pages_dir, 'x', 'y'))
+            write_file(os.path.join(pages_dir, 'x', 'y', 'c.md'), 'CCC')
+            assert wait_for(lambda: 'x/y/c.md' in titles(index))
+
+            # delete
+            os.remove(os.path.join(pages_dir, 'a.md'))
+            shutil.rmtree(os.path.join(pages_dir, 'x'))
+            assert wait_for(lambda: titles(index) == {'b.md': 'B2'})
+            assert index.get('a.md') is None
+        finally:
+            watcher.stop()
+        assert not watcher.running
+        assert not index.watched
+
+        # the index scans on its own again after the watcher stopped
+        write_file(os.path.join(pages_dir, 'd.md'), 'DDD')
+        index.refresh()
+        assert set(titles(index)) == {'b.md', 'd.md'}
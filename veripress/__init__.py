@@ -51,7 +51,14 @@ def create_app(config_filename, instance_path=None):
                             TOC_DEPTH=3,
                             TOC_LOWEST_LEVEL=3,
                             ALLOW_SEARCH_PAGES=True,
-                            PAGE_SOURCE_ACCESSIBLE=False))
+                            PAGE_SOURCE_ACCESSIBLE=False,
+                            CACHE_FOLDER='_cache',
+                            RENDER_CACHE_SIZE=1024,
+                            RENDER_CACHE_ON_DISK=False,
+                            RENDER_CACHE_DISK_SIZE=10000,
+                            LOAD_WORKERS=1,
+                            CONTENT_CHECK_INTERVAL=2,
+                            SQLITE_DATABASE='veripress.db'))
     app_.config.from_pyfile(config_filename, silent=True)
 
     theme_folder = os.path.join(app_.instance_path,
@@ -1,18 +1,55 @@
 import re
-from itertools import islice
-from datetime import date
+import json
+import base64
+from datetime import date, datetime
 
-from flask import request, send_file
+from flask import request, send_file, jsonify
 
 from veripress import site, cache
 from veripress.api import ApiException, Error
 from veripress.model import storage
-from veripress.model.models import Base
+from veripress.model.storages import generation_cache_name
 from veripress.model.parsers import get_parser
-from veripress.helpers import validate_custom_page_path, parse_toc
+from veripress.helpers import (
+    validate_custom_page_path, parse_whole_with_toc
+)
 
 
-@cache.memoize(timeout=5 * 60)
+_cursor_datetime_format = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def encode_cursor(*values):
+    """
+    Encode values (of JSON types) to an opaque cursor token,
+    which is given to API users to get the next page.
+    """
+    return base64.urlsafe_b64encode(
+        json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, *types):
+    """
+    Decode a cursor token returned by 'encode_cursor'.
+
+    :param token: cursor token
+    :param types: expected types of the values
+    :return: a list of values
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(
+            token + '=' * (-len(token) % 4)).decode('utf-8'))
+        if not isinstance(values, list) or len(values) != len(types) \
+                or not all(isinstance(v, t) for v, t in zip(values, types)):
+            raise ValueError
+        return values
+    except (ValueError, TypeError):
+        raise ApiException(
+            message='The "cursor" argument is invalid.',
+            error=Error.INVALID_ARGUMENTS
+        )
+
+
+@cache.memoize(timeout=0)
 def site_info():
     return site
 
@@ -22,7 +59,8 @@ def posts(year: int = None, month: int = None, day: int = None,
     args = {k: [x.strip() for x in v.split(',')]
             for k, v in request.args.items()}
 
-    for key in ('include_draft', 'start', 'count'):
+    for key in ('include_draft', 'rel_url_prefix', 'start', 'count',
+                'cursor'):
         # pop out items that should not be passed into the 'get_posts' method
         # as 'limits'
         args.pop(key, None)
@@ -46,9 +84,6 @@ def posts(year: int = None, month: int = None, day: int = None,
                     error=Error.INVALID_ARGUMENTS
                 )
 
-    # get the post list here
-    result_posts = storage.get_posts_with_limits(include_draft=False, **args)
-
     return_single_item = False
     rel_url_prefix = ''
     if year is not None:
@@ -62,26 +97,46 @@ def posts(year: int = None, month: int = None, day: int = None,
         # if a full relative url is given, we return just ONE post,
         # instead of a list
         return_single_item = True
-    result_posts = filter(lambda p: p.rel_url.startswith(rel_url_prefix),
-                          result_posts)
 
     start = request.args.get('start', '')
     start = int(start) if start.isdigit() else 0
     count = request.args.get('count', '')
-    count = int(count) if count.isdigit() else -1
+    count = int(count) if count.isdigit() else None
+    after = None
+    if request.args.get('cursor'):
+        created, unique_key = decode_cursor(
+            request.args['cursor'], str, str)
+        try:
+            after = (datetime.strptime(created, _cursor_datetime_format),
+                     unique_key)
+        except ValueError:
+            raise ApiException(message='The "cursor" argument is invalid.',
+                               error=Error.INVALID_ARGUMENTS)
+
+    # get the page of the post list here,
+    # with an additional one to check if there is more
+    result_posts, total = storage.get_posts_page(
+        include_draft=False, offset=start,
+        limit=count + 1 if count is not None else None, after=after,
+        rel_url_prefix=rel_url_prefix, **args)
+    next_cursor = None
+    if count is not None and len(result_posts) > count:
+        result_posts = result_posts[:count]
+        if result_posts:
+            last = result_posts[-1]
+            next_cursor = encode_cursor(
+                last.created.strftime(_cursor_datetime_format),
+                last.unique_key)
 
     result_posts_list = []
-    for post in islice(
-            result_posts, start, start + count if count >= 0 else None):
+    for post in result_posts:
         parser = get_parser(post.format)
-        post_d = post.to_dict()
-        del post_d['raw_content']
+        post_d = post.to_dict(exclude=('raw_content',))
         if return_single_item:
             # if a certain ONE post is needed,
             # we parse all content instead of preview
-            post_d['content'] = parser.parse_whole(post.raw_content)
             post_d['content'], post_d['toc'], post_d['toc_html'] = \
-                parse_toc(post_d['content'])
+                parse_whole_with_toc(parser, post.raw_content)
         else:
             # a list of posts is needed, we parse only previews
             post_d['preview'], post_d['has_more_content'] = \
@@ -96,10 +151,16 @@ def posts(year: int = None, month: int = None, day: int = None,
                     post_d[key] = full_post_d[key]
         result_posts_list.append(post_d)
 
-    if result_posts_list and return_single_item:
+    if not result_posts_list:
+        return None
+    if return_single_item:
         return result_posts_list[0]
-    else:
-        return result_posts_list if result_posts_list else None
+    response = jsonify(result_posts_list)
+    # total count of posts that match the limits, regardless of the page
+    response.headers['X-Total-Count'] = str(total)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 
 def tags():
@@ -132,30 +193,29 @@ def pages(page_path):
             message='The path "{}" cannot be recognized.'.format(page_path)
         )
     else:
-        page_d = cache.get('api-handler.' + rel_url)
+        page_d = cache.get(generation_cache_name('api-handler.' + rel_url))
         if page_d is not None:
             return page_d  # pragma: no cover, here just get the cached dict
 
         page = storage.get_page(rel_url, include_draft=False)
         if page is None:
             raise ApiException(error=Error.RESOURCE_NOT_EXISTS)
-        page_d = page.to_dict()
-        del page_d['raw_content']
+        page_d = page.to_dict(exclude=('raw_content',))
         page_d['content'] = get_parser(
             page.format).parse_whole(page.raw_content)
 
-        cache.set('api-handler.' + rel_url, page_d, timeout=2 * 60)
+        cache.set(generation_cache_name('api-handler.' + rel_url), page_d)
         return page_d
 
 
-@cache.cached(timeout=2 * 60)
+@cache.cached(key_prefix=lambda: generation_cache_name(
+    'view/' + request.path))
 def widgets():
     result_widgets = storage.get_widgets(
         position=request.args.get('position'), include_draft=False)
     result = []
     for widget in result_widgets:
-        widget_d = widget.to_dict()
-        del widget_d['raw_content']
+        widget_d = widget.to_dict(exclude=('raw_content',))
         widget_d['content'] = get_parser(
             widget.format).parse_whole(widget.raw_content)
         result.append(widget_d)
@@ -173,13 +233,31 @@ def search():
     start = request.args.get('start', '')
     start = int(start) if start.isdigit() else 0
     count = request.args.get('count', '')
-    count = int(count) if count.isdigit() else -1
+    count = int(count) if count.isdigit() else None
+    after = None
+    if request.args.get('cursor'):
+        after = decode_cursor(request.args['cursor'], (int, float), str)
 
-    def remove_raw_content_field(p):
-        del p['raw_content']
-        return p
+    def convert_to_dict(item):
+        p_d = item[1].to_dict(exclude=('raw_content',))
+        p_d['snippet'] = storage.make_search_snippet(p_d['unique_key'], query)
+        return p_d
 
-    result = list(islice(map(remove_raw_content_field,
-                             map(Base.to_dict, storage.search_for(query))),
-                         start, start + count if count >= 0 else None))
-    return result if result else None
+    # with an additional one to check if there is more
+    result, total = storage.search_page(
+        query, offset=start, limit=count + 1 if count is not None else None,
+        after=after)
+    next_cursor = None
+    if count is not None and len(result) > count:
+        result = result[:count]
+        if result:
+            score, last = result[-1]
+            next_cursor = encode_cursor(score, last.unique_key)
+    if not result:
+        return None
+
+    response = jsonify(list(map(convert_to_dict, result)))
+    response.headers['X-Total-Count'] = str(total)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
@@ -52,8 +52,7 @@ def to_datetime(date_or_datetime):
     if isinstance(date_or_datetime, date) and \
             not isinstance(date_or_datetime, datetime):
         d = date_or_datetime
-        return datetime.strptime(
-            '%04d-%02d-%02d' % (d.year, d.month, d.day), '%Y-%m-%d')
+        return datetime(d.year, d.month, d.day)
     return date_or_datetime
 
 
@@ -140,6 +139,36 @@ def validate_custom_page_path(path):
     return True
 
 
+class _DirEntry(object):
+    """Substitute of 'os.DirEntry', used by 'scandir' on Python 3.4."""
+
+    __slots__ = ('name', 'path')
+
+    def __init__(self, dir_path, name):
+        self.name = name
+        self.path = os.path.join(dir_path, name)
+
+    def is_dir(self):
+        return os.path.isdir(self.path)
+
+    def stat(self):
+        return os.stat(self.path)
+
+
+def scandir(dir_path):
+    """
+    Iterate over entries of a directory with 'os.scandir',
+    which reuses file types (and stats on Windows) returned by the system,
+    or with 'os.listdir' if it's not available (before Python 3.5).
+
+    :param dir_path: directory path
+    :return: an iterator of 'os.DirEntry' (like) objects
+    """
+    if hasattr(os, 'scandir'):
+        return os.scandir(dir_path)
+    return (_DirEntry(dir_path, name) for name in os.listdir(dir_path))
+
+
 def traverse_directory(dir_path, yield_dir=False):
     """
     Traverse through a directory recursively.
@@ -151,9 +180,9 @@ def traverse_directory(dir_path, yield_dir=False):
     if not os.path.isdir(dir_path):
         return
 
-    for item in os.listdir(dir_path):
-        new_path = os.path.join(dir_path, item)
-        if os.path.isdir(new_path):
+    for entry in scandir(dir_path):
+        new_path = os.path.join(dir_path, entry.name)
+        if entry.is_dir():
             if yield_dir:
                 yield new_path + os.path.sep
             yield from traverse_directory(new_path, yield_dir)
@@ -161,6 +190,35 @@ def traverse_directory(dir_path, yield_dir=False):
             yield new_path
 
 
+def parse_whole_with_toc(parser, raw_content):
+    """
+    Parse the whole content of a post or page,
+    with its TOC if the SHOW_TOC config is true.
+
+    Parsers may collect the TOC while parsing (e.g. Markdown),
+    instead of parsing the HTML content again as 'parse_toc' does.
+    The result is cached in the render cache, by the raw content,
+    the parser and the TOC config.
+
+    :param parser: parser of the content format
+    :param raw_content: raw content
+    :return: tuple(processed HTML, toc list, toc HTML unordered list)
+    """
+    from flask import current_app
+    from veripress.model.parsers import render_cache
+
+    if current_app.config['SHOW_TOC']:
+        depth = current_app.config['TOC_DEPTH']
+        lowest_level = current_app.config['TOC_LOWEST_LEVEL']
+        return render_cache.get_or_render(
+            parser.cache_token,
+            'whole-toc:{}:{}'.format(depth, lowest_level), raw_content,
+            lambda: parser.parse_whole_toc(raw_content).html_and_toc(
+                depth=depth, lowest_level=lowest_level))
+    else:
+        return parser.parse_whole(raw_content), None, None
+
+
 def parse_toc(html_content):
     """
     Parse TOC of HTML content if the SHOW_TOC config is true.
@@ -174,12 +232,8 @@ def parse_toc(html_content):
     if current_app.config['SHOW_TOC']:
         toc_parser = HtmlTocParser()
         toc_parser.feed(html_content)
-        toc_html = toc_parser.toc_html(
-            depth=current_app.config['TOC_DEPTH'],
-            lowest_level=current_app.config['TOC_LOWEST_LEVEL'])
-        toc = toc_parser.toc(
+        return toc_parser.html_and_toc(
             depth=current_app.config['TOC_DEPTH'],
             lowest_level=current_app.config['TOC_LOWEST_LEVEL'])
-        return toc_parser.html, toc, toc_html
     else:
         return html_content, None, None
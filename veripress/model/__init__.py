@@ -1,3 +1,4 @@
+import os
 from datetime import datetime
 
 from flask import current_app, g
@@ -5,6 +6,7 @@ from werkzeug.local import LocalProxy
 
 import veripress.model.storages
 from veripress.model.models import Base
+from veripress.model.parsers import render_cache
 from veripress.helpers import ConfigurationError
 
 
@@ -21,6 +23,8 @@ def get_storage():
         storage_type = current_app.config['STORAGE_TYPE']
         if storage_type == 'file':
             storage_ = g._storage = storages.FileStorage()
+        elif storage_type == 'sqlite':
+            storage_ = g._storage = storages.SqliteStorage()
         else:
             raise ConfigurationError(
                 'Storage type "{}" is not supported.'.format(storage_type))
@@ -31,6 +35,12 @@ storage = LocalProxy(get_storage)
 
 from veripress import app
 
+render_cache.max_entries = app.config['RENDER_CACHE_SIZE']
+render_cache.max_files = app.config['RENDER_CACHE_DISK_SIZE']
+if app.config['RENDER_CACHE_ON_DISK']:
+    render_cache.folder = os.path.join(
+        app.instance_path, app.config['CACHE_FOLDER'], 'render')
+
 
 @app.teardown_appcontext
 def teardown_storage(e):
@@ -43,6 +53,16 @@ def teardown_storage(e):
         storage_.close()
 
 
+@app.teardown_request
+def teardown_content_generation(e):
+    """
+    Automatically called when Flask tears down the request context.
+    This will forget the content generation token of the current request,
+    so that the next request checks the content again.
+    """
+    g.pop('_content_generation', None)
+
+
 class CustomJSONEncoder(app.json_encoder):
     """
     Converts model objects to dicts, datetime to timestamp,
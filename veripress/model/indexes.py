@@ -0,0 +1,800 @@
+import os
+import re
+import stat
+import pickle
+import hashlib
+import time
+import tempfile
+import threading
+from bisect import insort
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+from yaml.nodes import ScalarNode
+from yaml.resolver import Resolver
+from yaml.constructor import SafeConstructor
+
+from veripress.model.parsers import get_standard_format_name
+from veripress.helpers import scandir
+
+try:
+    # the C loader based on libyaml, which is much faster
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+
+def _translate_newlines(text):
+    """Translate '\\r\\n' and '\\r' to '\\n', like universal newlines mode."""
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+def split_front_matter(raw_text):
+    """
+    Split the yaml head (front matter) out of a content file.
+
+    The returned offset is the position where the raw body begins,
+    and the body itself should be stripped before use.
+
+    :param raw_text: content of the file, decoded but with newlines untouched
+    :return: tuple(yaml head string or None, char offset of the body)
+    """
+    start = len(raw_text) - len(raw_text.lstrip())
+    if raw_text.startswith('---', start):
+        # may has yaml meta info, so we try to split it out
+        meta_start = start
+        while meta_start < len(raw_text) and raw_text[meta_start] == '-':
+            meta_start += 1
+        m = re.compile(r'-{3,}').search(raw_text, meta_start)
+        if m:
+            # do have yaml meta info
+            return raw_text[meta_start:m.start()], m.end()
+    return None, 0
+
+
+# plain scalars (and keys) that the flat parser accepts,
+# which don't begin with an indicator or contain ': ' or ' #'
+_plain_exp = re.compile(
+    r'[^\s\-?:,\[\]{}#&*!|>\'"%@`](?:[^:#]|:(?=\S)|(?<=\S)#)*?')
+_flat_line_exp = re.compile(
+    r'(?P<key>{0}):(?:[ \t]+(?P<value>.*?))?[ \t]*'.format(
+        _plain_exp.pattern))
+# items of a flow sequence, e.g. '[a, b]', that the flat parser accepts
+_flow_item_exp = re.compile(r'[^\s\-?:,\[\]{}#&*!|>\'"%@`][^:,\[\]{}#]*')
+_resolver = Resolver()
+_constructor = SafeConstructor()
+_str_tag = 'tag:yaml.org,2002:str'
+
+
+class _NotFlat(Exception):
+    pass
+
+
+def _construct_plain(value, str_only=False):
+    """Resolve the type of a plain scalar and construct it, as yaml does."""
+    tag = _resolver.resolve(ScalarNode, value, (True, False))
+    construct = _constructor.yaml_constructors.get(tag)
+    if construct is None or str_only and tag != _str_tag:
+        # e.g. '<<' or '=', or 'yes' as a key
+        raise _NotFlat
+    try:
+        return construct(_constructor, ScalarNode(tag, value))
+    except Exception:
+        # e.g. an invalid date, let the yaml loader raise the error
+        raise _NotFlat
+
+
+def _parse_flat_yaml(yaml_str):
+    """
+    Parse a yaml mapping of simple 'key: value' lines, e.g.
+    'title: Hello', 'tags: [A, B]', 'created: 2017-03-20', 'is_draft: yes'
+    without going through the yaml parser.
+
+    Values may be plain scalars (whose types are resolved as yaml does),
+    quoted strings without escapes, or flow sequences of plain scalars.
+
+    :param yaml_str: yaml string
+    :return: a dict, or None if the yaml is not that simple
+    """
+    try:
+        result = {}
+        for line in yaml_str.split('\n'):
+            if not line.strip(' ') or line.startswith('#'):
+                # only lines of spaces are blank, yaml doesn't accept
+                # tabs or other whitespace (e.g. NBSP) on a blank line
+                continue
+            m = _flat_line_exp.fullmatch(line)
+            if m is None or not line.isprintable() \
+                    or m.group('key')[-1].isspace():
+                return None
+            key = _construct_plain(m.group('key'), str_only=True)
+            result[key] = _parse_flat_value(m.group('value') or '')
+        return result or None
+    except _NotFlat:
+        return None
+
+
+def _parse_flat_value(value):
+    if not value:
+        return None
+    if value[0] == '[' and value[-1] == ']':
+        items = value[1:-1].split(',')
+        if len(items) == 1 and not items[0].strip():
+            return []
+        values = []
+        for item in items:
+            item = item.strip(' ')
+            if not _flow_item_exp.fullmatch(item):
+                raise _NotFlat
+            values.append(_construct_plain(item))
+        return values
+    if len(value) >= 2 and value[0] == value[-1] == "'" \
+            and "'" not in value[1:-1]:
+        return value[1:-1]
+    if len(value) >= 2 and value[0] == value[-1] == '"' \
+            and '"' not in value[1:-1] and '\\' not in value:
+        return value[1:-1]
+    if _plain_exp.fullmatch(value):
+        return _construct_plain(value)
+    raise _NotFlat
+
+
+def parse_front_matter(yaml_str):
+    """
+    Parse the yaml head (front matter) of a content file.
+
+    Simple front matter is parsed by a fast path,
+    which results in the same meta as the full yaml loader.
+
+    :param yaml_str: yaml string (with '\\n' as newlines)
+    :return: meta (usually a dict)
+    """
+    meta = _parse_flat_yaml(yaml_str)
+    if meta is None:
+        meta = yaml.load(yaml_str, Loader=_YamlLoader)
+    return meta
+
+
+# whitespace that 'bytes.strip' strips,
+# the same as what 'str.strip' strips in ASCII, except '\x1c' ~ '\x1f'
+_ascii_whitespace = b' \t\n\r\x0b\x0c'
+_closing_dashes_exp = re.compile(rb'-{3,}')
+
+
+def _decode(buffer, start, end):
+    """Decode a slice of bytes, copying it only once (into the str)."""
+    with memoryview(buffer) as view, view[start:end] as part:
+        return str(part, 'utf-8')
+
+
+def _locate_front_matter(buffer):
+    """
+    Locate the yaml head (front matter) of a content file in its bytes,
+    the same as 'split_front_matter' does in the decoded text.
+
+    :param buffer: bytes of the file
+    :return: tuple(start, end) of the yaml head or None,
+             byte offset of the body;
+             or None if the file begins with non-ASCII characters,
+             which may be whitespace that 'str.strip' strips
+    """
+    start = 0
+    while start < len(buffer) and buffer[start] in _ascii_whitespace:
+        start += 1
+    if start < len(buffer) and not 0x20 <= buffer[start] < 0x80:
+        return None
+    if buffer[start:start + 3] == b'---':
+        meta_start = start
+        while meta_start < len(buffer) and buffer[meta_start] == ord('-'):
+            meta_start += 1
+        m = _closing_dashes_exp.search(buffer, meta_start)
+        if m:
+            return (meta_start, m.start()), m.end()
+    return None, 0
+
+
+def _split_front_matter(buffer):
+    """
+    Split the yaml head out of the bytes of a content file,
+    decoding only the yaml head.
+
+    :param buffer: bytes of the file
+    :return: tuple(yaml head string or None, byte offset of the body)
+    """
+    located = _locate_front_matter(buffer)
+    if located is None:
+        raw_text = _decode(buffer, 0, len(buffer))
+        meta_str, body_start = split_front_matter(raw_text)
+        return meta_str, len(raw_text[:body_start].encode('utf-8'))
+    meta_range, offset = located
+    if meta_range is None:
+        return None, 0
+    return _decode(buffer, *meta_range), offset
+
+
+def _read_body(buffer, offset):
+    """Decode the raw body content, beginning at the given byte offset."""
+    start, end = offset, len(buffer)
+    while start < end and buffer[start] in _ascii_whitespace:
+        start += 1
+    while end > start and buffer[end - 1] in _ascii_whitespace:
+        end -= 1
+    raw_content = _decode(buffer, start, end)
+    if buffer.find(b'\r', start, end) >= 0:
+        raw_content = _translate_newlines(raw_content)
+    if raw_content and (raw_content[0].isspace()
+                        or raw_content[-1].isspace()):
+        # non-ASCII whitespace
+        raw_content = raw_content.strip()
+    return raw_content
+
+
+def read_meta(file_path):
+    """
+    Read yaml head of a file and locate the body.
+
+    :param file_path: file path
+    :return: tuple(meta, byte offset of the body, raw_content)
+    """
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    meta_str, offset = _split_front_matter(data)
+    raw_content = _read_body(data, offset)
+
+    if meta_str is None:
+        meta = {}
+    else:
+        meta = parse_front_matter(_translate_newlines(meta_str))
+    return meta, offset, raw_content
+
+
+def read_front_matter(file_path, chunk_size=4096):
+    """
+    Read only the yaml head of a file, stopping at the closing dashes,
+    so the body (which may be very long) is never read.
+
+    :param file_path: file path
+    :param chunk_size: bytes to read at a time
+    :return: tuple(meta, byte offset of the body)
+    """
+    data = bytearray()
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            data += chunk
+            head = data.lstrip(_ascii_whitespace)
+            if len(head) >= 3 and not head.startswith(b'---') \
+                    and 0x20 <= head[0] < 0x80:
+                # no yaml meta info
+                break
+            located = _locate_front_matter(data)
+            # the closing dashes may continue in the next chunk
+            if located is not None and located[0] is not None \
+                    and located[1] < len(data):
+                break
+    meta_str, offset = _split_front_matter(data)
+
+    if meta_str is None:
+        return {}, 0
+    meta = parse_front_matter(_translate_newlines(meta_str))
+    return meta, offset
+
+
+def read_body(file_path, offset, mtime=None, size=None):
+    """
+    Read raw body content of a file, beginning at the given byte offset.
+
+    :param file_path: file path
+    :param offset: byte offset of the body
+                   (returned by 'read_meta' or 'read_front_matter')
+    :param mtime: mtime (in nanoseconds) of the file when it was read
+    :param size: size of the file when it was read,
+                 if the file has changed since, the offset may be stale,
+                 so the body is located again
+    :return: raw_content
+    """
+    with open(file_path, 'rb') as f:
+        if mtime is not None or size is not None:
+            st = os.fstat(f.fileno())
+            if (mtime is not None and st.st_mtime_ns != mtime) \
+                    or (size is not None and st.st_size != size):
+                data = f.read()
+                return _read_body(data, _split_front_matter(data)[1])
+        f.seek(offset)
+        data = f.read()
+    return _read_body(data, 0)
+
+
+class IndexEntry(object):
+    """Index record of one content file."""
+
+    __slots__ = ('rel_path', 'format', 'meta', 'mtime', 'size', 'offset')
+
+    def __init__(self, rel_path, format_name, meta, mtime, size, offset):
+        # file path relative to the root of the index, with '/' as separator
+        self.rel_path = rel_path
+        self.format = format_name
+        self.meta = meta
+        # modification time (in ns) and size, to detect changes
+        self.mtime = mtime
+        self.size = size
+        # byte offset of the body in the file
+        self.offset = offset
+
+    def __getstate__(self):
+        return (self.rel_path, self.format, self.meta,
+                self.mtime, self.size, self.offset)
+
+    def __setstate__(self, state):
+        (self.rel_path, self.format, self.meta,
+         self.mtime, self.size, self.offset) = state
+
+
+class FileIndex(object):
+    """
+    Persistent metadata index of the content files in a directory.
+
+    Format, yaml meta, mtime, size and body offset of every file are saved
+    to an index file, so that only files whose mtime or size changed
+    need to be read and parsed again.
+
+    When the directory is watched (see 'veripress.model.watcher'),
+    the watcher applies changes to the index as they happen,
+    and the index serves everything, including bodies, from memory.
+
+    New and changed files found by a scan are read and parsed
+    in a pool of threads, e.g. when the index file is missing on a cold start.
+    """
+
+    # bump this when the layout of the index file changes
+    _version = 1
+
+    def __init__(self, root_path, index_file_path,
+                 recursive=False, filename_exp=None, workers=1):
+        """
+        :param root_path: directory to index
+        :param index_file_path: file path to persist the index
+        :param recursive: also index files in subdirectories or not
+        :param filename_exp: regular expression that the filename
+                             (without extension) should match
+        :param workers: number of threads to read files in,
+                        1 to read them in the calling thread
+        """
+        self.root_path = root_path
+        self.index_file_path = index_file_path
+        self.recursive = recursive
+        self.workers = workers
+        self._filename_exp = re.compile(filename_exp) \
+            if filename_exp is not None else None
+        # key: relative path, value: IndexEntry
+        self._entries = None
+        # key: relative path without extension,
+        # value: sorted list of relative paths of entries
+        self._stems = {}
+        self._dirty = False
+        # key: relative path of every file and subdirectory
+        # (with a trailing '/'), value: tuple(mtime, size)
+        self._stats = {}
+        self._signature = None
+        # key: relative path of the root directory ('') and subdirectories,
+        # value: mtime, as of the last scan
+        self._dir_mtimes = {}
+        # time.monotonic() of the last scan
+        self._scanned_at = None
+        # raw bodies kept in memory while the directory is watched
+        self._bodies = {}
+        self.watched = False
+        self._lock = threading.RLock()
+
+    def __reduce__(self):
+        # pickled as a reference to the shared index of the directory,
+        # e.g. within lazy body loaders of cached model objects
+        return _restore_file_index, (
+            self.root_path, self.index_file_path, self.recursive,
+            self._filename_exp.pattern
+            if self._filename_exp is not None else None, self.workers)
+
+    @property
+    def signature(self):
+        """
+        Digest of paths, mtimes and sizes of all files and subdirectories
+        in the directory, as of the last refresh or update.
+        """
+        with self._lock:
+            if self._signature is None:
+                self._signature = hashlib.md5(repr(
+                    sorted(self._stats.items())).encode('utf-8')).hexdigest()
+            return self._signature
+
+    def file_path(self, entry_or_rel_path):
+        """Get full path of an entry (or a relative path)."""
+        rel_path = getattr(entry_or_rel_path, 'rel_path', entry_or_rel_path)
+        return os.path.join(self.root_path, rel_path.replace('/', os.path.sep))
+
+    def read_body(self, entry):
+        """Read the raw body content of an entry."""
+        if not self.watched:
+            return read_body(self.file_path(entry), entry.offset,
+                             entry.mtime, entry.size)
+
+        version = (entry.mtime, entry.size, entry.offset)
+        with self._lock:
+            body = self._bodies.get(entry.rel_path)
+            if body is None or body[0] != version:
+                body = self._bodies[entry.rel_path] = \
+                    (version, read_body(self.file_path(entry), entry.offset,
+                                        entry.mtime, entry.size))
+            return body[1]
+
+    def refresh(self, interval=None):
+        """
+        Bring the index up to date with the directory,
+        unless it's watched, in which case it's always up to date.
+
+        Files added, removed or renamed change the mtime of their directory,
+        while files modified in place don't, so if an interval is given,
+        the directory is only scanned again when the mtime of it
+        (or of a subdirectory) changed, or the last scan is older than that.
+
+        :param interval: seconds to trust the last scan for
+        :return: the index changed or not
+        """
+        if self.watched:
+            return False
+        if interval is not None and self._scanned_at is not None \
+                and time.monotonic() - self._scanned_at < interval \
+                and not self._dirs_changed():
+            return False
+        return self.rescan()
+
+    def _dir_mtime(self, rel_dir):
+        try:
+            return os.stat(self.file_path(rel_dir)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _dirs_changed(self):
+        """Check if the mtime of any directory changed since the last scan."""
+        with self._lock:
+            dir_mtimes = list(self._dir_mtimes.items())
+        return any(self._dir_mtime(rel_dir) != mtime
+                   for rel_dir, mtime in dir_mtimes)
+
+    def rescan(self):
+        """
+        Scan the directory, re-reading files that are new
+        or have been changed, and remove files that no longer exist.
+
+        :return: the index changed or not
+        """
+        with self._lock:
+            if self._entries is None:
+                self._load()
+
+            changed = False
+            entries = {}
+            stats = {}
+            # taken before listing, so that changes during the scan
+            # are found by the next refresh
+            scanned_at = time.monotonic()
+            dir_mtimes = {'': self._dir_mtime('')}
+            # tuple(rel_path, stat) of new or changed files
+            to_read = []
+            for rel_path, st in self._scan():
+                stats[rel_path] = (st.st_mtime_ns, st.st_size)
+                if rel_path.endswith('/'):
+                    dir_mtimes[rel_path] = st.st_mtime_ns
+                    continue
+                if not self._accepts(rel_path):
+                    continue
+                entry = self._entries.get(rel_path)
+                if entry is None or entry.mtime != st.st_mtime_ns \
+                        or entry.size != st.st_size:
+                    to_read.append((rel_path, st))
+                    changed = True
+                # keep the order of the scan
+                entries[rel_path] = entry
+            for (rel_path, _), entry in zip(to_read,
+                                            self._read_entries(to_read)):
+                if entry is None:
+                    del entries[rel_path]
+                else:
+                    entries[rel_path] = entry
+            if len(entries) != len(self._entries):
+                # some files were removed
+                changed = True
+            if changed:
+                self._set_entries(entries)
+                # drop bodies of files that are removed
+                for rel_path in set(self._bodies) - set(entries):
+                    del self._bodies[rel_path]
+            if stats != self._stats:
+                self._stats = stats
+                self._signature = None
+            self._dir_mtimes = dir_mtimes
+            self._scanned_at = scanned_at
+
+            if changed or self._dirty:
+                self._save()
+            return changed
+
+    def update(self, rel_path):
+        """
+        Apply the change of a file (added, modified or deleted)
+        to the index, without scanning the whole directory.
+        Call 'flush' to save the index file after a batch of updates.
+
+        :param rel_path: file path relative to the root of the index
+        :return: the index changed or not
+        """
+        with self._lock:
+            if self._entries is None:
+                self._load()
+
+            try:
+                st = os.stat(self.file_path(rel_path))
+            except OSError:
+                st = None
+
+            if st is None:
+                self._stats.pop(rel_path, None)
+                entry = None
+            else:
+                self._stats[rel_path] = (st.st_mtime_ns, st.st_size)
+                entry = self._entries.get(rel_path)
+                if entry is None or entry.mtime != st.st_mtime_ns \
+                        or entry.size != st.st_size:
+                    entry = self._read_entry(rel_path, st)
+                else:
+                    return False
+            self._signature = None
+
+            if entry is None:
+                self._bodies.pop(rel_path, None)
+                if not self._remove_entry(rel_path):
+                    return False
+            else:
+                self._add_entry(entry)
+            self._dirty = True
+            return True
+
+    def flush(self):
+        """Save the index file if there are unsaved updates."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def entries(self):
+        """
+        Get all entries, refresh the index first if it's not loaded.
+
+        :return: a list of IndexEntry objects
+        """
+        with self._lock:
+            if self._entries is None:
+                self.rescan()
+            return list(self._entries.values())
+
+    def get(self, rel_path):
+        """
+        Get the entry of a file, which is checked against the file's
+        current mtime and size, and re-read if it's out of date.
+        If the directory is watched, the entry is returned from memory.
+
+        :param rel_path: file path relative to the root of the index
+        :return: an IndexEntry object, or None if the file doesn't exist
+        """
+        with self._lock:
+            if self._entries is None:
+                self._load()
+            if self.watched:
+                return self._entries.get(rel_path)
+
+            try:
+                st = os.stat(self.file_path(rel_path))
+            except OSError:
+                st = None
+
+            entry = self._entries.get(rel_path)
+            if st is None:
+                if self._remove_entry(rel_path):
+                    self._dirty = True
+                return None
+
+            if entry is None or entry.mtime != st.st_mtime_ns \
+                    or entry.size != st.st_size:
+                entry = self._read_entry(rel_path, st)
+                if entry is not None:
+                    self._add_entry(entry)
+                    self._dirty = True
+            return entry
+
+    def find(self, rel_stem):
+        """
+        Find the entry of a file by its relative path without extension,
+        which is a dict lookup. If several files have the same path
+        without extension, the one with the smallest relative path is found.
+
+        Files added since the last refresh or update are not found,
+        the entry found is checked as 'get' does.
+
+        :param rel_stem: file path relative to the root of the index,
+                         without extension
+        :return: an IndexEntry object, or None if not found
+        """
+        with self._lock:
+            if self._entries is None:
+                self.rescan()
+            for rel_path in list(self._stems.get(rel_stem, ())):
+                # files removed since the last refresh are skipped
+                entry = self.get(rel_path)
+                if entry is not None:
+                    return entry
+            return None
+
+    def _set_entries(self, entries):
+        self._entries = entries
+        self._stems = {}
+        for rel_path in sorted(entries):
+            self._stems.setdefault(
+                os.path.splitext(rel_path)[0], []).append(rel_path)
+
+    def _add_entry(self, entry):
+        rel_path = entry.rel_path
+        if rel_path not in self._entries:
+            insort(self._stems.setdefault(
+                os.path.splitext(rel_path)[0], []), rel_path)
+        self._entries[rel_path] = entry
+
+    def _remove_entry(self, rel_path):
+        """Remove an entry, return it existed or not."""
+        if self._entries.pop(rel_path, None) is None:
+            return False
+        stem = os.path.splitext(rel_path)[0]
+        rel_paths = self._stems[stem]
+        rel_paths.remove(rel_path)
+        if not rel_paths:
+            del self._stems[stem]
+        return True
+
+    def _accepts(self, rel_path):
+        """Check if a file should be indexed, return its format if so."""
+        filename, ext = os.path.splitext(rel_path.rsplit('/', 1)[-1])
+        if not ext or ext == '.':
+            return None
+        if self._filename_exp is not None \
+                and not self._filename_exp.match(filename):
+            return None
+        return get_standard_format_name(ext[1:])
+
+    def _scan(self):
+        """
+        Walk through the directory, yield (rel_path, stat) pairs
+        of all files and subdirectories (with a trailing '/').
+        """
+        if not os.path.isdir(self.root_path):
+            return
+
+        dirs = ['']
+        while dirs:
+            rel_dir = dirs.pop()
+            dir_path = os.path.join(self.root_path,
+                                    rel_dir.replace('/', os.path.sep))
+            for dir_entry in scandir(dir_path):
+                rel_path = rel_dir + dir_entry.name
+                try:
+                    st = dir_entry.stat()
+                except OSError:
+                    # removed after listing
+                    continue
+                if stat.S_ISDIR(st.st_mode):
+                    yield rel_path + '/', st
+                    if self.recursive:
+                        dirs.append(rel_path + '/')
+                    continue
+                yield rel_path, st
+
+    def _read_entries(self, to_read):
+        """
+        Read entries of files, in a pool of threads if there are many.
+
+        :param to_read: a list of tuple(rel_path, stat)
+        :return: an iterable of IndexEntry objects (or None)
+        """
+        if self.workers <= 1 or len(to_read) <= 1:
+            return [self._read_entry(rel_path, st) for rel_path, st in to_read]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(lambda args: self._read_entry(*args),
+                                     to_read))
+
+    def _read_entry(self, rel_path, st):
+        format_name = self._accepts(rel_path)
+        if format_name is None:
+            return None
+        meta, offset = read_front_matter(self.file_path(rel_path))
+        return IndexEntry(rel_path, format_name, meta or {},
+                          st.st_mtime_ns, st.st_size, offset)
+
+    def _load(self):
+        """Load the index file, or start with an empty index."""
+        entries = {}
+        try:
+            with open(self.index_file_path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') == self._version \
+                    and data.get('root_path') == self.root_path:
+                entries = data['entries']
+        except Exception:
+            # the index file doesn't exist or is broken,
+            # it will be rebuilt from the directory
+            pass
+        self._set_entries(entries)
+
+    def _save(self):
+        """Write the index to the index file atomically."""
+        data = {'version': self._version,
+                'root_path': self.root_path,
+                'entries': self._entries}
+        index_dir = os.path.dirname(self.index_file_path)
+        try:
+            os.makedirs(index_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=index_dir)
+        except OSError:
+            # the instance folder may be read-only,
+            # in which case the index just lives in memory
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.index_file_path)
+            self._dirty = False
+        except OSError:
+            pass
+        finally:
+            # left behind only if it was not moved into place
+            _remove_quietly(tmp_path)
+
+
+def _remove_quietly(file_path):
+    """Remove a file if it exists, ignoring errors."""
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
+
+def _restore_file_index(root_path, index_file_path, recursive, filename_exp,
+                        workers=1):
+    return get_file_index(root_path, index_file_path,
+                          recursive=recursive, filename_exp=filename_exp,
+                          workers=workers)
+
+
+_file_indexes = {}
+_file_indexes_lock = threading.Lock()
+
+
+def get_file_index(root_path, index_file_path, **kwargs):
+    """
+    Get the FileIndex object of a directory,
+    which is shared by all storage objects in the current process.
+    The number of workers of the shared index is updated
+    if another one is given.
+
+    :param root_path: directory to index
+    :param index_file_path: file path to persist the index
+    :param kwargs: other arguments passed to FileIndex
+    :return: a FileIndex object
+    """
+    with _file_indexes_lock:
+        index = _file_indexes.get(root_path)
+        if index is None or index.index_file_path != index_file_path:
+            index = _file_indexes[root_path] = \
+                FileIndex(root_path, index_file_path, **kwargs)
+        elif 'workers' in kwargs:
+            index.workers = kwargs['workers']
+        return index
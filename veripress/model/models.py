@@ -1,19 +1,140 @@
+import hashlib
 from datetime import datetime
 
 from veripress import site
 from veripress.helpers import to_list, to_datetime
 
 
+class _Meta(dict):
+    """
+    Dict of the yaml meta of a post/page/widget,
+    which counts its modifications, so that values derived from it
+    can be cached until it's modified.
+    """
+
+    __slots__ = ('version',)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.version += 1
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.version += 1
+
+    def clear(self):
+        super().clear()
+        self.version += 1
+
+    def pop(self, *args):
+        self.version += 1
+        return super().pop(*args)
+
+    def popitem(self):
+        self.version += 1
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self.version += 1
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.version += 1
+
+
 class Base(object):
     """
     Base model class, contains basic/general information of a post/page/widget.
+
+    Values derived from 'meta' (and other attributes) are computed when
+    they are accessed for the first time, and cached until the sources change.
     """
 
+    __slots__ = ('_meta', '_raw_content', '_raw_content_loader',
+                 '_raw_content_version', '_format',
+                 '_derived', '_derived_version')
+
     def __init__(self):
         self.meta = {}
-        self.raw_content = None
+        self._raw_content = None
+        self._raw_content_loader = None
+        self._raw_content_version = None
         self._format = None
 
+    @property
+    def meta(self):
+        return self._meta
+
+    @meta.setter
+    def meta(self, value):
+        self._meta = value if isinstance(value, _Meta) else _Meta(value)
+        self._clear_derived()
+
+    def _clear_derived(self):
+        # key: name, value: derived value
+        self._derived = {}
+        self._derived_version = self._meta.version
+
+    def _get_derived(self, name, compute):
+        """
+        Get a derived value from the cache, or compute and cache it.
+
+        :param name: name of the value
+        :param compute: function to compute the value
+        :return: the value
+        """
+        if self._derived_version != self._meta.version:
+            self._clear_derived()
+        try:
+            return self._derived[name]
+        except KeyError:
+            value = self._derived[name] = compute()
+            return value
+
+    @property
+    def raw_content(self):
+        if self._raw_content_loader is not None:
+            self._raw_content = self._raw_content_loader()
+            self._raw_content_loader = None
+        return self._raw_content
+
+    @raw_content.setter
+    def raw_content(self, value):
+        self._raw_content = value
+        self._raw_content_loader = None
+        self._raw_content_version = None
+
+    def defer_raw_content(self, loader, version=None):
+        """
+        Load 'raw_content' lazily, when it's accessed for the first time.
+
+        :param loader: a callable (picklable, for the object may be cached)
+                       that returns the raw content
+        :param version: something that changes when the raw content changes,
+                        e.g. mtime and size of the file
+        """
+        self._raw_content = None
+        self._raw_content_loader = loader
+        self._raw_content_version = version
+
+    def raw_content_version(self):
+        """
+        Get something that changes when 'raw_content' changes,
+        without loading the raw content if possible.
+        """
+        if self._raw_content_version is None:
+            return hashlib.sha1(
+                (self.raw_content or '').encode('utf-8')).hexdigest()
+        return self._raw_content_version
+
     @property
     def format(self):
         return self._format
@@ -27,13 +148,38 @@ class Base(object):
     def is_draft(self):
         return self.meta.get('is_draft', False)
 
-    def to_dict(self):
+    @classmethod
+    def serializable_fields(cls):
+        """
+        Get names of public attributes and properties of the class,
+        which are collected once per class.
+        """
+        fields = cls.__dict__.get('_serializable_fields')
+        if fields is None:
+            fields = tuple(filter(
+                lambda k: not k.startswith('_') and not callable(
+                    getattr(cls, k, None)), dir(cls)))
+            cls._serializable_fields = fields
+        return fields
+
+    def to_dict(self, fields=None, exclude=None):
         """
         Convert attributes and properties to a dict,
         so that it can be serialized.
+
+        Fields that are not needed are not even computed,
+        e.g. 'raw_content' is not loaded if it's excluded.
+
+        :param fields: names of fields to include, None for all
+        :param exclude: names of fields to exclude
+        :return: a dict
         """
-        return {k: getattr(self, k) for k in filter(
-            lambda k: not k.startswith('_') and k != 'to_dict', dir(self))}
+        names = self.serializable_fields()
+        if fields is not None:
+            names = [k for k in names if k in fields]
+        if exclude:
+            names = [k for k in names if k not in exclude]
+        return {k: getattr(self, k) for k in names}
 
     def __eq__(self, other):
         if isinstance(other, Base):
@@ -44,6 +190,8 @@ class Base(object):
 class AuthorMixIn(object):
     """Mix in author's name and email."""
 
+    __slots__ = ()
+
     @property
     def author(self):
         return getattr(self, 'meta', {}).get('author', site.get('author'))
@@ -56,26 +204,36 @@ class AuthorMixIn(object):
 class DateMixIn(object):
     """Mix in created data and updated date."""
 
+    __slots__ = ()
+
     @property
     def created(self):
-        return to_datetime(getattr(self, 'meta', {}).get('created'))
+        return self._get_derived('created', self._get_created)
+
+    def _get_created(self):
+        return to_datetime(self.meta.get('created'))
 
     @property
     def updated(self):
-        return to_datetime(getattr(self, 'meta', {}).get('updated',
-                                                         self.created))
+        return self._get_derived(
+            'updated',
+            lambda: to_datetime(self.meta.get('updated', self.created)))
 
 
 class TagCategoryMixIn(object):
     """Mix in tags and categories."""
 
+    __slots__ = ()
+
     @property
     def tags(self):
-        return to_list(getattr(self, 'meta', {}).get('tags', []))
+        return self._get_derived(
+            'tags', lambda: to_list(self.meta.get('tags', [])))
 
     @property
     def categories(self):
-        return to_list(getattr(self, 'meta', {}).get('categories', []))
+        return self._get_derived(
+            'categories', lambda: to_list(self.meta.get('categories', [])))
 
 
 class Page(Base, AuthorMixIn, DateMixIn):
@@ -83,6 +241,8 @@ class Page(Base, AuthorMixIn, DateMixIn):
     Model class of publish type 'custom page' or 'page',
     with default layout 'page'.
     """
+    __slots__ = ('unique_key', '_rel_url')
+
     _default_layout = 'page'
 
     def __init__(self):
@@ -90,12 +250,26 @@ class Page(Base, AuthorMixIn, DateMixIn):
         self.unique_key = None
         self.rel_url = None
 
+    @property
+    def rel_url(self):
+        return self._rel_url
+
+    @rel_url.setter
+    def rel_url(self, value):
+        self._rel_url = value
+        # titles and dates may be derived from the relative url
+        self._clear_derived()
+
     @property
     def layout(self):
-        return self.meta.get('layout', self._default_layout)
+        return self._get_derived(
+            'layout', lambda: self.meta.get('layout', self._default_layout))
 
     @property
     def title(self):
+        return self._get_derived('title', self._get_title)
+
+    def _get_title(self):
         result = self.meta.get('title')
         if result is None and self.rel_url:
             sp = self.rel_url.split('/')
@@ -114,18 +288,19 @@ class Post(Page, TagCategoryMixIn):
     """
     Model class of publish type 'post', with default layout 'post'.
     """
+    __slots__ = ()
+
     _default_layout = 'post'
 
-    @property
-    def created(self):
-        result = super(Post, self).created
+    def _get_created(self):
+        result = super(Post, self)._get_created()
         if result is None:
             d, _, _ = self.rel_url.rsplit('/', 2)
-            result = datetime.strptime(d, '%Y/%m/%d')
+            year, month, day = d.split('/')
+            result = datetime(int(year), int(month), int(day))
         return result
 
-    @property
-    def title(self):
+    def _get_title(self):
         result = self.meta.get('title')
         if result is None:
             _, post_name, _ = self.rel_url.rsplit('/', 2)
@@ -139,6 +314,8 @@ class Widget(Base):
     Model class of publish type 'widget'.
     """
 
+    __slots__ = ()
+
     @property
     def position(self):
         return self.meta.get('position')
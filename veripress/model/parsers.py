@@ -1,9 +1,207 @@
+import os
 import re
-from functools import partial
+import pickle
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import wraps
 
 import markdown
 
-from veripress.helpers import to_list
+from veripress.helpers import to_list, scandir
+from veripress.model.toc import HtmlTocParser, MarkdownTocExtension
+
+
+class RenderCache(object):
+    """
+    Cache of rendered contents, keyed by digest of the parser's cache token,
+    the kind of rendering (whole or preview) and the raw content.
+
+    Recently used results are kept in memory (bounded LRU),
+    and if a folder is given, results are also saved there,
+    so that they survive restarts. When there are more than 'max_files'
+    files in the folder, the least recently used ones are removed.
+    """
+
+    _missing = object()
+    # fraction of 'max_files' that the folder is pruned to
+    _prune_ratio = 0.75
+
+    def __init__(self, max_entries=1024, folder=None, max_files=10000):
+        """
+        :param max_entries: max number of results kept in memory,
+                            0 to disable the cache
+        :param folder: folder of the on-disk tier, or None
+        :param max_files: max number of results kept in the folder
+        """
+        self.max_entries = max_entries
+        self.max_files = max_files
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._folder_lock = threading.Lock()
+        self.folder = folder
+
+    @property
+    def folder(self):
+        return self._folder
+
+    @folder.setter
+    def folder(self, value):
+        with self._folder_lock:
+            self._folder = value
+            # approximate number of files in the folder,
+            # None if they are not counted yet
+            self._file_count = None
+
+    @staticmethod
+    def make_key(token, kind, raw_content):
+        sha = hashlib.sha1()
+        for part in (token, kind, raw_content):
+            sha.update(part.encode('utf-8'))
+            sha.update(b'\0')
+        return sha.hexdigest()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._entries.get(key, self._missing)
+            if value is not self._missing:
+                self._entries.move_to_end(key)
+                return value
+
+        if self.folder is None:
+            return default
+        file_path = self._file_path(key)
+        try:
+            with open(file_path, 'rb') as f:
+                value = pickle.load(f)
+            # mark it as recently used, for pruning
+            os.utime(file_path)
+        except Exception:
+            return default
+        self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        self._remember(key, value)
+        if self.folder is None:
+            return
+
+        file_path = self._file_path(key)
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path))
+        except OSError:
+            # the folder is not writable, just keep it in memory
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, file_path)
+        except OSError:
+            return
+        finally:
+            try:
+                # it's left only if it was not moved into place
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        self._count_file()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 or self.folder is not None
+
+    def get_or_render(self, token, kind, raw_content, render):
+        """
+        Get the cached result of a rendering,
+        or render it and cache the result.
+
+        :param token: cache token of the parser
+        :param kind: kind of the rendering
+        :param raw_content: raw content
+        :param render: function to render if the result is not cached
+        :return: the result
+        """
+        if not self.enabled:
+            return render()
+
+        key = self.make_key(token, kind, raw_content)
+        result = self.get(key)
+        if result is None:
+            result = render()
+            self.set(key, result)
+        return result
+
+    def clear(self):
+        """Clear the results in memory (the on-disk tier is kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _file_path(self, key):
+        return os.path.join(self.folder, key[:2], key[2:])
+
+    def _list_files(self):
+        """Get tuple(mtime, path) of all files in the folder."""
+        files = []
+        try:
+            sub_dirs = [e.path for e in scandir(self.folder) if e.is_dir()]
+        except OSError:
+            return files
+        for sub_dir in sub_dirs:
+            try:
+                for dir_entry in scandir(sub_dir):
+                    files.append((dir_entry.stat().st_mtime, dir_entry.path))
+            except OSError:
+                # removed by another process
+                continue
+        return files
+
+    def _count_file(self):
+        """Count a file written to the folder, and prune it if necessary."""
+        with self._folder_lock:
+            if self._file_count is None:
+                self._file_count = len(self._list_files())
+            else:
+                self._file_count += 1
+            if self.max_files is None or self._file_count <= self.max_files:
+                return
+            # other processes may write to the folder too,
+            # so the files are counted again
+            files = sorted(self._list_files())
+            keep = int(self.max_files * self._prune_ratio)
+            for _, file_path in files[:max(len(files) - keep, 0)]:
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+            self._file_count = min(len(files), keep)
+
+
+# shared by all parsers, configured in 'veripress.model'
+render_cache = RenderCache()
+
+
+def _cached_render(method, kind):
+    """Decorate a rendering method of parsers to use 'render_cache'."""
+
+    @wraps(method)
+    def wrapper(self, raw_content):
+        return render_cache.get_or_render(
+            self.cache_token, kind, raw_content,
+            lambda: method(self, raw_content))
+
+    wrapper.render_cached = True
+    return wrapper
 
 
 class Parser(object):
@@ -13,6 +211,16 @@ class Parser(object):
     # and should be a compiled regular expression
     _read_more_exp = None
 
+    @property
+    def cache_token(self):
+        """
+        A string that identifies the parser and its configuration,
+        rendered contents are cached by it (with the raw content).
+        Subclasses should override this if they can be configured,
+        or their output depends on versions of other libraries.
+        """
+        return '{}.{}'.format(type(self).__module__, type(self).__qualname__)
+
     def __init__(self):
         if self._read_more_exp is not None and \
                 isinstance(self._read_more_exp, str):
@@ -55,6 +263,23 @@ class Parser(object):
         """
         raise NotImplementedError
 
+    def parse_whole_toc(self, raw_content):
+        """
+        Parse the whole part of the content with anchors added to headers,
+        and get its table of content.
+
+        By default the HTML string returned by 'parse_whole' is parsed
+        again by HtmlTocParser, subclasses may override this
+        to collect headers while parsing.
+
+        :param raw_content: raw content
+        :return: an HtmlTocParser-like object, whose 'html_and_toc' method
+                 returns the HTML string, TOC list and TOC HTML string
+        """
+        toc_parser = HtmlTocParser()
+        toc_parser.feed(self.parse_whole(raw_content))
+        return toc_parser
+
     def remove_read_more_sep(self, raw_content):
         """
         Removes the first read_more_sep that occurs in raw_content.
@@ -106,6 +331,15 @@ def parser(format_name, ext_names=None):
     """
 
     def decorator(cls):
+        if issubclass(cls, Parser):
+            # cache rendered contents of registered parsers
+            if not getattr(cls.parse_whole, 'render_cached', False):
+                cls.parse_whole = _cached_render(cls.parse_whole, 'whole')
+            if cls.parse_preview is not Parser.parse_preview and \
+                    not getattr(cls.parse_preview, 'render_cached', False):
+                cls.parse_preview = _cached_render(cls.parse_preview,
+                                                   'preview')
+
         format_name_lower = format_name.lower()
         if ext_names is None:
             _ext_format_mapping[format_name_lower] = format_name_lower
@@ -135,8 +369,7 @@ class MarkdownParser(Parser):
 
     _read_more_exp = r'<!--\s*more\s*-->'
 
-    _markdown = partial(
-        markdown.markdown,
+    _markdown_options = dict(
         output_format='html5',
         extensions=[
             'markdown.extensions.extra',
@@ -151,6 +384,60 @@ class MarkdownParser(Parser):
         },
     )
 
+    def __init__(self):
+        super().__init__()
+        # Markdown objects are not thread-safe,
+        # so every thread gets its own one, which is reused for documents
+        self._local = threading.local()
+        # it's the key of every render, so it's computed only once
+        self._cache_token = self._make_cache_token()
+
+    def _markdown(self, raw_content):
+        md = getattr(self._local, 'markdown', None)
+        if md is None:
+            md = self._local.markdown = markdown.Markdown(
+                **self._markdown_options)
+        try:
+            return md.convert(raw_content)
+        finally:
+            md.reset()
+
+    def _markdown_toc(self, raw_content):
+        md = getattr(self._local, 'markdown_toc', None)
+        if md is None:
+            options = dict(self._markdown_options)
+            options['extensions'] = options['extensions'] + [
+                MarkdownTocExtension()]
+            md = self._local.markdown_toc = markdown.Markdown(**options)
+        try:
+            html = md.convert(raw_content)
+            toc = md.toc
+        finally:
+            md.reset()
+        return html, toc
+
+    @property
+    def cache_token(self):
+        return self._cache_token
+
+    def _make_cache_token(self):
+        try:
+            import pygments
+            pygments_version = pygments.__version__
+        except ImportError:  # pragma: no cover
+            pygments_version = None
+        return '{}:markdown={}:pygments={}:{!r}'.format(
+            super().cache_token, markdown.__version__,
+            pygments_version, sorted(self._markdown_options.items()))
+
     def parse_whole(self, raw_content):
         raw_content = self.remove_read_more_sep(raw_content)
         return self._markdown(raw_content).strip()
+
+    def parse_whole_toc(self, raw_content):
+        html, toc = self._markdown_toc(self.remove_read_more_sep(raw_content))
+        if toc is None:
+            # there are headers in raw HTML
+            return super().parse_whole_toc(raw_content)
+        toc.html = html.strip()
+        return toc
@@ -0,0 +1,286 @@
+import threading
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+
+from veripress.helpers import to_list, to_datetime, Pair
+
+
+def to_interval(interval):
+    """
+    Convert a created/updated limit to a datetime interval.
+
+    :param interval: [start date(time), end date(time)],
+                     an 'end' date includes the whole day
+    :return: tuple(start datetime, end datetime (exclusive)),
+             or None if the limit is invalid
+    """
+    if not isinstance(interval, (list, tuple)) or len(interval) != 2 \
+            or not isinstance(interval[0], date) \
+            or not isinstance(interval[1], date):
+        return None
+
+    start, end = interval
+    start = to_datetime(start)
+    if not isinstance(end, datetime):
+        # 'end' is a date,
+        # we should convert it to 00:00:00 of the next day,
+        # so that posts of that day will be included
+        end = to_datetime(end) + timedelta(days=1)
+    return start, end
+
+
+def sort_key(post):
+    """
+    Key that posts are sorted by (the latest first),
+    the unique key breaks ties of created dates,
+    so that any post has a definite position, e.g. for cursors.
+    """
+    return post.created, post.unique_key
+
+
+class PostIndex(object):
+    """
+    In-memory index of posts of one content generation.
+
+    Posts are kept in an array sorted by 'sort_key' (the latest first),
+    keys and dates are kept in ascending arrays, so that created/updated
+    intervals are found by bisection, and positions of posts are grouped
+    by the date prefixes of their relative urls
+    ('2017/', '2017/03/', '2017/03/10/'), for archive queries.
+
+    Positions of posts are also grouped by the values of their title, layout,
+    author, email, tags and categories (as sorted posting lists),
+    so that limits to these attrs are answered by intersecting the lists,
+    and post counts of tags and categories are known once the index is built.
+    """
+
+    # attrs that have posting lists
+    attrs = ('title', 'layout', 'author', 'email', 'tags', 'categories')
+
+    def __init__(self, posts, generation=None):
+        """
+        :param posts: posts to index, usually already sorted
+        :param generation: content generation the posts are got from
+        """
+        self.posts = sorted(posts, key=sort_key, reverse=True)
+        self.generation = generation
+        n = len(self.posts)
+        # sort keys in ascending order,
+        # the i-th of which is that of the (n - 1 - i)-th post
+        self._keys = [sort_key(self.posts[i]) for i in range(n - 1, -1, -1)]
+        # key: unique key, value: position of the post
+        self._positions = {p.unique_key: i for i, p in enumerate(self.posts)}
+        # tuple(updated date, position) in ascending order,
+        # posts whose 'updated' is not a datetime (e.g. an unrecognized
+        # string in the yaml head) are never in an updated interval
+        self._updated = sorted((p.updated, i)
+                               for i, p in enumerate(self.posts)
+                               if isinstance(p.updated, datetime))
+        # key: date prefix of relative url, value: positions of posts
+        self._date_prefixes = {}
+        for i, post in enumerate(self.posts):
+            prefix = ''
+            for part in post.rel_url.split('/', 3)[:3]:
+                prefix += part + '/'
+                self._date_prefixes.setdefault(prefix, []).append(i)
+        # key: attr, value: dict of attr values and sorted positions
+        self._postings = {attr: {} for attr in self.attrs}
+        # key: attr, value: dict of attr values and numbers of published posts
+        self._published_counts = {attr: {} for attr in self.attrs}
+        for i, post in enumerate(self.posts):
+            for attr in self.attrs:
+                postings = self._postings[attr]
+                published_counts = self._published_counts[attr]
+                for value in to_list(getattr(post, attr)):
+                    positions = postings.setdefault(value, [])
+                    if positions and positions[-1] == i:
+                        continue  # duplicated value in one post
+                    positions.append(i)
+                    published_counts[value] = published_counts.get(
+                        value, 0) + (0 if post.is_draft else 1)
+
+    def __len__(self):
+        return len(self.posts)
+
+    def get(self, unique_key):
+        """Get the post of the given unique key, or None."""
+        i = self._positions.get(unique_key)
+        return self.posts[i] if i is not None else None
+
+    def created_between(self, start, end):
+        """
+        Get positions of posts created in an interval.
+
+        :param start: start datetime (inclusive)
+        :param end: end datetime (exclusive)
+        :return: a range of positions
+        """
+        n = len(self.posts)
+        return range(n - bisect_left(self._keys, (end,)),
+                     n - bisect_left(self._keys, (start,)))
+
+    def after(self, key):
+        """
+        Get positions of posts that come after a sort key,
+        e.g. that of the last post of the previous page.
+
+        :param key: tuple(created datetime, unique key)
+        :return: a range of positions
+        """
+        n = len(self.posts)
+        return range(n - bisect_left(self._keys, tuple(key)), n)
+
+    def updated_between(self, start, end):
+        """
+        Get positions of posts updated in an interval.
+
+        :param start: start datetime (inclusive)
+        :param end: end datetime (exclusive)
+        :return: a sorted list of positions
+        """
+        lo = bisect_left(self._updated, (start,))
+        hi = bisect_left(self._updated, (end,))
+        return sorted(i for _, i in self._updated[lo:hi])
+
+    def with_attr(self, attr, values):
+        """
+        Get positions of posts whose attr has any of the given values.
+
+        :param attr: name of the attr, e.g. 'tags'
+        :param values: a value or a list of values
+        :return: a sorted list of positions
+        """
+        postings = self._postings[attr]
+        lists = [postings[value] for value in set(to_list(values))
+                 if value in postings]
+        if len(lists) == 1:
+            return lists[0]
+        return sorted(set().union(*lists))
+
+    def counts(self, attr):
+        """
+        Get post counts of all values of an attr, e.g. 'tags',
+        in the order the values first appear in posts.
+
+        :param attr: name of the attr
+        :return: a list of tuple(value, Pair(count_all, count_published))
+        """
+        published_counts = self._published_counts[attr]
+        return [(value, Pair(len(positions), published_counts[value]))
+                for value, positions in self._postings[attr].items()]
+
+    def with_rel_url_prefix(self, prefix):
+        """
+        Get positions of posts whose relative urls start with a prefix.
+
+        :param prefix: prefix of relative url, e.g. '2017/03/'
+        :return: a sorted list (or range) of positions
+        """
+        if not prefix:
+            return range(len(self.posts))
+        positions = self._date_prefixes.get(prefix)
+        if positions is not None:
+            return positions
+        # not a date prefix, e.g. it contains the post name,
+        # check posts of the longest date prefix it starts with
+        parts = prefix.split('/')[:-1][:3]
+        candidates = self._date_prefixes.get(''.join(
+            part + '/' for part in parts), []) if parts else range(len(self))
+        return [i for i in candidates
+                if self.posts[i].rel_url.startswith(prefix)]
+
+    def query(self, rel_url_prefix='', **limits):
+        """
+        Get posts that match the relative url prefix and limits,
+        in the same order as they are in the index.
+
+        :param rel_url_prefix: prefix of relative url, e.g. '2017/03/'
+        :param limits: limits to the attrs of posts,
+                       same as those of 'Storage.get_posts_with_limits'
+        :return: a list of Post objects
+        """
+        return [self.posts[i]
+                for i in self._match(rel_url_prefix, limits)]
+
+    def page(self, offset=0, limit=None, after=None,
+             rel_url_prefix='', **limits):
+        """
+        Get a page of posts that match the relative url prefix and limits,
+        only the posts in the page are taken out of the index.
+
+        :param offset: number of matched posts to skip
+        :param limit: max number of posts in the page, None for no limit
+        :param after: sort key of the post the page should start after,
+                      tuple(created datetime, unique key), None for the start
+        :param rel_url_prefix: prefix of relative url, e.g. '2017/03/'
+        :param limits: limits to the attrs of posts,
+                       same as those of 'Storage.get_posts_with_limits'
+        :return: tuple(list of Post objects, total number of matched posts)
+        """
+        positions = self._match(rel_url_prefix, limits)
+        total = len(positions)
+        start = offset
+        if after is not None:
+            start += bisect_left(positions, self.after(after).start)
+        stop = start + limit if limit is not None else None
+        return [self.posts[i] for i in positions[start:stop]], total
+
+    def _match(self, rel_url_prefix, limits):
+        """Get sorted positions (a list or range) of matched posts."""
+        positions = self.with_rel_url_prefix(rel_url_prefix)
+        for attr in self.attrs:
+            if limits.get(attr):
+                positions = _intersect(positions,
+                                       self.with_attr(attr, limits[attr]))
+        for attr, between in (('created', self.created_between),
+                              ('updated', self.updated_between)):
+            interval = to_interval(limits.get(attr))
+            if interval is not None:
+                positions = _intersect(positions, between(*interval))
+        return positions
+
+
+def _intersect(a, b):
+    """Intersect two sorted lists (or ranges) of positions."""
+    if isinstance(b, range):
+        a, b = b, a
+    if isinstance(a, range):
+        # a range (with step 1) is intersected by bisection
+        if isinstance(b, range):
+            return range(max(a.start, b.start), min(a.stop, b.stop))
+        return b[bisect_left(b, a.start):bisect_left(b, a.stop)]
+
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        if a[i] < b[j]:
+            i += 1
+        elif a[i] > b[j]:
+            j += 1
+        else:
+            result.append(a[i])
+            i += 1
+            j += 1
+    return result
+
+
+_post_indexes = {}
+_post_indexes_lock = threading.Lock()
+
+
+def get_post_index(name, generation, get_posts):
+    """
+    Get the PostIndex object of the given name (e.g. identity of the
+    storage), which is shared by all storage objects in the current process,
+    and rebuilt when the content generation changes.
+
+    :param name: name of the index
+    :param generation: current content generation
+    :param get_posts: function that returns the posts to index
+    :return: a PostIndex object
+    """
+    with _post_indexes_lock:
+        index = _post_indexes.get(name)
+        if index is None or index.generation != generation:
+            index = _post_indexes[name] = PostIndex(get_posts(), generation)
+        return index
@@ -0,0 +1,453 @@
+import os
+import re
+import math
+import pickle
+import tempfile
+import threading
+from collections import Counter
+
+from flask import Markup
+
+from veripress.model.parsers import get_parser
+
+# Kana, CJK unified ideographs (and extension A), compatibility ideographs,
+# and Hangul syllables, which are not separated by spaces
+_cjk_chars = (r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff'
+              r'\uf900-\ufaff\uac00-\ud7af')
+_token_exp = re.compile(
+    r'[{0}]+|(?:(?![{0}])\w)+'.format(_cjk_chars))
+_cjk_exp = re.compile(r'[{}]'.format(_cjk_chars))
+# length of n-grams that runs of CJK characters are split into
+CJK_NGRAM = 2
+
+
+def tokenize(text, cjk_ngram=CJK_NGRAM):
+    """
+    Split a text into lowercase tokens.
+
+    Words are split by non-word characters, while runs of CJK characters
+    are split into overlapping n-grams (or a single token, if the run is
+    shorter than n), so that words in them can be found without a dictionary.
+
+    :param text: text to tokenize
+    :param cjk_ngram: length of n-grams of CJK characters
+    :return: a list of tokens
+    """
+    tokens = []
+    for token in _token_exp.findall(text.lower()):
+        if len(token) > cjk_ngram and is_cjk_token(token):
+            tokens.extend(token[i:i + cjk_ngram]
+                          for i in range(len(token) - cjk_ngram + 1))
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def is_cjk_token(token):
+    """Check if a token (returned by 'tokenize') consists of CJK characters."""
+    return _cjk_exp.match(token) is not None
+
+
+def get_plain_text(obj):
+    """
+    Get the plain text (tags stripped) of the rendered content
+    of a post or page, which is what is searched.
+    """
+    return Markup(get_parser(obj.format).parse_whole(
+        obj.raw_content)).striptags()
+
+
+def make_snippet(text, query, width=160):
+    """
+    Make a snippet of a plain text around the first occurrence
+    of the query text, which is highlighted with '<mark>'.
+
+    :param text: plain text
+    :param query: query text
+    :param width: approximate length of the snippet
+    :return: an HTML snippet
+    """
+    m = re.search(re.escape(query), text, re.IGNORECASE) \
+        if query else None
+    if m is None:
+        # only the title matches
+        start, end = 0, min(len(text), width)
+    else:
+        start = max(0, m.start() - (width - len(m.group())) // 2)
+        end = min(len(text), start + max(width, len(m.group())))
+        start = max(0, min(start, end - width))
+    if start > 0:
+        # don't cut words at the beginning
+        space = text.find(' ', start, m.start() if m else end)
+        if space >= 0:
+            start = space + 1
+    if end < len(text):
+        space = text.rfind(' ', m.end() if m else start, end)
+        if space >= 0:
+            end = space
+
+    if m is None:
+        snippet = Markup.escape(text[start:end])
+    else:
+        snippet = Markup('{}<mark>{}</mark>{}').format(
+            text[start:m.start()], m.group(), text[m.end():end])
+    return Markup('{}{}{}').format('... ' if start > 0 else '', snippet,
+                                   ' ...' if end < len(text) else '')
+
+
+# max length of grams that index tokens are split into,
+# query tokens no longer than this are looked up directly
+_max_gram = 3
+
+
+def _grams(token, min_length=1):
+    """Get the set of substrings of a token, up to '_max_gram' long."""
+    return {token[i:i + n] for n in range(min_length, _max_gram + 1)
+            for i in range(len(token) - n + 1)}
+
+
+class _Document(object):
+    """Searchable text of a post or page."""
+
+    __slots__ = ('version', 'title', 'plain_text', 'text', 'tf',
+                 'title_tokens', 'length')
+
+    def __init__(self, version, title, plain_text):
+        self.version = version
+        self.title = title.lower()
+        # plain text (tags stripped) of the content, and its lowercase
+        self.plain_text = plain_text
+        self.text = plain_text.lower()
+        # key: token, value: term frequency in the content
+        self.tf = Counter(tokenize(self.text))
+        self.title_tokens = frozenset(tokenize(self.title))
+        self.length = sum(self.tf.values())
+
+    def __getstate__(self):
+        return (self.version, self.title, self.plain_text, self.tf,
+                self.title_tokens, self.length)
+
+    def __setstate__(self, state):
+        self.version, self.title, self.plain_text, self.tf, \
+            self.title_tokens, self.length = state
+        self.text = self.plain_text.lower()
+
+    def tokens(self):
+        """Get the set of tokens in the title and the content."""
+        return self.title_tokens.union(self.tf)
+
+
+class SearchIndex(object):
+    """
+    Inverted index of posts and pages, which maps tokens of titles
+    and plain texts to documents (identified by unique keys),
+    and ranks matched documents with BM25.
+
+    If an index file is given, the documents and postings are saved to it
+    whenever they change, and loaded from it before updating, so that
+    a new process (or another worker) only renders the posts and pages
+    that changed since the file was written.
+    """
+
+    # bump this when the layout of the index file or the tokenizer changes
+    _version = 2
+    # max number of query tokens whose matched index tokens are remembered
+    _max_matched_tokens = 1024
+    # parameters of BM25
+    k1 = 1.2
+    b = 0.75
+    # score of a title match (times idf), which outweighs any number of
+    # occurrences in the content (scored less than (k1 + 1) * idf)
+    title_weight = 3
+
+    def __init__(self, index_file_path=None):
+        """
+        :param index_file_path: file path to persist the index
+        """
+        self.index_file_path = index_file_path
+        # tuple(mtime, size) of the index file when it was loaded or saved
+        self._file_stat = None
+        # key: unique key, value: _Document
+        self._docs = {}
+        # key: token, value: set of unique keys
+        self._postings = {}
+        # key: substring (up to '_max_gram' long),
+        # value: set of index tokens containing it
+        self._grams = {}
+        # key: query token, value: index tokens containing it
+        self._matched_tokens = {}
+        self._total_length = 0
+        # content generation of the storage the index is built from
+        self.generation = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def update(self, posts_or_pages):
+        """
+        Bring the index up to date with all posts and pages
+        (including drafts), only documents whose title or raw content
+        changed are re-indexed.
+
+        :param posts_or_pages: an iterable of Post and Page objects
+        :return: number of documents (re-)indexed or removed
+        """
+        with self._lock:
+            self._sync()
+            count = 0
+            keys = set()
+            for obj in posts_or_pages:
+                keys.add(obj.unique_key)
+                version = (obj.format, obj.title, obj.raw_content_version(),
+                           get_parser(obj.format).cache_token)
+                doc = self._docs.get(obj.unique_key)
+                if doc is not None and doc.version == version:
+                    continue
+                self._remove(obj.unique_key)
+                self._add(obj.unique_key, self._make_document(obj, version))
+                count += 1
+            for key in set(self._docs) - keys:
+                self._remove(key)
+                count += 1
+            if count:
+                self._matched_tokens.clear()
+                self._save()
+            return count
+
+    def search(self, query):
+        """
+        Search for a query text, the title or plain text of a matched
+        document contains the query text (case-insensitive).
+
+        :param query: query text
+        :return: a dict of unique keys of matched documents and their scores
+        """
+        query = query.lower()
+        if not query:
+            return {}
+
+        with self._lock:
+            candidates = None
+            # key: query token, value: set of index tokens containing it
+            matched_tokens = {}
+            for token in sorted(set(tokenize(query)), key=len, reverse=True):
+                keys = set()
+                matched_tokens[token] = self._match_token(token)
+                for index_token in matched_tokens[token]:
+                    keys.update(self._postings[index_token])
+                candidates = keys if candidates is None \
+                    else candidates.intersection(keys)
+                if not candidates:
+                    return {}
+            if candidates is None:
+                # no token in the query, e.g. punctuation only
+                candidates = self._docs.keys()
+            # key: index token, value: idf
+            idfs = {}
+            return {key: self._score(self._docs[key], matched_tokens, idfs)
+                    for key in candidates
+                    if query in self._docs[key].title
+                    or query in self._docs[key].text}
+
+    def make_snippet(self, key, query, width=160):
+        """
+        Make a snippet of the plain text of a document around the first
+        occurrence of the query text, which is highlighted with '<mark>'.
+
+        :param key: unique key of the document
+        :param query: query text
+        :param width: approximate length of the snippet
+        :return: an HTML snippet, or None if the document is not indexed
+        """
+        with self._lock:
+            doc = self._docs.get(key)
+        if doc is None:
+            return None
+        return make_snippet(doc.plain_text, query, width=width)
+
+    def _score(self, doc, matched_tokens, idfs):
+        """
+        BM25 score of a document, with the title scored as a separate field.
+
+        Each query token is scored by the best of the index tokens
+        containing it, so that a short query token, which may be a part of
+        thousands of index tokens, counts no more than a whole word.
+        """
+        n = len(self._docs)
+        avg_length = self._total_length / n if n else 0
+        norm = self.k1 * (1 - self.b + self.b * doc.length / avg_length) \
+            if avg_length else self.k1
+        doc_tokens = doc.tokens()
+        score = 0.0
+        for index_tokens in matched_tokens.values():
+            if len(doc_tokens) < len(index_tokens):
+                index_tokens = doc_tokens & index_tokens
+            best = 0.0
+            for index_token in index_tokens:
+                tf = doc.tf.get(index_token, 0)
+                in_title = index_token in doc.title_tokens
+                if not tf and not in_title:
+                    continue
+                idf = idfs.get(index_token)
+                if idf is None:
+                    df = len(self._postings[index_token])
+                    idf = idfs[index_token] = \
+                        math.log(1 + (n - df + 0.5) / (df + 0.5))
+                best = max(best, idf * (
+                    tf * (self.k1 + 1) / (tf + norm)
+                    + (self.title_weight if in_title else 0)))
+            score += best
+        return score
+
+    @staticmethod
+    def _make_document(obj, version):
+        return _Document(version, obj.title or '', get_plain_text(obj))
+
+    def _match_token(self, token):
+        """
+        Get the set of index tokens that contain the query token,
+        since the query may begin or end in the middle of a word.
+        """
+        if len(token) >= CJK_NGRAM and is_cjk_token(token):
+            # a full-length CJK n-gram is never a part of other tokens
+            return frozenset([token] if token in self._postings else ())
+        result = self._matched_tokens.get(token)
+        if result is None:
+            if len(self._matched_tokens) >= self._max_matched_tokens:
+                self._matched_tokens.clear()
+            result = self._matched_tokens[token] = \
+                self._find_containing(token)
+        return result
+
+    def _find_containing(self, token):
+        """
+        Find index tokens that contain the query token, among those
+        that contain all of its trigrams.
+        """
+        if len(token) <= _max_gram:
+            # it's a gram itself
+            return frozenset(self._grams.get(token, ()))
+        candidates = None
+        for gram in sorted(_grams(token, _max_gram),
+                           key=lambda g: len(self._grams.get(g, ()))):
+            index_tokens = self._grams.get(gram)
+            if not index_tokens:
+                return frozenset()
+            candidates = set(index_tokens) if candidates is None \
+                else candidates.intersection(index_tokens)
+        return frozenset(t for t in candidates if token in t)
+
+    def _add_grams(self, index_token):
+        for gram in _grams(index_token):
+            self._grams.setdefault(gram, set()).add(index_token)
+
+    def _remove_grams(self, index_token):
+        for gram in _grams(index_token):
+            index_tokens = self._grams[gram]
+            index_tokens.discard(index_token)
+            if not index_tokens:
+                del self._grams[gram]
+
+    def _stat_file(self):
+        try:
+            st = os.stat(self.index_file_path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _sync(self):
+        """Load the index file if it changed since it was loaded or saved."""
+        if self.index_file_path is None:
+            return
+        file_stat = self._stat_file()
+        if file_stat is None or file_stat == self._file_stat:
+            return
+        self._file_stat = file_stat
+        try:
+            with open(self.index_file_path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') != self._version:
+                return
+            docs, postings = data['docs'], data['postings']
+        except Exception:
+            # the index file is broken, it will be overwritten
+            return
+        self._docs = docs
+        self._postings = postings
+        self._total_length = sum(doc.length for doc in docs.values())
+        self._grams = {}
+        for index_token in postings:
+            self._add_grams(index_token)
+        self._matched_tokens.clear()
+
+    def _save(self):
+        """Write the index to the index file atomically."""
+        if self.index_file_path is None:
+            return
+        data = {'version': self._version,
+                'docs': self._docs,
+                'postings': self._postings}
+        index_dir = os.path.dirname(self.index_file_path)
+        try:
+            os.makedirs(index_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=index_dir)
+        except OSError:
+            # the instance folder may be read-only,
+            # in which case the index just lives in memory
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.index_file_path)
+            self._file_stat = self._stat_file()
+        except OSError:
+            pass
+        finally:
+            try:
+                # it's left only if it was not moved into place
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _add(self, key, doc):
+        self._docs[key] = doc
+        self._total_length += doc.length
+        for token in doc.tokens():
+            keys = self._postings.get(token)
+            if keys is None:
+                keys = self._postings[token] = set()
+                self._add_grams(token)
+            keys.add(key)
+
+    def _remove(self, key):
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        self._total_length -= doc.length
+        for token in doc.tokens():
+            keys = self._postings[token]
+            keys.discard(key)
+            if not keys:
+                del self._postings[token]
+                self._remove_grams(token)
+
+
+_search_indexes = {}
+_search_indexes_lock = threading.Lock()
+
+
+def get_search_index(name, index_file_path=None):
+    """
+    Get the SearchIndex object of the given name (e.g. identity of the
+    storage), which is shared by all storage objects in the current process.
+
+    :param name: name of the index
+    :param index_file_path: file path to persist the index
+    :return: a SearchIndex object
+    """
+    with _search_indexes_lock:
+        index = _search_indexes.get(name)
+        if index is None or index.index_file_path != index_file_path:
+            index = _search_indexes[name] = SearchIndex(index_file_path)
+        return index
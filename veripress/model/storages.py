@@ -1,22 +1,78 @@
 import re
 import os
+import uuid
+import pickle
+import sqlite3
+import hashlib
 import functools
+import threading
+from bisect import bisect_left
 from itertools import chain
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 
-import yaml
-from flask import current_app, Markup
+from flask import current_app, g, has_app_context
 
-from veripress import cache
+from veripress import cache, site
 from veripress.model.models import Page, Post, Widget
-from veripress.model.parsers import get_standard_format_name, get_parser
-from veripress.helpers import to_list, to_datetime, Pair, traverse_directory
+from veripress.model.parsers import get_standard_format_name
+from veripress.model.indexes import get_file_index, read_meta
+from veripress.model.watcher import create_watcher
+from veripress.model.search import (
+    get_search_index, get_plain_text, make_snippet
+)
+from veripress.model.post_index import get_post_index, sort_key, to_interval
+from veripress.helpers import to_list, Pair, ConfigurationError
+
+
+def get_content_generation():
+    """
+    Get the content generation token of the storage of current app context,
+    it's computed at most once per request.
+
+    :return: generation token
+    """
+    generation = getattr(g, '_content_generation', None)
+    if generation is None:
+        from veripress.model import storage
+        generation = g._content_generation = storage.get_generation()
+    return generation
+
+
+def generation_cache_name(fname):
+    """
+    Used as the 'make_name' argument of 'cache.memoize',
+    so that memoized results are invalidated when the content changes,
+    results of old generations expire after the default timeout
+    ('CACHE_DEFAULT_TIMEOUT').
+    """
+    return '{}@{}'.format(fname, get_content_generation())
+
+
+def _page_unique_key(rel_url):
+    """Get the unique key of a page from its relative url."""
+    return '/' + (rel_url.rsplit('/', 1)[0] + '/'
+                  if rel_url.endswith('/index.html') else rel_url)
 
 
 class Storage(object):
     def __init__(self):
         """Initialization."""
         self._closed = False
+        # instance folder of the app the storage is created for
+        self.instance_path = current_app.instance_path \
+            if has_app_context() else None
+
+    def __repr__(self):
+        """
+        Stable representation, which is used by 'cache.memoize'
+        as the identity of the storage object, so that memoized methods
+        hit across storage objects (one is created per app context),
+        and as the name of the shared indexes of the storage.
+
+        It includes the instance folder, so that storages of different
+        instances in one process never share memoized results or indexes.
+        """
+        return '<{} {!r}>'.format(type(self).__name__, self.instance_path)
 
     def close(self):
         """
@@ -34,7 +90,17 @@ class Storage(object):
         """
         return self._closed
 
-    @cache.memoize(timeout=1 * 60)
+    def get_generation(self):
+        """
+        Get a token that changes whenever the content in the storage changes.
+        Subclasses should override this if the content may change
+        while the app is running.
+
+        :return: generation token (a string)
+        """
+        return ''
+
+    @cache.memoize(make_name=generation_cache_name)
     def fix_relative_url(self, publish_type, rel_url):
         """
         Fix post or page relative url to a standard, uniform format.
@@ -54,7 +120,7 @@ class Storage(object):
                 'Publish type "{}" is not supported'.format(publish_type))
 
     @staticmethod
-    @cache.memoize(timeout=2 * 60 * 60)  # actually, it will never change
+    @cache.memoize(timeout=0)  # it will never change
     def fix_post_relative_url(rel_url):
         """
         Fix post relative url to a standard, uniform format.
@@ -170,52 +236,54 @@ class Storage(object):
                 result = filter(filter_func, result)
         return result
 
-    def get_posts_with_limits(self, include_draft=False, **limits):
+    def get_post_index(self, include_draft=False):
+        """
+        Get the in-memory index of all posts, which is shared by storage
+        objects in the current process, and rebuilt when the content changes.
+
+        :param include_draft: index draft posts or not
+        :return: a PostIndex object
+        """
+        return get_post_index(
+            (repr(self), include_draft),
+            get_content_generation(),
+            lambda: self.get_posts(include_draft=include_draft))
+
+    def get_posts_with_limits(self, include_draft=False, rel_url_prefix='',
+                              **limits):
         """
         Get all posts and filter them as needed.
 
         :param include_draft: return draft posts or not
+        :param rel_url_prefix: prefix of relative urls of posts,
+                               e.g. '2017/' or '2017/03/' for archives
         :param limits: other limits to the attrs of the result,
-                       should be a dict with string or list values
+                       should be a dict with string or list values,
+                       or [start date(time), end date(time)] for
+                       'created' and 'updated'
         :return: an iterable of Post objects
         """
-        filter_funcs = []
-
-        for attr in ('title', 'layout', 'author',
-                     'email', 'tags', 'categories'):
-            if limits.get(attr):
-                filter_set = set(to_list(limits.get(attr)))
+        return self.get_post_index(include_draft=include_draft).query(
+            rel_url_prefix=rel_url_prefix, **limits)
 
-                def get_filter_func(filter_set_, attr_):
-                    return lambda p: filter_set_.intersection(
-                        to_list(getattr(p, attr_)))
-
-                filter_funcs.append(get_filter_func(filter_set, attr))
+    def get_posts_page(self, include_draft=False, offset=0, limit=None,
+                       after=None, rel_url_prefix='', **limits):
+        """
+        Get a page of posts (filtered as needed), the latest first.
 
-        for attr in ('created', 'updated'):
-            interval = limits.get(attr)
-            if isinstance(interval, (list, tuple)) and len(interval) == 2 \
-                    and isinstance(interval[0], date) and isinstance(
-                interval[1], date):
-                # [start date(time), end date(time)]
-                start, end = interval
-                start = to_datetime(start)
-                if not isinstance(end, datetime):
-                    # 'end' is a date,
-                    # we should convert it to 00:00:00 of the next day,
-                    # so that posts of that day will be included
-                    end = datetime.strptime(
-                        '%04d-%02d-%02d' % (end.year, end.month, end.day),
-                        '%Y-%m-%d')
-                    end += timedelta(days=1)
-
-                def get_filter_func(attr_, start_dt, end_dt):
-                    return lambda p: start_dt <= getattr(p, attr_) < end_dt
-
-                filter_funcs.append(get_filter_func(attr, start, end))
-
-        return self.get_posts(include_draft=include_draft,
-                              filter_functions=filter_funcs)
+        :param include_draft: return draft posts or not
+        :param offset: number of posts to skip
+        :param limit: max number of posts to return, None for no limit
+        :param after: tuple(created, unique_key) of the post that
+                      the page should start after, e.g. the last post of
+                      the previous page, None to start from the latest post
+        :param rel_url_prefix: prefix of relative urls of posts
+        :param limits: same as those of 'get_posts_with_limits'
+        :return: tuple(list of Post objects, total count of matched posts)
+        """
+        return self.get_post_index(include_draft=include_draft).page(
+            offset=offset, limit=limit, after=after,
+            rel_url_prefix=rel_url_prefix, **limits)
 
     def search_for(self, query, include_draft=False):
         """
@@ -223,30 +291,90 @@ class Storage(object):
 
         :param query: keyword to query
         :param include_draft: return draft posts/pages or not
-        :return: an iterable object of posts and pages (if allowed).
+        :return: a list of posts and pages (if allowed),
+                 the most relevant first
+        """
+        return [p for _, p in
+                self.search_page(query, include_draft=include_draft)[0]]
+
+    def search_page(self, query, include_draft=False, offset=0, limit=None,
+                    after=None):
+        """
+        Search for a query text, and get a page of the result.
+
+        Posts and pages are sorted by tuple(score, unique_key),
+        the most relevant first.
+
+        :param query: keyword to query
+        :param include_draft: return draft posts/pages or not
+        :param offset: number of matched posts/pages to skip
+        :param limit: max number of posts/pages to return, None for no limit
+        :param after: tuple(score, unique_key) of the post/page that
+                      the page should start after, None for the start
+        :return: tuple(list of tuple(score, post or page),
+                 total count of matched posts and pages (if allowed))
         """
         query = query.lower()
         if not query:
-            return []
+            return [], 0
+
+        scores = self.get_search_index().search(query)
+        # only the matched posts and pages are looked up
+        post_index = self.get_post_index(include_draft=include_draft)
+        search_pages = current_app.config['ALLOW_SEARCH_PAGES']
+        result = []
+        for unique_key in scores:
+            obj = post_index.get(unique_key)
+            if obj is None and search_pages:
+                # unique key of a page is its relative url with a leading '/'
+                obj = self.get_page(unique_key[1:],
+                                    include_draft=include_draft)
+            if obj is not None and obj.unique_key in scores:
+                result.append(obj)
+        # tuple(score, unique_key, index in result) in ascending order,
+        # the most relevant is the last
+        keys = sorted((scores[p.unique_key], p.unique_key, i)
+                      for i, p in enumerate(result))
+        stop = len(keys) - offset
+        if after is not None:
+            stop -= len(keys) - bisect_left(keys, tuple(after))
+        start = max(stop - limit, 0) if limit is not None else 0
+        return [(score, result[i]) for score, _, i in
+                reversed(keys[start:max(stop, 0)])], len(keys)
+
+    def make_search_snippet(self, unique_key, query):
+        """
+        Make a snippet of the plain text of a post or page
+        around the query text, which is highlighted with '<mark>'.
 
-        def contains_query_keyword(post_or_page):
-            contains = query in post_or_page.title.lower() \
-                       or query in Markup(
-                get_parser(post_or_page.format).parse_whole(
-                    post_or_page.raw_content)
-            ).striptags().lower()
-            return contains
+        :param unique_key: unique key of the post or page
+        :param query: query text
+        :return: an HTML snippet, or None if the post or page is not indexed
+        """
+        return self.get_search_index().make_snippet(unique_key, query)
 
-        return filter(contains_query_keyword,
-                      chain(self.get_posts(include_draft=include_draft),
-                            self.get_pages(include_draft=include_draft)
-                            if current_app.config[
-                                'ALLOW_SEARCH_PAGES'] else []))
+    def get_search_index(self):
+        """
+        Get the full-text search index of all posts and pages
+        (including drafts), which is updated if the content has changed.
+
+        :return: a SearchIndex object
+        """
+        search_index = get_search_index(
+            repr(self),
+            os.path.join(current_app.instance_path,
+                         current_app.config['CACHE_FOLDER'], 'search.index'))
+        generation = get_content_generation()
+        if search_index.generation != generation:
+            search_index.update(chain(self.get_posts(include_draft=True),
+                                      self.get_pages(include_draft=True)))
+            search_index.generation = generation
+        return search_index
 
 
 class FileStorage(Storage):
     @staticmethod
-    @cache.memoize(timeout=1 * 60)
+    @cache.memoize(make_name=generation_cache_name)
     def fix_page_relative_url(rel_url):
         """
         Fix page relative url to a standard, uniform format.
@@ -299,7 +427,7 @@ class FileStorage(Storage):
         return '/'.join(sp), False
 
     @staticmethod
-    @cache.memoize(timeout=1 * 60)
+    @cache.memoize(make_name=generation_cache_name)
     def search_file(search_root, search_filename,
                     instance_relative_root=False):
         """
@@ -327,7 +455,7 @@ class FileStorage(Storage):
         functools.partial(search_file.__func__, instance_relative_root=True))
 
     @staticmethod
-    @cache.memoize(timeout=1 * 60)
+    @cache.memoize(make_name=generation_cache_name)
     def read_file(file_path):
         """
         Read yaml head and raw body content from a file.
@@ -335,18 +463,68 @@ class FileStorage(Storage):
         :param file_path: file path
         :return: tuple(meta, raw_content)
         """
-        with open(file_path, 'r', encoding='utf-8') as f:
-            whole = f.read().strip()
+        meta, _, raw_content = read_meta(file_path)
+        return meta, raw_content
+
+    def get_generation(self):
+        """
+        Get a token derived from paths, mtimes and sizes of all files
+        in the 'posts', 'pages' and 'widgets' directories.
+
+        The directories are scanned again only if the mtime of any of them
+        changed or 'CONTENT_CHECK_INTERVAL' seconds passed since the last
+        scan, and never while they are watched.
+
+        :return: generation token
+        """
+        interval = current_app.config['CONTENT_CHECK_INTERVAL']
+        md5 = hashlib.md5()
+        for dir_name in ('posts', 'pages', 'widgets'):
+            index = self.get_file_index(dir_name)
+            index.refresh(interval=interval)
+            md5.update(index.signature.encode('ascii'))
+        return md5.hexdigest()
+
+    # options of the metadata index of each content directory
+    _file_index_options = {
+        'posts': {'filename_exp': r'\d{4}-\d{2}-\d{2}-.+'},
+        'pages': {'recursive': True},
+        'widgets': {},
+    }
+
+    @staticmethod
+    def get_file_index(dir_name):
+        """
+        Get the persistent metadata index of a content directory
+        ('posts', 'pages' or 'widgets') of the current instance.
+
+        :param dir_name: directory name
+        :return: a FileIndex object
+        """
+        return get_file_index(
+            os.path.join(current_app.instance_path, dir_name),
+            os.path.join(current_app.instance_path,
+                         current_app.config['CACHE_FOLDER'],
+                         dir_name + '.index'),
+            workers=current_app.config['LOAD_WORKERS'],
+            **FileStorage._file_index_options[dir_name]
+        )
+
+    @staticmethod
+    def create_watcher(interval=1.0):
+        """
+        Create a watcher that applies changes of the 'posts', 'pages'
+        and 'widgets' directories of the current instance to their indexes,
+        so that the storage never scans them in requests.
 
-        if whole.startswith('---'):
-            # may has yaml meta info, so we try to split it out
-            sp = re.split(r'-{3,}', whole.lstrip('-'), maxsplit=1)
-            if len(sp) == 2:
-                # do have yaml meta info, so we read it
-                return yaml.load(sp[0]), sp[1].lstrip()
-        return {}, whole
+        :param interval: seconds between two scans if inotify is unavailable
+        :return: a Watcher object (not started)
+        """
+        return create_watcher([FileStorage.get_file_index(dir_name)
+                               for dir_name in ('posts', 'pages', 'widgets')],
+                              interval=interval)
 
-    @cache.memoize(timeout=2 * 60)
+    @cache.memoize(make_name=generation_cache_name)
     def get_posts(self, include_draft=False, filter_functions=None):
         """
         Get all posts from filesystem.
@@ -356,32 +534,29 @@ class FileStorage(Storage):
         :return: an iterable of Post objects (the first is the latest post)
         """
 
-        def posts_generator(path):
-            """Loads valid posts one by one in the given path."""
-            if os.path.isdir(path):
-                for file in os.listdir(path):
-                    filename, ext = os.path.splitext(file)
-                    format_name = get_standard_format_name(ext[1:])
-                    if format_name is not None and re.match(
-                            r'\d{4}-\d{2}-\d{2}-.+', filename):
-                        # the format is supported and the filename is valid,
-                        # so load this post
-                        post = Post()
-                        post.format = format_name
-                        post.meta, post.raw_content = FileStorage.read_file(
-                            os.path.join(path, file))
-                        post.rel_url = filename.replace('-', '/', 3) + '/'
-                        post.unique_key = '/post/' + post.rel_url
-                        yield post
-
-        posts_path = os.path.join(current_app.instance_path, 'posts')
+        def posts_generator(index):
+            """Loads valid posts one by one from the index."""
+            for entry in index.entries():
+                post = Post()
+                post.format = entry.format
+                post.meta = entry.meta
+                post.defer_raw_content(
+                    functools.partial(index.read_body, entry),
+                    version=(entry.mtime, entry.size))
+                filename = os.path.splitext(entry.rel_path)[0]
+                post.rel_url = filename.replace('-', '/', 3) + '/'
+                post.unique_key = '/post/' + post.rel_url
+                yield post
+
+        posts_index = self.get_file_index('posts')
+        posts_index.refresh()
         result = filter(lambda p: include_draft or not p.is_draft,
-                        posts_generator(posts_path))
+                        posts_generator(posts_index))
         result = self._filter_result(result, filter_functions)
 
-        return sorted(result, key=lambda p: p.created, reverse=True)
+        return sorted(result, key=sort_key, reverse=True)
 
-    @cache.memoize(timeout=2 * 60)
+    @cache.memoize(make_name=generation_cache_name)
     def get_post(self, rel_url, include_draft=False):
         """
         Get post for given relative url from filesystem.
@@ -400,11 +575,11 @@ class FileStorage(Storage):
                           0] + '/'  # remove the trailing 'index.html'
         post_filename = rel_url[:-1].replace('/', '-')
 
-        post_file_path, post_file_ext = FileStorage.search_instance_file(
-            'posts', post_filename)
-        if post_file_path is None or post_file_ext is None or \
-                get_standard_format_name(post_file_ext) is None:
-            # no such post
+        # the index is refreshed (if it's not watched)
+        # when the content generation is computed for the request
+        posts_index = self.get_file_index('posts')
+        entry = posts_index.find(post_filename)
+        if entry is None:
             return None
 
         # construct the post object
@@ -412,42 +587,30 @@ class FileStorage(Storage):
         post.rel_url = raw_rel_url
         # 'rel_url' contains no trailing 'index.html'
         post.unique_key = '/post/' + rel_url
-        post.format = get_standard_format_name(post_file_ext)
-        post.meta, post.raw_content = FileStorage.read_file(post_file_path)
+        post.format = entry.format
+        post.meta = entry.meta
+        post.defer_raw_content(
+            functools.partial(posts_index.read_body, entry),
+            version=(entry.mtime, entry.size))
         return post if include_draft or not post.is_draft else None
 
-    @cache.memoize(timeout=5 * 60)
     def get_tags(self):
         """
         Get all tags and post count of each tag.
 
         :return: dict_item(tag_name, Pair(count_all, count_published))
         """
-        posts = self.get_posts(include_draft=True)
-        result = {}
-        for post in posts:
-            for tag_name in set(post.tags):
-                result[tag_name] = result.setdefault(
-                    tag_name, Pair(0, 0)) + Pair(1, 0 if post.is_draft else 1)
-        return list(result.items())
+        return self.get_post_index(include_draft=True).counts('tags')
 
-    @cache.memoize(timeout=5 * 60)
     def get_categories(self):
         """
         Get all categories and post count of each category.
 
         :return dict_item(category_name, Pair(count_all, count_published))
         """
-        posts = self.get_posts(include_draft=True)
-        result = {}
-        for post in posts:
-            for category_name in set(post.categories):
-                result[category_name] = result.setdefault(
-                    category_name,
-                    Pair(0, 0)) + Pair(1, 0 if post.is_draft else 1)
-        return list(result.items())
+        return self.get_post_index(include_draft=True).counts('categories')
 
-    @cache.memoize(timeout=2 * 60)
+    @cache.memoize(make_name=generation_cache_name)
     def get_pages(self, include_draft=False):
         """
         Get all custom pages
@@ -457,28 +620,22 @@ class FileStorage(Storage):
         :return: an iterable of Page objects
         """
 
-        def pages_generator(pages_root_path):
-            for file_path in traverse_directory(pages_root_path,
-                                                yield_dir=False):
-                rel_path = os.path.relpath(file_path, pages_root_path)
-                rel_path, ext = os.path.splitext(rel_path)
-                if not ext or ext == '.' or get_standard_format_name(
-                        ext[1:]) is None:
-                    continue  # pragma: no cover
-
-                if rel_path.endswith(os.path.sep + 'index'):
+        def pages_generator(index):
+            for entry in index.entries():
+                rel_path = os.path.splitext(entry.rel_path)[0]
+                if rel_path.endswith('/index'):
                     rel_path = rel_path[:-len('index')]
                 else:
                     rel_path += '.html'
-                page = self.get_page(rel_path.replace(os.path.sep, '/'),
-                                     include_draft=include_draft)
-                if page is not None:
+                page = self._make_page(rel_path, index, entry)
+                if include_draft or not page.is_draft:
                     yield page
 
-        pages_path = os.path.join(current_app.instance_path, 'pages')
-        return list(pages_generator(pages_path))
+        pages_index = self.get_file_index('pages')
+        pages_index.refresh()
+        return list(pages_generator(pages_index))
 
-    @cache.memoize(timeout=2 * 60)
+    @cache.memoize(make_name=generation_cache_name)
     def get_page(self, rel_url, include_draft=False):
         """
         Get custom page for given relative url from filesystem.
@@ -494,35 +651,36 @@ class FileStorage(Storage):
         :param include_draft: return draft page or not
         :return: a Page object
         """
+        pages_index = self.get_file_index('pages')
         page_dir = os.path.dirname(rel_url.replace('/', os.path.sep))
-        page_path = os.path.join(current_app.instance_path, 'pages', page_dir)
-        if not os.path.isdir(page_path):
-            # no such directory
-            return None
-
         page_filename = rel_url[len(page_dir):].lstrip('/')
         if not page_filename:
             page_filename = 'index'
         else:
             page_filename = os.path.splitext(page_filename)[0]
 
-        page_file_path, page_file_ext = FileStorage.search_file(page_path,
-                                                                page_filename)
-        if page_file_path is None or page_file_ext is None or \
-                get_standard_format_name(page_file_ext) is None:
-            # no such page
+        entry = pages_index.find(
+            '/'.join(filter(None, (page_dir.replace(os.path.sep, '/'),
+                                   page_filename))))
+        if entry is None:
             return None
 
-        page = Page()
-        page.rel_url = rel_url
-        page.unique_key = '/' + (
-            rel_url.rsplit('/', 1)[0] + '/' if rel_url.endswith(
-                '/index.html') else rel_url)
-        page.format = get_standard_format_name(page_file_ext)
-        page.meta, page.raw_content = FileStorage.read_file(page_file_path)
+        page = self._make_page(rel_url, pages_index, entry)
         return page if include_draft or not page.is_draft else None
 
-    @cache.memoize(timeout=2 * 60)
+    @staticmethod
+    def _make_page(rel_url, index, entry):
+        """Construct a Page object from an entry of the pages index."""
+        page = Page()
+        page.rel_url = rel_url
+        page.unique_key = _page_unique_key(rel_url)
+        page.format = entry.format
+        page.meta = entry.meta
+        page.defer_raw_content(functools.partial(index.read_body, entry),
+                               version=(entry.mtime, entry.size))
+        return page
+
+    @cache.memoize(make_name=generation_cache_name)
     def get_widgets(self, position=None, include_draft=False):
         """
         Get widgets for given position from filesystem.
@@ -532,25 +690,714 @@ class FileStorage(Storage):
         :return: an iterable of Widget objects
         """
 
-        def widgets_generator(path):
-            """Loads valid widgets one by one in the given path."""
-            if os.path.isdir(path):
-                for file in os.listdir(path):
-                    _, ext = os.path.splitext(file)
-                    format_name = get_standard_format_name(ext[1:])
-                    if format_name is not None:
-                        # the format is supported, so load it
-                        widget = Widget()
-                        widget.format = format_name
-                        widget.meta, widget.raw_content = \
-                            FileStorage.read_file(os.path.join(path, file))
-                        yield widget
-
-        widgets_path = os.path.join(current_app.instance_path, 'widgets')
+        def widgets_generator(index):
+            """Loads valid widgets one by one from the index."""
+            for entry in index.entries():
+                widget = Widget()
+                widget.format = entry.format
+                widget.meta = entry.meta
+                widget.defer_raw_content(
+                    functools.partial(index.read_body, entry),
+                    version=(entry.mtime, entry.size))
+                yield widget
+
+        widgets_index = self.get_file_index('widgets')
+        widgets_index.refresh()
         positions = to_list(position) if position is not None else position
         result = filter(
             lambda w: (w.position in positions
                        if positions is not None else True) and
                       (include_draft or not w.is_draft),
-            widgets_generator(widgets_path))
+            widgets_generator(widgets_index))
         return sorted(result, key=lambda w: (w.position, w.order))
+
+
+def _format_datetime(dt):
+    """
+    Format a datetime to a fixed-width string, so that datetimes
+    are compared and sorted as strings in the database.
+    """
+    if not isinstance(dt, datetime):
+        return None if dt is None else str(dt)
+    return '{0.year:04d}-{0.month:02d}-{0.day:02d} ' \
+           '{0.hour:02d}:{0.minute:02d}:{0.second:02d}.' \
+           '{0.microsecond:06d}'.format(dt)
+
+
+def _placeholders(values):
+    """Get placeholders of a list of values, e.g. '?, ?, ?'."""
+    return ', '.join('?' * len(values))
+
+
+# connections of each thread to SQLite databases for loading raw content
+_loader_connections = threading.local()
+
+
+def _loader_connection(database_path):
+    """
+    Get the connection of the current thread to a SQLite database
+    for loading raw content, which is opened when it's used for the first
+    time and reused, instead of opening one for every deferred body.
+    """
+    connections = getattr(_loader_connections, 'connections', None)
+    if connections is None:
+        connections = _loader_connections.connections = {}
+    conn = connections.get(database_path)
+    if conn is None:
+        conn = connections[database_path] = sqlite3.connect(database_path)
+    return conn
+
+
+def _load_raw_content(database_path, table, id_):
+    """
+    Load the raw content of a post, page or widget from a SQLite database,
+    used as the (picklable) loader of deferred raw content.
+    """
+    row = _loader_connection(database_path).execute(
+        'SELECT raw_content FROM {} WHERE id = ?'.format(table),
+        (id_,)).fetchone()
+    return row[0] if row is not None else None
+
+
+class SqliteStorage(Storage):
+    """
+    Storage that keeps posts, pages and widgets in a SQLite database,
+    which is synced from the 'posts', 'pages' and 'widgets' directories
+    of the instance by the 'veripress import' command (see 'sync').
+
+    Posts are queried with indexed SQL (tags and categories are kept in
+    their own tables), and posts and pages are searched with FTS5.
+    Direct files in the 'pages' directory (e.g. '.html', '.css')
+    are still served from the directory.
+    """
+
+    # bump this when the schema changes, the tables will be recreated
+    # (and should be synced again)
+    _schema_version = 1
+
+    _schema = """
+        CREATE TABLE IF NOT EXISTS state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS posts (
+            id INTEGER PRIMARY KEY,
+            unique_key TEXT NOT NULL UNIQUE,
+            rel_url TEXT NOT NULL,
+            format TEXT,
+            meta BLOB NOT NULL,
+            raw_content TEXT,
+            version TEXT NOT NULL,
+            is_draft INTEGER NOT NULL,
+            created TEXT,
+            updated TEXT,
+            title TEXT,
+            layout TEXT,
+            author TEXT,
+            email TEXT
+        );
+        CREATE INDEX IF NOT EXISTS posts_created
+            ON posts (created, unique_key);
+        CREATE INDEX IF NOT EXISTS posts_updated ON posts (updated);
+        CREATE INDEX IF NOT EXISTS posts_rel_url ON posts (rel_url);
+        CREATE INDEX IF NOT EXISTS posts_title ON posts (title);
+        -- names have no type affinity, so that they are got back as they are
+        CREATE TABLE IF NOT EXISTS post_tags (
+            name NOT NULL,
+            post_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (name, post_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS post_tags_post_id ON post_tags (post_id);
+        CREATE TABLE IF NOT EXISTS post_categories (
+            name NOT NULL,
+            post_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (name, post_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS post_categories_post_id
+            ON post_categories (post_id);
+        CREATE TABLE IF NOT EXISTS pages (
+            id INTEGER PRIMARY KEY,
+            unique_key TEXT NOT NULL UNIQUE,
+            rel_url TEXT NOT NULL,
+            path TEXT NOT NULL,
+            format TEXT,
+            meta BLOB NOT NULL,
+            raw_content TEXT,
+            version TEXT NOT NULL,
+            is_draft INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS pages_path ON pages (path);
+        CREATE INDEX IF NOT EXISTS pages_rel_url ON pages (rel_url);
+        CREATE TABLE IF NOT EXISTS widgets (
+            id INTEGER PRIMARY KEY,
+            format TEXT,
+            meta BLOB NOT NULL,
+            raw_content TEXT,
+            version TEXT NOT NULL,
+            is_draft INTEGER NOT NULL,
+            position,
+            "order"
+        );
+        CREATE INDEX IF NOT EXISTS widgets_position
+            ON widgets (position, "order");
+        CREATE TABLE IF NOT EXISTS documents (
+            id INTEGER PRIMARY KEY,
+            unique_key TEXT NOT NULL UNIQUE,
+            kind TEXT NOT NULL,
+            is_draft INTEGER NOT NULL,
+            plain_text TEXT NOT NULL
+        );
+        -- lowercase title and plain text of documents, the trigram tokenizer
+        -- makes any substring (of at least 3 characters) searchable
+        CREATE VIRTUAL TABLE IF NOT EXISTS search
+            USING fts5(title, text, tokenize='trigram');
+    """
+
+    _tables = ('state', 'posts', 'post_tags', 'post_categories', 'pages',
+               'widgets', 'documents', 'search')
+
+    _post_columns = 'id, unique_key, rel_url, format, meta, version'
+    _page_columns = _post_columns
+    _widget_columns = 'id, format, meta, version'
+
+    def __init__(self, database_path=None):
+        """
+        :param database_path: file path of the database, defaults to
+                              the 'SQLITE_DATABASE' config in the instance
+        """
+        super().__init__()
+        if database_path is None:
+            database_path = os.path.join(
+                current_app.instance_path,
+                current_app.config['SQLITE_DATABASE'])
+        self.database_path = database_path
+        self._connection = None
+
+    def __repr__(self):
+        """Representation that also includes the database."""
+        return '<{} {!r} {!r}>'.format(type(self).__name__,
+                                       self.instance_path, self.database_path)
+
+    @property
+    def connection(self):
+        """
+        Connection to the database, which is opened (and the tables
+        are created if necessary) when it's used for the first time.
+        """
+        if self._connection is None:
+            conn = sqlite3.connect(self.database_path)
+            try:
+                if conn.execute('PRAGMA user_version').fetchone()[0] \
+                        != self._schema_version:
+                    self._create_tables(conn)
+            except sqlite3.OperationalError as e:
+                conn.close()
+                raise ConfigurationError(
+                    'SQLite storage requires FTS5 with the trigram '
+                    'tokenizer (SQLite 3.34+): {}'.format(e))
+            self._connection = conn
+        return self._connection
+
+    def _create_tables(self, conn):
+        with conn:
+            for table in self._tables:
+                conn.execute('DROP TABLE IF EXISTS ' + table)
+        conn.executescript(self._schema)
+        conn.execute('PRAGMA user_version = {}'.format(self._schema_version))
+
+    def close(self):
+        """Close the database connection."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        super().close()
+
+    def get_generation(self):
+        """
+        Get the token that is changed whenever the database is synced
+        with changed content.
+
+        :return: generation token
+        """
+        row = self.connection.execute(
+            "SELECT value FROM state WHERE key = 'generation'").fetchone()
+        return row[0] if row is not None else ''
+
+    def sync(self, source):
+        """
+        Sync the database with another storage (usually a FileStorage
+        of the instance), only posts, pages and widgets that changed
+        in the source are written (and rendered for search) again.
+
+        :param source: storage to sync from
+        :return: number of posts, pages and widgets added, updated or removed
+        """
+        conn = self.connection
+        with conn:
+            count = self._sync_table(
+                'posts', source.get_posts(include_draft=True),
+                self._insert_post)
+            count += self._sync_table(
+                'pages', source.get_pages(include_draft=True),
+                self._insert_page)
+            count += self._sync_widgets(source.get_widgets(include_draft=True))
+            if count:
+                conn.execute('INSERT OR REPLACE INTO state (key, value) '
+                             "VALUES ('generation', ?)", (uuid.uuid4().hex,))
+        return count
+
+    @staticmethod
+    def _source_version(obj):
+        """Something that changes when a post, page or widget changes."""
+        return repr((obj.format, dict(obj.meta), obj.raw_content_version()))
+
+    def _sync_table(self, table, objs, insert):
+        """Sync posts or pages, which are identified by unique keys."""
+        conn = self.connection
+        existing = {key: (id_, version) for id_, key, version in conn.execute(
+            'SELECT id, unique_key, version FROM ' + table)}
+        count = 0
+        keys = set()
+        for obj in objs:
+            if obj.unique_key in keys:
+                continue  # another file of the same url
+            keys.add(obj.unique_key)
+            version = self._source_version(obj)
+            old = existing.get(obj.unique_key)
+            if old is not None:
+                if old[1] == version:
+                    continue
+                self._delete(table, old[0], obj.unique_key)
+            insert(obj, version)
+            count += 1
+        for key in existing.keys() - keys:
+            self._delete(table, existing[key][0], key)
+            count += 1
+        return count
+
+    def _sync_widgets(self, widgets):
+        """Sync widgets, which are identified by their versions."""
+        conn = self.connection
+        # key: version, value: ids of widgets
+        existing = {}
+        for id_, version in conn.execute('SELECT id, version FROM widgets'):
+            existing.setdefault(version, []).append(id_)
+        count = 0
+        for widget in widgets:
+            version = self._source_version(widget)
+            if existing.get(version):
+                existing[version].pop()
+                continue
+            conn.execute(
+                'INSERT INTO widgets (format, meta, raw_content, version, '
+                'is_draft, position, "order") VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (widget.format, self._dump_meta(widget), widget.raw_content,
+                 version, int(bool(widget.is_draft)), widget.position,
+                 widget.order))
+            count += 1
+        for ids in existing.values():
+            for id_ in ids:
+                conn.execute('DELETE FROM widgets WHERE id = ?', (id_,))
+                count += 1
+        return count
+
+    @staticmethod
+    def _dump_meta(obj):
+        return pickle.dumps(dict(obj.meta), protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _insert_post(self, post, version):
+        conn = self.connection
+        post_id = conn.execute(
+            'INSERT INTO posts (unique_key, rel_url, format, meta, '
+            'raw_content, version, is_draft, created, updated, title, '
+            'layout, author, email) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (post.unique_key, post.rel_url, post.format,
+             self._dump_meta(post), post.raw_content, version,
+             int(bool(post.is_draft)), _format_datetime(post.created),
+             # an unrecognized 'updated' is never in an updated interval
+             _format_datetime(post.updated)
+             if isinstance(post.updated, datetime) else None,
+             post.title, post.layout,
+             # the author and email of the site are the defaults
+             post.meta.get('author'), post.meta.get('email'))).lastrowid
+        for attr in ('tags', 'categories'):
+            conn.executemany(
+                'INSERT OR IGNORE INTO post_{} (name, post_id, position) '
+                'VALUES (?, ?, ?)'.format(attr),
+                ((name, post_id, i)
+                 for i, name in enumerate(getattr(post, attr))))
+        self._insert_document('post', post)
+
+    def _insert_page(self, page, version):
+        self.connection.execute(
+            'INSERT INTO pages (unique_key, rel_url, path, format, meta, '
+            'raw_content, version, is_draft) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (page.unique_key, page.rel_url, self._page_path(page.rel_url),
+             page.format, self._dump_meta(page), page.raw_content, version,
+             int(bool(page.is_draft))))
+        self._insert_document('page', page)
+
+    def _insert_document(self, kind, obj):
+        """Index the title and plain text of a post or page for search."""
+        conn = self.connection
+        plain_text = get_plain_text(obj)
+        doc_id = conn.execute(
+            'INSERT INTO documents (unique_key, kind, is_draft, plain_text) '
+            'VALUES (?, ?, ?, ?)',
+            (obj.unique_key, kind, int(bool(obj.is_draft)),
+             plain_text)).lastrowid
+        conn.execute('INSERT INTO search (rowid, title, text) '
+                     'VALUES (?, ?, ?)',
+                     (doc_id, (obj.title or '').lower(), plain_text.lower()))
+
+    def _delete(self, table, id_, unique_key):
+        """Delete a post or page, and its tags, categories and document."""
+        conn = self.connection
+        conn.execute('DELETE FROM {} WHERE id = ?'.format(table), (id_,))
+        if table == 'posts':
+            for attr in ('tags', 'categories'):
+                conn.execute('DELETE FROM post_{} WHERE post_id = ?'.format(
+                    attr), (id_,))
+        row = conn.execute('SELECT id FROM documents WHERE unique_key = ?',
+                           (unique_key,)).fetchone()
+        if row is not None:
+            conn.execute('DELETE FROM documents WHERE id = ?', row)
+            conn.execute('DELETE FROM search WHERE rowid = ?', row)
+
+    @staticmethod
+    def _page_path(rel_url):
+        """
+        Get the path of a page (relative to the 'pages' directory,
+        without extension) from its relative url, e.g. 'a/b/index'.
+        """
+        page_dir, _, page_filename = rel_url.rpartition('/')
+        page_filename = os.path.splitext(page_filename)[0] \
+            if page_filename else 'index'
+        return '/'.join(filter(None, (page_dir, page_filename)))
+
+    def _make_post(self, row, rel_url=None):
+        id_, unique_key, stored_rel_url, format_, meta, version = row
+        post = Post()
+        post.format = format_
+        post.meta = pickle.loads(meta)
+        post.defer_raw_content(functools.partial(
+            _load_raw_content, self.database_path, 'posts', id_),
+            version=version)
+        post.rel_url = rel_url or stored_rel_url
+        post.unique_key = unique_key
+        return post
+
+    def _make_page(self, row, rel_url=None):
+        id_, unique_key, stored_rel_url, format_, meta, version = row
+        page = Page()
+        page.format = format_
+        page.meta = pickle.loads(meta)
+        page.defer_raw_content(functools.partial(
+            _load_raw_content, self.database_path, 'pages', id_),
+            version=version)
+        page.rel_url = rel_url or stored_rel_url
+        page.unique_key = unique_key
+        return page
+
+    def _make_widget(self, row):
+        id_, format_, meta, version = row
+        widget = Widget()
+        widget.format = format_
+        widget.meta = pickle.loads(meta)
+        widget.defer_raw_content(functools.partial(
+            _load_raw_content, self.database_path, 'widgets', id_),
+            version=version)
+        return widget
+
+    def fix_page_relative_url(self, rel_url):
+        """
+        Fix page relative url to a standard, uniform format.
+
+        Direct files are looked for in the 'pages' directory,
+        the same as FileStorage does, while directories of pages
+        may exist only in the database.
+
+        :param rel_url: relative url to fix
+        :return: tuple(fixed relative url or FILE PATH if exists else None,
+                       file exists or not)
+        """
+        fixed_rel_url, exists = FileStorage.fix_page_relative_url(rel_url)
+        if not exists and fixed_rel_url is not None \
+                and not fixed_rel_url.endswith('/'):
+            dir_rel_url = rel_url.lstrip('/') + '/'
+            if self.connection.execute(
+                    'SELECT 1 FROM pages WHERE rel_url >= ? AND rel_url < ? '
+                    'LIMIT 1', (dir_rel_url, dir_rel_url[:-1] + '0')
+            ).fetchone() is not None:
+                # a directory of pages
+                return dir_rel_url, False
+        return fixed_rel_url, exists
+
+    def _where_posts(self, include_draft, rel_url_prefix, limits):
+        """
+        Build the 'WHERE' condition of posts that match the relative url
+        prefix and limits (see 'get_posts_with_limits').
+
+        :return: tuple(condition, list of parameters)
+        """
+        conditions = []
+        params = []
+        if not include_draft:
+            conditions.append('is_draft = 0')
+        if rel_url_prefix:
+            conditions.append('rel_url >= ? AND rel_url < ?')
+            params.extend((rel_url_prefix, rel_url_prefix[:-1] + chr(
+                ord(rel_url_prefix[-1]) + 1)))
+        for attr in ('title', 'layout', 'author', 'email'):
+            if not limits.get(attr):
+                continue
+            values = to_list(limits[attr])
+            if attr in ('author', 'email'):
+                conditions.append('COALESCE({}, ?) IN ({})'.format(
+                    attr, _placeholders(values)))
+                params.append(site.get(attr))
+            else:
+                conditions.append('{} IN ({})'.format(
+                    attr, _placeholders(values)))
+            params.extend(values)
+        for attr in ('tags', 'categories'):
+            if limits.get(attr):
+                values = to_list(limits[attr])
+                conditions.append(
+                    'id IN (SELECT post_id FROM post_{} '
+                    'WHERE name IN ({}))'.format(attr, _placeholders(values)))
+                params.extend(values)
+        for attr in ('created', 'updated'):
+            interval = to_interval(limits.get(attr))
+            if interval is not None:
+                conditions.append('{0} >= ? AND {0} < ?'.format(attr))
+                params.extend(map(_format_datetime, interval))
+        return ' AND '.join(conditions) or '1', params
+
+    def _select_posts(self, where, params, offset=0, limit=None):
+        """Get posts that match a condition, the latest first."""
+        return [self._make_post(row) for row in self.connection.execute(
+            'SELECT {} FROM posts WHERE {} '
+            'ORDER BY created DESC, unique_key DESC '
+            'LIMIT ? OFFSET ?'.format(self._post_columns, where),
+            params + [limit if limit is not None else -1, offset])]
+
+    def get_posts(self, include_draft=False, filter_functions=None):
+        """
+        Get all posts from the database.
+
+        :param include_draft: return draft posts or not
+        :param filter_functions: filter to apply to the result
+        :return: an iterable of Post objects (the first is the latest post)
+        """
+        result = self._select_posts(*self._where_posts(include_draft, '', {}))
+        if filter_functions is not None:
+            result = list(self._filter_result(result, filter_functions))
+        return result
+
+    def get_posts_with_limits(self, include_draft=False, rel_url_prefix='',
+                              **limits):
+        """
+        Get posts that match the limits with a query of the database.
+
+        :param include_draft: return draft posts or not
+        :param rel_url_prefix: prefix of relative urls of posts
+        :param limits: same as those of 'Storage.get_posts_with_limits'
+        :return: an iterable of Post objects
+        """
+        return self._select_posts(
+            *self._where_posts(include_draft, rel_url_prefix, limits))
+
+    def get_posts_page(self, include_draft=False, offset=0, limit=None,
+                       after=None, rel_url_prefix='', **limits):
+        """
+        Get a page of posts (filtered as needed), the latest first.
+
+        :return: tuple(list of Post objects, total count of matched posts)
+        """
+        where, params = self._where_posts(include_draft, rel_url_prefix,
+                                          limits)
+        total = self.connection.execute(
+            'SELECT COUNT(*) FROM posts WHERE ' + where, params).fetchone()[0]
+        if after is not None:
+            created, unique_key = after
+            created = _format_datetime(created)
+            where += ' AND (created < ? OR created = ? AND unique_key < ?)'
+            params = params + [created, created, unique_key]
+        return self._select_posts(where, params, offset, limit), total
+
+    def get_post(self, rel_url, include_draft=False):
+        """
+        Get post for given relative url from the database.
+
+        :param rel_url: relative url
+        :param include_draft: return draft post or not
+        :return: a Post object
+        """
+        raw_rel_url = str(rel_url)
+        if rel_url.endswith('/index.html'):
+            rel_url = rel_url.rsplit('/', 1)[0] + '/'
+        row = self.connection.execute(
+            'SELECT {} FROM posts WHERE unique_key = ?{}'.format(
+                self._post_columns, '' if include_draft else
+                ' AND is_draft = 0'), ('/post/' + rel_url,)).fetchone()
+        return self._make_post(row, raw_rel_url) if row is not None else None
+
+    def _count(self, attr):
+        """
+        Get post counts of all tags or categories, in the order they
+        first appear in posts (the latest first).
+        """
+        # the 'position' is that of the post with the max key,
+        # for the created dates are of fixed width
+        return [(name, Pair(count, published))
+                for name, count, published, _, _ in self.connection.execute(
+                    'SELECT t.name, COUNT(*), SUM(p.is_draft = 0), '
+                    'MAX(p.created || p.unique_key) AS first_key, t.position '
+                    'FROM post_{} t JOIN posts p ON p.id = t.post_id '
+                    'GROUP BY t.name '
+                    'ORDER BY first_key DESC, t.position'.format(attr))]
+
+    def get_tags(self):
+        """
+        Get all tags and post count of each tag.
+
+        :return: dict_item(tag_name, Pair(count_all, count_published))
+        """
+        return self._count('tags')
+
+    def get_categories(self):
+        """
+        Get all categories and post count of each category.
+
+        :return dict_item(category_name, Pair(count_all, count_published))
+        """
+        return self._count('categories')
+
+    def get_pages(self, include_draft=False):
+        """
+        Get all custom pages from the database.
+
+        :param include_draft: return draft page or not
+        :return: an iterable of Page objects
+        """
+        return [self._make_page(row) for row in self.connection.execute(
+            'SELECT {} FROM pages{} ORDER BY path'.format(
+                self._page_columns, '' if include_draft else
+                ' WHERE is_draft = 0'))]
+
+    def get_page(self, rel_url, include_draft=False):
+        """
+        Get custom page for given relative url from the database.
+
+        :param rel_url: relative url
+        :param include_draft: return draft page or not
+        :return: a Page object
+        """
+        row = self.connection.execute(
+            'SELECT {} FROM pages WHERE path = ?{} ORDER BY id LIMIT 1'.format(
+                self._page_columns, '' if include_draft else
+                ' AND is_draft = 0'), (self._page_path(rel_url),)).fetchone()
+        if row is None:
+            return None
+        page = self._make_page(row, rel_url)
+        page.unique_key = _page_unique_key(rel_url)
+        return page
+
+    def get_widgets(self, position=None, include_draft=False):
+        """
+        Get widgets for given position from the database.
+
+        :param position: position or position list
+        :param include_draft: return draft widgets or not
+        :return: an iterable of Widget objects
+        """
+        conditions = []
+        params = []
+        if position is not None:
+            positions = to_list(position)
+            conditions.append('position IN ({})'.format(
+                _placeholders(positions)))
+            params.extend(positions)
+        if not include_draft:
+            conditions.append('is_draft = 0')
+        return [self._make_widget(row) for row in self.connection.execute(
+            'SELECT {} FROM widgets WHERE {} '
+            'ORDER BY position, "order", id'.format(
+                self._widget_columns, ' AND '.join(conditions) or '1'),
+            params)]
+
+    def search_page(self, query, include_draft=False, offset=0, limit=None,
+                    after=None):
+        """
+        Search for a query text with the full-text search table,
+        and get a page of the result, the same as 'Storage.search_page'.
+
+        Scores are given by BM25 of FTS5 (with tokens in titles weighted),
+        queries shorter than 3 characters are matched by scanning the table,
+        all of whose scores are 0.
+        """
+        query = query.lower()
+        if not query:
+            return [], 0
+
+        kinds = ['post', 'page'] \
+            if current_app.config['ALLOW_SEARCH_PAGES'] else ['post']
+        where = 'd.kind IN ({})'.format(_placeholders(kinds))
+        params = list(kinds)
+        if not include_draft:
+            where += ' AND d.is_draft = 0'
+        if len(query) >= 3:
+            score = '-bm25(search, 2.0, 1.0)'
+            where += ' AND search MATCH ?'
+            # a phrase of trigrams matches any substring
+            params.append('"{}"'.format(query.replace('"', '""')))
+        else:
+            score = '0.0'
+            where += " AND (search.title LIKE ? ESCAPE '\\' " \
+                     "OR search.text LIKE ? ESCAPE '\\')"
+            pattern = '%{}%'.format(re.sub(r'([%_\\])', r'\\\1', query))
+            params.extend((pattern, pattern))
+        from_ = 'search JOIN documents d ON d.id = search.rowid'
+
+        conn = self.connection
+        total = conn.execute('SELECT COUNT(*) FROM {} WHERE {}'.format(
+            from_, where), params).fetchone()[0]
+        sql = 'SELECT * FROM (SELECT {} AS score, d.unique_key AS key, ' \
+              'd.kind AS kind FROM {} WHERE {})'.format(score, from_, where)
+        if after is not None:
+            sql += ' WHERE score < ? OR score = ? AND key < ?'
+            params = params + [after[0], after[0], after[1]]
+        rows = conn.execute(
+            sql + ' ORDER BY score DESC, key DESC LIMIT ? OFFSET ?',
+            params + [limit if limit is not None else -1, offset]).fetchall()
+
+        # key: unique key, value: post or page
+        objs = {}
+        for kind, table, make in (('post', 'posts', self._make_post),
+                                  ('page', 'pages', self._make_page)):
+            keys = [key for _, key, k in rows if k == kind]
+            if keys:
+                objs.update((row[1], make(row)) for row in conn.execute(
+                    'SELECT {} FROM {} WHERE unique_key IN ({})'.format(
+                        self._post_columns, table, _placeholders(keys)),
+                    keys))
+        return [(score, objs[key]) for score, key, _ in rows], total
+
+    def make_search_snippet(self, unique_key, query):
+        """
+        Make a snippet of the plain text of a post or page
+        around the query text, which is highlighted with '<mark>'.
+
+        :param unique_key: unique key of the post or page
+        :param query: query text
+        :return: an HTML snippet, or None if the post or page is not indexed
+        """
+        row = self.connection.execute(
+            'SELECT plain_text FROM documents WHERE unique_key = ?',
+            (unique_key,)).fetchone()
+        return make_snippet(row[0], query) if row is not None else None
@@ -1,6 +1,14 @@
 import re
+from abc import ABCMeta, abstractmethod
 from html.parser import HTMLParser
 
+from markdown import util as markdown_util
+from markdown.extensions import Extension
+from markdown.treeprocessors import Treeprocessor
+
+
+_header_tag_exp = re.compile(r'^h([123456])$', flags=re.IGNORECASE)
+
 
 class _HtmlHeaderNode(object):
     """Represents a header element when parsing the HTML string."""
@@ -32,8 +40,11 @@ class _HtmlHeaderNode(object):
         }
 
 
-class HtmlTocParser(HTMLParser):
-    """Parse table of content from a given HTML string."""
+class _TocBuilder(metaclass=ABCMeta):
+    """
+    Base class of TOC builders, which build the header tree of an HTML string,
+    and generate header anchor ids.
+    """
 
     # regular expression for replacing all punctuations in the header with '-'
     _punctuations_exp = re.compile(
@@ -45,22 +56,47 @@ class HtmlTocParser(HTMLParser):
 
     def __init__(self):
         """Initialize attributes."""
-        super().__init__(convert_charrefs=False)
         # root node with no data of itself, only 'children' matters
         self._root = _HtmlHeaderNode(level=0)
         # most recently handled header node
         self._curr_node = self._root
-        self._in_header = False
         # record header ids to avoid collisions
         self._header_id_count = {}
-        # full HTML string parsed
-        self._html = ''
-        # temporary HTML start tag of this current header node
-        self._temp_start_tag = ''
+
+    @property
+    @abstractmethod
+    def html(self):
+        """The HTML string with additional tags marking the header anchors."""
+
+    def _add_header(self, level):
+        """Add a header node to the tree, and make it the current node."""
+        new_node = _HtmlHeaderNode(level=level)
+        while new_node.level <= self._curr_node.level:
+            # the new node is a higher level header, e.g. new: h2, curr: h4
+            # so we return back until the current is higher
+            self._curr_node = self._curr_node.father
+        # assign the new node as a child of the current node
+        new_node.father = self._curr_node
+        self._curr_node.children.append(new_node)
+        self._curr_node = new_node
+        return new_node
+
+    def _make_header_id(self, text):
+        """Make a unique anchor id from the text of a header."""
+        header_id = self._punctuations_exp.sub('-', text).strip('-')
+        count = self._header_id_count.setdefault(header_id, 0)
+        self._header_id_count[header_id] += 1
+        if count > 0:
+            header_id += '_%d' % count
+        return header_id
+
+    @staticmethod
+    def _make_anchor(header_id):
+        return '<a id="{0}" href="#{0}" class="anchor"></a>'.format(header_id)
 
     def toc(self, depth=6, lowest_level=6):
         """
-        Get table of content of currently fed HTML string.
+        Get table of content of the HTML string.
 
         :param depth: the depth of TOC
         :param lowest_level: the allowed lowest level of header tag
@@ -69,54 +105,85 @@ class HtmlTocParser(HTMLParser):
         depth = min(max(depth, 0), 6)
         depth = 6 if depth == 0 else depth
         lowest_level = min(max(lowest_level, 1), 6)
-        toc = self._root.to_dict()['children']
-
-        def traverse(curr_toc, dep, lowest_lvl, curr_depth=1):
-            if curr_depth > dep:
-                # clear all items of this depth and exit the recursion
-                curr_toc.clear()
-                return
-
-            items_to_remove = []
-            for item in curr_toc:
-                if item['level'] > lowest_lvl:
-                    # record item with low header level, for removing it later
-                    items_to_remove.append(item)
-                else:
-                    traverse(item['children'], dep, lowest_lvl, curr_depth + 1)
-            [curr_toc.remove(item) for item in items_to_remove]
-
-        traverse(toc, depth, lowest_level)
-        return toc
+
+        def traverse(nodes, curr_depth=1):
+            if curr_depth > depth:
+                return []
+            # headers with lower levels are skipped with their children,
+            # whose levels are even lower
+            return [{
+                'level': node.level,
+                'id': node.id,
+                'text': node.text,
+                'inner_html': node.inner_html,
+                'children': traverse(node.children, curr_depth + 1)
+            } for node in nodes if node.level <= lowest_level]
+
+        return traverse(self._root.children)
 
     def toc_html(self, depth=6, lowest_level=6):
         """
-        Get TOC of currently fed HTML string in form of HTML string.
+        Get TOC of the HTML string in form of HTML string.
 
         :param depth: the depth of TOC
         :param lowest_level: the allowed lowest level of header tag
         :return: an HTML string
         """
+        return self.render_toc(self.toc(depth=depth,
+                                        lowest_level=lowest_level))
+
+    def html_and_toc(self, depth=6, lowest_level=6):
+        """
+        Get the parsed HTML string, TOC list and TOC HTML string at once,
+        the TOC list is computed only once.
+
+        :param depth: the depth of TOC
+        :param lowest_level: the allowed lowest level of header tag
+        :return: tuple(HTML string, TOC list, TOC HTML string)
+        """
         toc = self.toc(depth=depth, lowest_level=lowest_level)
-        if not toc:
-            return ''
+        return self.html, toc, self.render_toc(toc)
+
+    @staticmethod
+    def render_toc(toc):
+        """
+        Convert a TOC list (returned by 'toc' method) to an HTML string.
+
+        :param toc: TOC list
+        :return: an HTML string
+        """
+        parts = []
 
         def map_toc_list(toc_list):
-            result = ''
-            if toc_list:
-                result += '<ul>\n'
-                result += ''.join(
-                    map(lambda x: '<li>'
-                                  '<a href="#{}">{}</a>{}'
-                                  '</li>\n'.format(
-                        x['id'], x['inner_html'],
-                        map_toc_list(x['children'])),
-                        toc_list)
-                )
-                result += '</ul>'
-            return result
-
-        return map_toc_list(toc)
+            parts.append('<ul>\n')
+            for item in toc_list:
+                parts.append('<li><a href="#{}">{}</a>'.format(
+                    item['id'], item['inner_html']))
+                if item['children']:
+                    map_toc_list(item['children'])
+                parts.append('</li>\n')
+            parts.append('</ul>')
+
+        if toc:
+            map_toc_list(toc)
+        return ''.join(parts)
+
+
+class HtmlTocParser(HTMLParser, _TocBuilder):
+    """Parse table of content from a given HTML string."""
+
+    def __init__(self):
+        """Initialize attributes."""
+        HTMLParser.__init__(self, convert_charrefs=False)
+        _TocBuilder.__init__(self)
+        self._in_header = False
+        # pieces of the full HTML string parsed
+        self._html_parts = []
+        # temporary HTML start tag of this current header node
+        self._temp_start_tag = ''
+        # pieces of the text and inner HTML of this current header node
+        self._text_parts = []
+        self._inner_html_parts = []
 
     @property
     def html(self):
@@ -130,7 +197,9 @@ class HtmlTocParser(HTMLParser):
 
             `<h1><a id="Title" class="anchor"></a>Title</h1>`
         """
-        return self._html
+        if len(self._html_parts) > 1:
+            self._html_parts[:] = [''.join(self._html_parts)]
+        return self._html_parts[0] if self._html_parts else ''
 
     @staticmethod
     def _get_level(tag):
@@ -138,7 +207,7 @@ class HtmlTocParser(HTMLParser):
         Match the header level in the given tag name,
         or None if it's not a header tag.
         """
-        m = re.match(r'^h([123456])$', tag, flags=re.IGNORECASE)
+        m = _header_tag_exp.match(tag)
         if not m:
             return None
         return int(m.group(1))
@@ -149,25 +218,17 @@ class HtmlTocParser(HTMLParser):
             ' '.join(['{}="{}"'.format(*attr) for attr in attrs]))
 
         if self._in_header:
-            self._curr_node.inner_html += curr_tag
+            self._inner_html_parts.append(curr_tag)
             return
 
         level = self._get_level(tag)
         if level is not None:
             self._in_header = True
-            new_node = _HtmlHeaderNode(level=level)
-            while new_node.level <= self._curr_node.level:
-                # the new node is a higher level header, e.g. new: h2, curr: h4
-                # so we return back until the current is higher
-                self._curr_node = self._curr_node.father
-            # assign the new node as a child of the current node
-            new_node.father = self._curr_node
-            self._curr_node.children.append(new_node)
-            self._curr_node = new_node
+            self._add_header(level)
             self._temp_start_tag = curr_tag
             return
 
-        self._html += curr_tag
+        self._html_parts.append(curr_tag)
 
     def handle_startendtag(self, tag, attrs):
         curr_tag = '<{}{}{} />'.format(
@@ -175,44 +236,46 @@ class HtmlTocParser(HTMLParser):
             ' '.join(['{}="{}"'.format(*attr) for attr in attrs]))
 
         if self._in_header:
-            self._curr_node.inner_html += curr_tag
+            self._inner_html_parts.append(curr_tag)
             return
 
+        self._html_parts.append(curr_tag)
+
     def handle_endtag(self, tag):
         curr_tag = '</{}>'.format(tag)
 
         if self._get_level(tag) is not None:
-            header_id = self._punctuations_exp.sub(
-                '-', self._curr_node.text).strip('-')
-            count = self._header_id_count.setdefault(header_id, 0)
-            self._header_id_count[header_id] += 1
-            if count > 0:
-                header_id += '_%d' % count
-
+            if self._in_header:
+                self._curr_node.text = ''.join(self._text_parts)
+                self._curr_node.inner_html = ''.join(self._inner_html_parts)
+                self._text_parts.clear()
+                self._inner_html_parts.clear()
+            header_id = self._make_header_id(self._curr_node.text)
             self._curr_node.id = header_id
-            # start tag of the current header node
-            self._html += self._temp_start_tag
-            # anchor
-            self._html += \
-                '<a id="{0}" href="#{0}" class="anchor"></a>'.format(header_id)
-            # header content and end tag
-            self._html += self._curr_node.inner_html + curr_tag
+            self._html_parts.extend((
+                # start tag of the current header node
+                self._temp_start_tag,
+                # anchor
+                self._make_anchor(header_id),
+                # header content and end tag
+                self._curr_node.inner_html, curr_tag
+            ))
             self._temp_start_tag = ''
             self._in_header = False
             return
         elif self._in_header:
-            self._curr_node.inner_html += curr_tag
+            self._inner_html_parts.append(curr_tag)
             return
 
-        self._html += curr_tag
+        self._html_parts.append(curr_tag)
 
     def handle_data(self, data):
         if self._in_header:
-            self._curr_node.text += data
-            self._curr_node.inner_html += data
+            self._text_parts.append(data)
+            self._inner_html_parts.append(data)
             return
 
-        self._html += data
+        self._html_parts.append(data)
 
     def handle_comment(self, data):
         self.handle_data('<!--{}-->'.format(data))
@@ -225,3 +288,123 @@ class HtmlTocParser(HTMLParser):
 
     def error(self, message):
         pass  # pragma: no cover
+
+
+class MarkdownToc(_TocBuilder):
+    """
+    Table of content collected while rendering Markdown,
+    by 'MarkdownTocExtension'.
+
+    The header anchor ids and the TOC are the same as those
+    HtmlTocParser gets from the rendered HTML string.
+    """
+
+    def __init__(self):
+        """Initialize attributes."""
+        super().__init__()
+        self._html = ''
+
+    @property
+    def html(self):
+        """
+        The rendered HTML string with additional tags
+        marking the header anchors.
+        """
+        return self._html
+
+    @html.setter
+    def html(self, value):
+        self._html = value
+
+
+_raw_header_exp = re.compile(r'<h[1-6][\s/>]', flags=re.IGNORECASE)
+_markdown_placeholder_exp = re.compile(
+    r'{0}(?:wzxhzdk:(\d+)|(\d+)){1}'.format(markdown_util.STX,
+                                            markdown_util.ETX))
+
+
+class _MarkdownTocTreeprocessor(Treeprocessor):
+    """
+    Collect headers of the element tree into a MarkdownToc,
+    and add anchors to them.
+    """
+
+    def run(self, root):
+        if any(_raw_header_exp.search(html)
+               for html in self.md.htmlStash.rawHtmlBlocks):
+            # headers in raw HTML are not in the element tree,
+            # the rendered HTML string should be parsed by HtmlTocParser
+            self.md.toc = None
+            return
+
+        toc = self.md.toc = MarkdownToc()
+        for elem in root.iter():
+            level = HtmlTocParser._get_level(elem.tag) \
+                if isinstance(elem.tag, str) else None
+            if level is None:
+                continue
+
+            node = toc._add_header(level)
+            node.inner_html = self._inner_html(elem)
+            if '<' in node.inner_html:
+                # the header contains tags, get its text and inner HTML
+                # in the same way as HtmlTocParser
+                parser = HtmlTocParser()
+                parser.feed('<h1>' + node.inner_html + '</h1>')
+                parsed_node = parser._root.children[0]
+                node.text, node.inner_html = \
+                    parsed_node.text, parsed_node.inner_html
+            else:
+                # entities are kept as they are by HtmlTocParser
+                node.text = node.inner_html
+            node.id = toc._make_header_id(node.text)
+
+            # store the anchor as raw HTML, so that it's not escaped,
+            # and its attributes keep the same order as HtmlTocParser
+            placeholder = self.md.htmlStash.store(toc._make_anchor(node.id))
+            elem.text = placeholder + (elem.text or '')
+
+    def _inner_html(self, elem):
+        """
+        Get the inner HTML of an element in the final output,
+        with placeholders replaced as the postprocessors do.
+        """
+        tail, elem.tail = elem.tail, None
+        try:
+            html = self.md.serializer(elem)
+        finally:
+            elem.tail = tail
+        html = html[html.index('>') + 1:html.rindex('<')]
+        if markdown_util.STX not in html:
+            return html
+
+        def replace(m):
+            if m.group(1) is not None:
+                # raw HTML
+                return self.md.htmlStash.rawHtmlBlocks[int(m.group(1))]
+            # escaped character
+            return chr(int(m.group(2)))
+
+        html = html.replace(markdown_util.AMP_SUBSTITUTE, '&')
+        return _markdown_placeholder_exp.sub(replace, html)
+
+
+class MarkdownTocExtension(Extension):
+    """
+    Markdown extension that adds anchors to headers and collects the TOC
+    while rendering, instead of parsing the rendered HTML string again.
+
+    After a conversion, the 'toc' attribute of the Markdown object
+    is a MarkdownToc object, whose 'html' should be set to the output.
+    """
+
+    def extendMarkdown(self, md):
+        md.registerExtension(self)
+        self.md = md
+        md.toc = None
+        # after inline patterns (20) and prettifying (10)
+        md.treeprocessors.register(_MarkdownTocTreeprocessor(md),
+                                   'veripress_toc', 5)
+
+    def reset(self):
+        self.md.toc = None
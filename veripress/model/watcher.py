@@ -0,0 +1,293 @@
+import os
+import sys
+import stat
+import select
+import struct
+import logging
+import threading
+import ctypes
+import ctypes.util
+
+logger = logging.getLogger(__name__)
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    # make sure the inotify API is there (Linux only)
+    _libc.inotify_init1
+    _libc.inotify_add_watch
+    _libc.inotify_rm_watch
+except (OSError, AttributeError):
+    _libc = None
+
+# constants from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+_event_header = struct.Struct('iIII')
+
+
+def _is_link(path):
+    """Check if a path is a symbolic link or a hard link of another file."""
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISLNK(st.st_mode) or st.st_nlink > 1
+
+
+class Watcher(object):
+    """
+    Base class of watchers, which observe the directories of some FileIndex
+    objects in a background thread, and apply changes to the indexes,
+    so that the indexes never have to scan the directories on their own.
+    """
+
+    def __init__(self, indexes):
+        """
+        :param indexes: FileIndex objects to keep up to date
+        """
+        self.indexes = list(indexes)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Bring the indexes up to date and start watching."""
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._setup()
+        for index in self.indexes:
+            index.rescan()
+            index.watched = True
+        self._thread = threading.Thread(target=self._run,
+                                        name=type(self).__name__)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching, the indexes will scan on their own again."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for index in self.indexes:
+            index.watched = False
+        self._teardown()
+
+    def _setup(self):
+        pass
+
+    def _teardown(self):
+        pass
+
+    def _run(self):
+        raise NotImplementedError
+
+
+class PollingWatcher(Watcher):
+    """Rescan the directories periodically."""
+
+    def __init__(self, indexes, interval=1.0):
+        """
+        :param indexes: FileIndex objects to keep up to date
+        :param interval: seconds between two scans
+        """
+        super(PollingWatcher, self).__init__(indexes)
+        self.interval = interval
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            for index in self.indexes:
+                try:
+                    index.rescan()
+                except Exception:
+                    logger.exception('Failed to rescan "%s".',
+                                     index.root_path)
+
+
+class InotifyWatcher(Watcher):
+    """Watch the directories with inotify (Linux only)."""
+
+    _file_mask = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | \
+        IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+    # to notice the creation and removal of the root directories
+    _parent_mask = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | \
+        IN_ONLYDIR
+
+    def __init__(self, indexes, timeout=0.5):
+        """
+        :param indexes: FileIndex objects to keep up to date
+        :param timeout: seconds to wait for events before checking
+                        whether the watcher is stopped
+        """
+        super(InotifyWatcher, self).__init__(indexes)
+        self.timeout = timeout
+        self._fd = None
+        # key: watch descriptor, value: tuple(index, relative dir)
+        self._watches = {}
+        # key: watch descriptor, value: path of a parent of root directories
+        self._parents = {}
+
+    @staticmethod
+    def available():
+        return _libc is not None and sys.platform.startswith('linux')
+
+    def _setup(self):
+        fd = _libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._fd = fd
+        for parent in {os.path.dirname(index.root_path)
+                       for index in self.indexes}:
+            wd = self._add_watch(parent, self._parent_mask)
+            if wd >= 0:
+                self._parents[wd] = parent
+        for index in self.indexes:
+            self._watch_tree(index)
+
+    def _teardown(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._watches.clear()
+        self._parents.clear()
+
+    def _add_watch(self, path, mask):
+        return _libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+
+    def _watch_tree(self, index, rel_dir=''):
+        """Watch a directory of an index and its subdirectories if needed."""
+        path = index.file_path(rel_dir)
+        wd = self._add_watch(path, self._file_mask)
+        if wd < 0:
+            # the directory doesn't exist (any more)
+            return
+        self._watches[wd] = (index, rel_dir)
+        if index.recursive:
+            try:
+                names = os.listdir(path)
+            except OSError:
+                return
+            for name in names:
+                if os.path.isdir(os.path.join(path, name)):
+                    self._watch_tree(index, rel_dir + name + '/')
+
+    def _rewatch(self, index):
+        """Rescan an index and watch its directories again."""
+        for wd, (index_, _) in list(self._watches.items()):
+            if index_ is index:
+                _libc.inotify_rm_watch(self._fd, wd)
+                del self._watches[wd]
+        # watch before scanning, so that no change is missed
+        self._watch_tree(index)
+        index.rescan()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            ready, _, _ = select.select([self._fd], [], [], self.timeout)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            for wd, mask, name in self._parse_events(data):
+                try:
+                    self._handle_event(wd, mask, name)
+                except Exception:
+                    logger.exception('Failed to handle inotify event.')
+            for index in self.indexes:
+                index.flush()
+
+    @staticmethod
+    def _parse_events(data):
+        """Parse 'inotify_event' structs, yield (wd, mask, name) tuples."""
+        pos = 0
+        while pos + _event_header.size <= len(data):
+            wd, mask, _, length = _event_header.unpack_from(data, pos)
+            pos += _event_header.size
+            name = os.fsdecode(data[pos:pos + length].rstrip(b'\0'))
+            pos += length
+            yield wd, mask, name
+
+    def _handle_event(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # some events were lost
+            for index in self.indexes:
+                self._rewatch(index)
+            return
+
+        if wd in self._parents:
+            if mask & IN_ISDIR:
+                path = os.path.join(self._parents[wd], name)
+                for index in self.indexes:
+                    if index.root_path == path:
+                        self._rewatch(index)
+            return
+
+        watch = self._watches.get(wd)
+        if watch is None:
+            return
+        index, rel_dir = watch
+        if mask & IN_IGNORED:
+            # the watch was removed, because the directory was removed
+            del self._watches[wd]
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            if not rel_dir:
+                # the root directory is gone
+                self._rewatch(index)
+            elif mask & IN_MOVE_SELF:
+                # the subdirectory is moved to somewhere else,
+                # it's watched again if it's still in the root directory
+                _libc.inotify_rm_watch(self._fd, wd)
+                del self._watches[wd]
+            return
+
+        rel_path = rel_dir + name
+        if mask & IN_CREATE and not mask & IN_ISDIR:
+            path = index.file_path(rel_path)
+            if not _is_link(path):
+                # newly created files are handled when they are closed,
+                # while links are created without being opened
+                return
+            if os.path.isdir(path):
+                # a symbolic link to a directory
+                mask |= IN_ISDIR
+        if mask & IN_ISDIR:
+            if index.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(index, rel_path + '/')
+            index.rescan()
+        else:
+            index.update(rel_path)
+
+
+def create_watcher(indexes, interval=1.0):
+    """
+    Create a watcher for the given FileIndex objects,
+    an InotifyWatcher if inotify is available, or a PollingWatcher.
+
+    :param indexes: FileIndex objects to keep up to date
+    :param interval: seconds between two scans of the PollingWatcher
+    :return: a Watcher object (not started)
+    """
+    if InotifyWatcher.available():
+        return InotifyWatcher(indexes)
+    return PollingWatcher(indexes, interval=interval)
@@ -6,6 +6,7 @@ from flask import Blueprint, request, render_template, g
 
 from veripress import site, cache
 from veripress.model import storage
+from veripress.model.storages import generation_cache_name
 from veripress.model.parsers import get_parser
 from veripress.helpers import url_rule, to_list
 
@@ -32,7 +33,7 @@ def parse_content_of_models(obj):
     return get_parser(obj.format).parse_whole(obj.raw_content)
 
 
-@cache.memoize(timeout=2 * 60)
+@cache.memoize(make_name=generation_cache_name)
 def custom_render_template(template_name_or_list, **context):
     """
     Try to render templates in the custom folder first,
@@ -1,5 +1,3 @@
-from itertools import islice
-
 from flask import (
     url_for, request, redirect, current_app, send_file, abort, make_response
 )
@@ -8,10 +6,10 @@ from werkzeug.contrib.atom import AtomFeed
 from veripress import site, cache
 from veripress.view import templated, custom_render_template
 from veripress.model import storage
-from veripress.model.models import Base
+from veripress.model.storages import generation_cache_name
 from veripress.model.parsers import get_parser
 from veripress.helpers import (
-    timezone_from_str, parse_toc, validate_custom_page_path
+    timezone_from_str, parse_whole_with_toc, validate_custom_page_path
 )
 
 
@@ -19,7 +17,7 @@ def make_abs_url(unique_key):
     return request.script_root + unique_key
 
 
-@cache.memoize(timeout=2 * 60)
+@cache.memoize(make_name=generation_cache_name)
 @templated()
 def index(page_num=1):
     if page_num <= 1 and request.path != '/':
@@ -30,16 +28,14 @@ def index(page_num=1):
         # there is an 'index.*' custom page, we use this as index.
         return page('index.html')
 
-    all_posts = storage.get_posts(include_draft=False)
-
     count = current_app.config['ENTRIES_PER_PAGE']
     start = (page_num - 1) * count
+    page_posts, total = storage.get_posts_page(
+        include_draft=False, offset=start, limit=count)
 
     posts = []
-    # slice an additional one to check if there is more
-    for post_ in islice(all_posts, start, start + count + 1):
-        post_d = post_.to_dict()
-        del post_d['raw_content']
+    for post_ in page_posts:
+        post_d = post_.to_dict(exclude=('raw_content',))
         post_d['preview'], post_d['has_more_content'] = \
             get_parser(post_.format).parse_preview(post_.raw_content)
         post_d['url'] = make_abs_url(post_.unique_key)
@@ -51,9 +47,7 @@ def index(page_num=1):
             '.index', page_num=next_page_num if next_page_num != 1 else None)
     else:
         next_url = None
-    if len(posts) > count:
-        # the additional one is included
-        posts = posts[:count]
+    if start + count < total:
         prev_url = url_for('.index', page_num=page_num + 1)
     else:
         prev_url = None
@@ -61,7 +55,7 @@ def index(page_num=1):
     return dict(entries=posts, next_url=next_url, prev_url=prev_url)
 
 
-@cache.memoize(timeout=2 * 60)
+@cache.memoize(make_name=generation_cache_name)
 @templated()
 def post(year, month, day, post_name):
     rel_url = request.path[len('/post/'):]
@@ -74,11 +68,9 @@ def post(year, month, day, post_name):
     if post_ is None:
         abort(404)
 
-    post_d = post_.to_dict()
-    del post_d['raw_content']
-    post_d['content'] = get_parser(post_.format).parse_whole(post_.raw_content)
+    post_d = post_.to_dict(exclude=('raw_content',))
     post_d['content'], post_d['toc'], post_d['toc_html'] = \
-        parse_toc(post_d['content'])
+        parse_whole_with_toc(get_parser(post_.format), post_.raw_content)
     post_d['url'] = make_abs_url(post_.unique_key)
     post_ = post_d
 
@@ -102,7 +94,7 @@ def page(rel_url):
         # it's not the correct relative url, so redirect
         return redirect(url_for('.page', rel_url=fixed_rel_url))
 
-    resp = cache.get('view-handler.' + rel_url)
+    resp = cache.get(generation_cache_name('view-handler.' + rel_url))
     if resp is not None:
         return resp  # pragma: no cover, here just get the cached response
 
@@ -110,20 +102,18 @@ def page(rel_url):
     if page_ is None:
         abort(404)
 
-    page_d = page_.to_dict()
-    del page_d['raw_content']
-    page_d['content'] = get_parser(page_.format).parse_whole(page_.raw_content)
+    page_d = page_.to_dict(exclude=('raw_content',))
     page_d['content'], page_d['toc'], page_d['toc_html'] = \
-        parse_toc(page_d['content'])
+        parse_whole_with_toc(get_parser(page_.format), page_.raw_content)
     page_d['url'] = make_abs_url(page_.unique_key)
     page_ = page_d
 
     resp = custom_render_template(page_['layout'] + '.html', entry=page_)
-    cache.set('view-handler.' + rel_url, resp, timeout=2 * 60)
+    cache.set(generation_cache_name('view-handler.' + rel_url), resp)
     return resp
 
 
-@cache.memoize(timeout=2 * 60)
+@cache.memoize(make_name=generation_cache_name)
 @templated('category.html', 'archive.html')
 def category(category_name):
     posts = storage.get_posts_with_limits(
@@ -132,8 +122,7 @@ def category(category_name):
         abort(404)
 
     def convert_to_dict(post_):
-        post_d = post_.to_dict()
-        del post_d['raw_content']
+        post_d = post_.to_dict(exclude=('raw_content',))
         post_d['preview'], post_d['has_more_content'] = \
             get_parser(post_.format).parse_preview(post_.raw_content)
         post_d['url'] = make_abs_url(post_.unique_key)
@@ -145,7 +134,7 @@ def category(category_name):
                 archive_name=category_name)
 
 
-@cache.memoize(timeout=2 * 60)
+@cache.memoize(make_name=generation_cache_name)
 @templated('tag.html', 'archive.html')
 def tag(tag_name):
     posts = storage.get_posts_with_limits(
@@ -154,8 +143,7 @@ def tag(tag_name):
         abort(404)
 
     def convert_to_dict(post_):
-        post_d = post_.to_dict()
-        del post_d['raw_content']
+        post_d = post_.to_dict(exclude=('raw_content',))
         post_d['preview'], post_d['has_more_content'] = \
             get_parser(post_.format).parse_preview(post_.raw_content)
         post_d['url'] = make_abs_url(post_.unique_key)
@@ -165,11 +153,9 @@ def tag(tag_name):
     return dict(entries=posts, archive_type='Tag', archive_name=tag_name)
 
 
-@cache.memoize(timeout=2 * 60)
+@cache.memoize(make_name=generation_cache_name)
 @templated()
 def archive(year=None, month=None):
-    posts = storage.get_posts_with_limits(include_draft=False)
-
     rel_url_prefix = ''
     archive_name = ''
     if year is not None:
@@ -179,17 +165,17 @@ def archive(year=None, month=None):
         rel_url_prefix += '%02d/' % month
         archive_name += '.' + str(month)
 
+    posts = storage.get_posts_with_limits(include_draft=False,
+                                          rel_url_prefix=rel_url_prefix)
+
     def convert_to_dict(post_):
-        post_d = post_.to_dict()
-        del post_d['raw_content']
+        post_d = post_.to_dict(exclude=('raw_content',))
         post_d['preview'], post_d['has_more_content'] = \
             get_parser(post_.format).parse_preview(post_.raw_content)
         post_d['url'] = make_abs_url(post_.unique_key)
         return post_d
 
-    posts = list(map(convert_to_dict,
-                     filter(lambda p: p.rel_url.startswith(rel_url_prefix),
-                            posts)))
+    posts = list(map(convert_to_dict, posts))
     return dict(entries=posts,
                 archive_type='Archive',
                 archive_name=archive_name if archive_name else 'All')
@@ -203,28 +189,28 @@ def search():
         abort(404)
 
     def process(p):
-        del p['raw_content']
         p['url'] = make_abs_url(p['unique_key'])
+        p['snippet'] = storage.make_search_snippet(p['unique_key'], query)
         return p
 
-    result = list(map(process, map(Base.to_dict, storage.search_for(query))))
+    result = list(map(process, map(
+        lambda p: p.to_dict(exclude=('raw_content',)),
+        storage.search_for(query))))
     return dict(entries=result,
                 archive_type='Search',
                 archive_name='"{}"'.format(raw_query))
 
 
-@cache.memoize(timeout=2 * 60)
+@cache.memoize(make_name=generation_cache_name)
 def feed():
     def convert_to_dict(p):
-        post_d = p.to_dict()
-        del post_d['raw_content']
+        post_d = p.to_dict(exclude=('raw_content',))
         post_d['content'] = get_parser(p.format).parse_whole(p.raw_content)
         post_d['url'] = site['root_url'] + make_abs_url(p.unique_key)
         return post_d
 
-    posts = map(convert_to_dict,
-                islice(storage.get_posts(include_draft=False),
-                       0, current_app.config['FEED_COUNT']))
+    posts = map(convert_to_dict, storage.get_posts_page(
+        include_draft=False, limit=current_app.config['FEED_COUNT'])[0])
 
     atom = AtomFeed(title=site['title'],
                     subtitle=site['subtitle'],
@@ -20,3 +20,4 @@ import veripress_cli.serve
 import veripress_cli.theme
 import veripress_cli.generate
 import veripress_cli.deploy
+import veripress_cli.import_
@@ -118,6 +118,8 @@ def do_generate():
 
     if app.config['STORAGE_TYPE'] == 'file':
         generate_pages_by_file()
+    else:
+        generate_pages_by_storage()
 
 
 def generate_pages_by_file():
@@ -157,3 +159,38 @@ def generate_pages_by_file():
             else:
                 # is other direct files
                 copy_file(path, os.path.join(deploy_dir, rel_path))
+
+
+def generate_pages_by_storage():
+    """
+    Generates custom pages of storage types other than 'file',
+    direct files are still copied from the 'pages' folder.
+    """
+    from veripress import app
+    from veripress.model import storage
+    from veripress.model.parsers import get_standard_format_name
+    from veripress.helpers import traverse_directory
+
+    deploy_dir = get_deploy_dir()
+
+    with app.app_context(), app.test_client() as client:
+        for page in storage.get_pages(include_draft=False):
+            file_path = os.path.join(
+                deploy_dir, page.rel_url.replace('/', os.path.sep))
+            if page.rel_url.endswith('/'):
+                file_path += 'index.html'
+            makedirs(os.path.dirname(file_path), mode=0o755, exist_ok=True)
+            with open(file_path, 'wb') as f:
+                f.write(client.get('/' + page.rel_url).data)
+
+        root_path = os.path.join(app.instance_path, 'pages')
+        if not os.path.isdir(root_path):
+            return
+        for path in traverse_directory(root_path):
+            rel_path = os.path.relpath(path, root_path)
+            ext = os.path.splitext(rel_path)[1]
+            if get_standard_format_name(ext[1:]) is None:
+                # is other direct files
+                dst = os.path.join(deploy_dir, rel_path)
+                makedirs(os.path.dirname(dst), mode=0o755, exist_ok=True)
+                shutil.copyfile(path, dst)
@@ -0,0 +1,34 @@
+import click
+
+from veripress_cli import cli
+
+
+@cli.command('import', short_help='Import content into the SQLite database.',
+             help='This command will sync the SQLite database '
+                  '(used by "sqlite" storage mode) of the chosen instance '
+                  'with the posts, pages and widgets in its "posts", '
+                  '"pages" and "widgets" folders. Only changed files '
+                  'are imported again, and removed files are removed '
+                  'from the database.')
+def import_command():
+    from veripress import app
+
+    with app.app_context():
+        count, database_path = do_import()
+    click.echo('{} posts, pages and widgets have been imported into '
+               '"{}".'.format(count, database_path))
+
+
+def do_import():
+    """
+    Sync the SQLite database of the current app with the content folders.
+
+    :return: tuple(number of changed posts/pages/widgets, database path)
+    """
+    from veripress.model.storages import FileStorage, SqliteStorage
+
+    storage_ = SqliteStorage()
+    try:
+        return storage_.sync(FileStorage()), storage_.database_path
+    finally:
+        storage_.close()
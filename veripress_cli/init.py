@@ -12,8 +12,8 @@ from veripress_cli import cli
                   'as a new VeriPress instance, which means to create '
                   'default configuration file, necessary subdirectories, etc.')
 @click.option('--storage-mode', '-s', default='file',
-              type=click.Choice(['file']),
-              help='Storage mode (only "file" mode supported currently).')
+              type=click.Choice(['file', 'sqlite']),
+              help='Storage mode ("file" or "sqlite").')
 def init_command(storage_mode):
     from veripress import app
     instance_path = app.instance_path
@@ -31,9 +31,15 @@ def init_command(storage_mode):
     shutil.copytree(os.path.join(defaults_dir, 'static'),
                     os.path.join(instance_path, 'static'))
     os.mkdir(os.path.join(instance_path, 'themes'))
+    init_gitignore(instance_path, app.config['CACHE_FOLDER'])
 
-    if storage_mode == 'file':
+    if storage_mode in ('file', 'sqlite'):
+        # content of sqlite storage is imported from the same folders
         init_file_storage(instance_path)
+    if storage_mode == 'sqlite':
+        from veripress_cli.import_ import do_import
+        with app.app_context():
+            do_import()
 
     click.echo('\nDefault files and configurations has been created!\n\n'
                'Now you can run "veripress theme install default" to '
@@ -41,6 +47,29 @@ def init_command(storage_mode):
                'to preview the blog.\n\nEnjoy!')
 
 
+def init_gitignore(instance_path, cache_folder):
+    """
+    Add the cache folder (indexes and rendered contents, which are rebuilt
+    whenever necessary) to '.gitignore' of the instance,
+    since the instance is usually a Git repository of the content.
+    """
+    if os.path.isabs(cache_folder):
+        # not in the instance
+        return
+    entry = '/{}/'.format(cache_folder.replace(os.path.sep, '/').strip('/'))
+    gitignore_path = os.path.join(instance_path, '.gitignore')
+    content = ''
+    if os.path.exists(gitignore_path):
+        with open(gitignore_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+    if {entry, entry[1:], entry[1:-1]} & set(content.splitlines()):
+        return
+    with open(gitignore_path, 'a', encoding='utf-8') as f:
+        if content and not content.endswith('\n'):
+            f.write('\n')
+        f.write(entry + '\n')
+
+
 def init_file_storage(instance_path):
     os.mkdir(os.path.join(instance_path, 'posts'))
     os.mkdir(os.path.join(instance_path, 'pages'))
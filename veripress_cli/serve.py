@@ -9,12 +9,27 @@ from veripress_cli import cli
 @click.option('--host', '-h', default='127.0.0.1',
               help='Host to serve the app.')
 @click.option('--port', '-p', default=8080, help='Port to serve the app.')
-def serve_command(host, port):
+@click.option('--watch', is_flag=True, default=False,
+              help='Watch content files and apply changes immediately '
+                   '(file storage only).')
+def serve_command(host, port, watch):
     click.echo('Starting HTTP server...')
     click.echo('HTTP server started. '
                'Running on http://{}:{}/'.format(host, port))
 
     from veripress import app
+    if watch:
+        if app.config['STORAGE_TYPE'] == 'file':
+            from veripress.model.storages import FileStorage
+            with app.app_context():
+                watcher = FileStorage.create_watcher()
+            watcher.start()
+            click.echo('Watching content files with {}.'.format(
+                type(watcher).__name__))
+        else:
+            click.echo('Only file storage can be watched, '
+                       '"--watch" is ignored.')
+
     try:
         from gevent.wsgi import WSGIServer
         server = WSGIServer((host, port), app)